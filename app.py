@@ -7,32 +7,113 @@ import requests
 import csv
 import io
 import os
-from datetime import datetime
+import queue
+import atexit
+import hashlib
+import math
+import gzip
+import sys
+import functools
+import re
+import itertools
+import heapq
+import glob
+import fnmatch
+import select
+import signal
+import socket
+import struct
+import ctypes
+import ctypes.util
+import mmap
+import mimetypes
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
 from flask import Flask, render_template, jsonify, request, Response
+from jinja2 import TemplateNotFound
+
+try:
+    import numpy as np
+except ImportError:  # opsional, hanya untuk bucketing cepat
+    np = None
+try:
+    import brotli
+except ImportError:  # opsional, tanpa ini hanya gzip
+    brotli = None
 
 # ================== KONFIGURASI ==================
 BROKER = "103.217.145.168"
 PORT = 1883
 TOPIC = "data/sctkiotserver/groupsctkiotserver/123"
+# Subtopic TOPIC/<sub> -> namespace stasiun (series "<ns>:<KEY>", tabel samples_<ns>).
+# Subtopic yang tidak terdaftar masuk namespace utama, kecuali SUBTOPIC_AS_STATION=1.
+STATION_TOPICS = {}
+SUBTOPIC_AS_STATION = os.environ.get("SUBTOPIC_AS_STATION", "0") == "1"
+# Batas stasiun baru dari SUBTOPIC_AS_STATION (tiap stasiun = tabel + ring
+# sendiri); subtopic di atas batas ditolak. Tabel yang sudah ada tidak dihitung.
+STATION_MAX = int(os.environ.get("STATION_MAX", "32"))
+# Sesi persisten QoS 1: broker menyimpan pesan selama dashboard terputus dan
+# mengirim ulang setelah reconnect. Client id harus unik per instance ingest.
+MQTT_QOS = int(os.environ.get("MQTT_QOS", "1"))
+MQTT_CLIENT_ID = os.environ.get("MQTT_CLIENT_ID", "dashboard-sctk-" + socket.gethostname())
+MQTT_CLEAN_SESSION = os.environ.get("MQTT_CLEAN_SESSION", "0") == "1"
+MQTT_KEEPALIVE = 60  # detik
+MQTT_RECONNECT_MIN = 1  # detik, backoff eksponensial sampai MQTT_RECONNECT_MAX
+MQTT_RECONNECT_MAX = 120
+# Timestamp perangkat di payload (epoch detik/milidetik atau ISO 8601);
+# tanpa key ini / di luar rentang wajar dipakai waktu terima server.
+DEVICE_TS_KEYS = ("ts", "timestamp", "time", "datetime", "TS", "TIMESTAMP", "TIME", "DATETIME")
+DEVICE_TS_MAX_SKEW = 300  # detik, toleransi jam perangkat lebih cepat dari server
+# Sampel ber-ts lebih tua dari sampel terbaru stasiunnya dianggap terlambat
+# (hanya masuk history). Bila selama LATE_RESET_AFTER detik (waktu terima)
+# yang masuk hanya sampel terlambat, jam perangkat dianggap sudah dikoreksi
+# mundur: sampel berikutnya jadi sampel terbaru lagi.
+LATE_RESET_AFTER = 120
 
 WEB_APP_URL = "https://script.google.com/macros/s/AKfycbzWJVmsuj6p0-JKzksnPcdRkfH0NKa9n0iI_HP2OBaVHbxNQqYaSDGkzbdSraE0sFg-/exec"
 SEND_INTERVAL = 60  # detik
+OUTBOX_DB_PATH = "outbox.db"
+FORWARD_BATCH_MAX = 20  # sampel per putaran kirim saat outbox menumpuk (tetap satu objek per POST)
+# doPost Apps Script membalas 200 walau script-nya error; bila diisi, body
+# balasan wajib memuat penanda ini sebelum baris outbox dihapus
+FORWARD_OK_MARKER = os.environ.get("FORWARD_OK_MARKER", "")
+FORWARD_TIMEOUT = 10  # detik
+FORWARD_RETRY_BASE = 2  # detik, backoff eksponensial
+FORWARD_RETRY_MAX = 300  # detik
 
 QC_CSV_URL = "https://docs.google.com/spreadsheets/d/e/2PACX-1vSMKrU7GU9pisN4ihKgSqyC1bDuT1ia6kp-vKWrdUhvaPyX95ZqOBOFy8iBCpQieizqTBJ3R4wNmRII/pub?gid=2046456175&single=true&output=csv"
 QC_PULL_INTERVAL = 20  # detik
 
-SCHEDULE_JSON_FILE = "jadwal_2026.json"
-SCHEDULE_RELOAD_INTERVAL = 10  # detik
+SCHEDULE_DIR = os.environ.get("SCHEDULE_DIR", ".")
+SCHEDULE_JSON_GLOB = "jadwal_*.json"  # satu file per tahun, digabung
+SCHEDULE_RELOAD_INTERVAL = 10  # detik, mode polling (tanpa inotify)
+SCHEDULE_SAFETY_POLL = 300  # detik, cek mtime berkala walau pakai inotify
+SCHEDULE_DEBOUNCE = 0.5  # detik tanpa event sebelum reload
 
 RES_MAX_M = 8.0
 RES_TOTAL_M3 = 3000.0
 RES_LITER_PER_M = (RES_TOTAL_M3 * 1000.0) / RES_MAX_M  # 375000 L per 1 meter
+RES_MIN_M = 1.0  # level dianggap "habis" untuk estimasi (sama dengan ETA di dashboard)
+
+SHIFT_START_HOURS = [0, 8, 16]  # jam mulai shift (waktu lokal)
+ANALYTICS_MAX_GAP = 300  # detik; jeda lebih lama tidak diintegrasikan
+ANALYTICS_RATE_TAU = 300  # detik, konstanta waktu EMA laju isi/kuras
+ANALYTICS_RATE_DEADBAND = 0.2  # LPS, di bawah ini ETA tidak dihitung
 
 NUMERIC_KEYS = [
     "PRESSURE_DST","LVL_RES_WTP3","TOTAL_FLOW_ITK","TOTAL_FLOW_DST",
     "FLOW_WTP3","FLOW_50_WTP1","FLOW_CIJERUK","FLOW_CARENANG",
 ]
-DERIVED_KEYS = ["SELISIH_FLOW"]
+ANALYTICS_KEYS = [
+    "RES_VOLUME_M3","RES_RATE_LPS","RES_ETA_EMPTY_S","RES_ETA_FULL_S",
+    "VOL_ITK_SHIFT_M3","VOL_DST_SHIFT_M3","VOL_ITK_DAY_M3","VOL_DST_DAY_M3",
+]
+DERIVED_KEYS = ["SELISIH_FLOW"] + ANALYTICS_KEYS
+SAMPLE_KEYS = NUMERIC_KEYS + DERIVED_KEYS
+FORWARD_KEYS = NUMERIC_KEYS + ["SELISIH_FLOW"]
 
 DISPLAY_ORDER = [
     "TOTAL_FLOW_ITK","TOTAL_FLOW_DST","SELISIH_FLOW","FLOW_WTP3",
@@ -45,6 +126,14 @@ TITLE_MAP = {
     "TOTAL_FLOW_ITK": "TOTAL FLOW INTAKE",
     "TOTAL_FLOW_DST": "TOTAL FLOW DISTRIBUSI",
     "SELISIH_FLOW": "SELISIH TOTAL FLOW (INTAKE - DISTRIBUSI)",
+    "RES_VOLUME_M3": "VOLUME RESERVOIR WTP 3",
+    "RES_RATE_LPS": "LAJU ISI/KURAS RESERVOIR",
+    "RES_ETA_EMPTY_S": "ESTIMASI RESERVOIR KE LEVEL MINIMUM",
+    "RES_ETA_FULL_S": "ESTIMASI RESERVOIR PENUH",
+    "VOL_ITK_SHIFT_M3": "VOLUME INTAKE SHIFT INI",
+    "VOL_DST_SHIFT_M3": "VOLUME DISTRIBUSI SHIFT INI",
+    "VOL_ITK_DAY_M3": "VOLUME INTAKE HARI INI",
+    "VOL_DST_DAY_M3": "VOLUME DISTRIBUSI HARI INI",
     "FLOW_WTP3": "FLOW WTP 3",
     "FLOW_50_WTP1": "FLOW UPAM CIKANDE",
     "FLOW_CIJERUK": "FLOW UPAM CIJERUK",
@@ -56,6 +145,14 @@ UNIT_MAP = {
     "TOTAL_FLOW_ITK": "LPS",
     "TOTAL_FLOW_DST": "LPS",
     "SELISIH_FLOW": "LPS",
+    "RES_VOLUME_M3": "M3",
+    "RES_RATE_LPS": "LPS",
+    "RES_ETA_EMPTY_S": "DETIK",
+    "RES_ETA_FULL_S": "DETIK",
+    "VOL_ITK_SHIFT_M3": "M3",
+    "VOL_DST_SHIFT_M3": "M3",
+    "VOL_ITK_DAY_M3": "M3",
+    "VOL_DST_DAY_M3": "M3",
     "FLOW_WTP3": "LPS",
     "FLOW_50_WTP1": "LPS",
     "FLOW_CIJERUK": "LPS",
@@ -70,56 +167,1320 @@ QC_PARAMS = {
 }
 QC_ORDER = ["kekeruhan", "warna", "ph", "sisa_chlor"]
 
+# Aturan alert (lihat bagian ALERTS); ALERT_RULES_FILE = JSON list pengganti
+ALERT_RULES_FILE = os.environ.get("ALERT_RULES_FILE")
+ALERT_RULES = [
+    {"id": "pressure_low", "key": "PRESSURE_DST", "type": "threshold", "min": 0.5,
+     "hysteresis": 0.1, "debounce": 3, "severity": "critical"},
+    {"id": "pressure_drop", "key": "PRESSURE_DST", "type": "roc", "max_drop": 0.5,
+     "window": 120, "debounce": 2, "severity": "warning"},
+    {"id": "selisih_flow_anomaly", "key": "SELISIH_FLOW", "type": "zscore", "z": 4.0,
+     "alpha": 0.02, "min_samples": 100, "hysteresis": 1.0, "debounce": 3},
+    {"id": "kekeruhan_max", "key": "qc.kekeruhan", "type": "threshold", "max": 3.0, "hysteresis": 0.2},
+    {"id": "ph_range", "key": "qc.ph", "type": "threshold", "min": 6.5, "max": 8.5, "hysteresis": 0.1},
+    {"id": "sisa_chlor_range", "key": "qc.sisa_chlor", "type": "threshold", "min": 0.2, "max": 1.0,
+     "hysteresis": 0.05},
+]
+ALERT_RECENT_MAX = 50  # event terakhir di memori / segmen state
+
+# ================== METRICS ==================
+# Counter/gauge/histogram in-process, dirender format teks Prometheus di
+# /metrics. Update tanpa lock (+= di bawah GIL): hampir semua metrik hanya
+# ditulis satu thread (MQTT, writer DB, worker QC); untuk metrik HTTP yang
+# ditulis banyak thread, increment yang sesekali hilang tidak berarti untuk
+# monitoring. METRICS_ENABLED=0 mematikan hook di jalur panas (per pesan,
+# per request) dan endpoint /metrics.
+#
+# Anggaran overhead di on_message < 1%: counter tiap pesan, tapi latensi
+# hanya diukur 1 dari METRICS_SAMPLE_EVERY pesan. Waktu tunggu lock yang
+# diambil per pesan (data, sse) baru diukur dengan METRICS_LOCK_TIMING=1
+# (+~0.5 us per akuisisi); lock db/qc/schedule selalu diukur.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+METRICS_SAMPLE_EVERY = 16
+METRICS_LOCK_TIMING = os.environ.get("METRICS_LOCK_TIMING", "0") == "1"
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+metrics_registry = OrderedDict()  # nama -> metrik, urutan = urutan output
+remote_metrics = {}  # worker web: snapshot metrik scope "ingest" dari segmen state
+
+class _CounterChild:
+    __slots__ = ("v",)
+
+    def __init__(self):
+        self.v = 0
+
+    def inc(self, n=1):
+        self.v += n
+
+    def value(self):
+        return self.v
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # per bucket (tidak kumulatif), terakhir = +Inf
+        self.sum = 0.0
+
+    def observe(self, v):
+        self.counts[bisect_left(self.bounds, v)] += 1
+        self.sum += v
+
+    def value(self):
+        return [self.counts, self.sum]
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, name, help, labelnames=(), scope="ingest", fn=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # "ingest" = state proses ingest (di role web dibaca dari segmen),
+        # "web" = lokal tiap proses yang melayani HTTP
+        self.scope = scope
+        self.fn = fn  # dibaca saat scrape: fn() -> angka atau {labels: angka}
+        self.children = {}
+        if not self.labelnames and fn is None:
+            self.default = self.labels()
+        metrics_registry[name] = self
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children.setdefault(values, self._child())
+        return child
+
+    def samples(self):
+        if self.fn is not None:
+            v = self.fn()
+            return list(v.items()) if isinstance(v, dict) else [((), v)]
+        return [(k, c.value()) for k, c in list(self.children.items())]
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def _child(self):
+        return _CounterChild()
+
+    def inc(self, n=1):
+        self.default.v += n
+
+class Gauge(Counter):
+    TYPE = "gauge"
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name, help, labelnames=(), scope="ingest", fn=None, buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(buckets)
+        super().__init__(name, help, labelnames, scope, fn)
+
+    def _child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, v):
+        self.default.observe(v)
+
+timed_locks = []
+
+class TimedLock:
+    """threading.Lock yang menghitung akuisisi, kontensi dan waktu tunggu."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        # ditulis hanya sambil memegang lock ini, jadi tidak ada race
+        self.acquired = 0
+        self.contended = 0
+        self.wait = _HistogramChild(LATENCY_BUCKETS)
+        timed_locks.append(self)
+
+    def __enter__(self):
+        if not self._lock.acquire(False):
+            t0 = time.perf_counter()
+            self._lock.acquire()
+            self.contended += 1
+            self.wait.observe(time.perf_counter() - t0)
+        self.acquired += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+def metrics_lock(name, hot=False):
+    # hot = diambil per pesan MQTT; instrumentasi hanya bila diminta
+    if METRICS_ENABLED and (METRICS_LOCK_TIMING or not hot):
+        return TimedLock(name)
+    return threading.Lock()
+
+def _metric_num(v):
+    if v == float("inf"):
+        return "+Inf"
+    if isinstance(v, float) and not v.is_integer():
+        return repr(v)
+    return str(int(v)) if v == v else "NaN"
+
+def _metric_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                             for k, v in pairs)
+
+def metrics_snapshot():
+    """Nilai metrik scope "ingest" (JSON) untuk dipublish ke worker web."""
+    return {m.name: [[list(k), v] for k, v in m.samples()]
+            for m in metrics_registry.values() if m.scope == "ingest"}
+
+def metrics_text():
+    lines = []
+    for m in metrics_registry.values():
+        if DASHBOARD_ROLE == "web" and m.scope == "ingest":
+            samples = remote_metrics.get(m.name, [])
+        else:
+            samples = m.samples()
+        lines.append("# HELP %s %s" % (m.name, m.help))
+        lines.append("# TYPE %s %s" % (m.name, m.TYPE))
+        for labels, v in samples:
+            if v is None:
+                continue
+            if m.TYPE != "histogram":
+                lines.append("%s%s %s" % (m.name, _metric_labels(m.labelnames, labels), _metric_num(v)))
+                continue
+            counts, total = v
+            acc = 0
+            for le, c in zip(m.bounds + (float("inf"),), counts):
+                acc += c
+                lines.append("%s_bucket%s %d" % (m.name, _metric_labels(m.labelnames, labels, [("le", _metric_num(le))]), acc))
+            lines.append("%s_sum%s %s" % (m.name, _metric_labels(m.labelnames, labels), _metric_num(total)))
+            lines.append("%s_count%s %d" % (m.name, _metric_labels(m.labelnames, labels), acc))
+    return "\n".join(lines) + "\n"
+
+_http_metric_children = {}  # (route, method, status) -> (counter, histogram)
+
+def metrics_observe_http(route, method, status, seconds):
+    children = _http_metric_children.get((route, method, status))
+    if children is None:
+        children = _http_metric_children[(route, method, status)] = (
+            metric_http_requests.labels(route, method, str(status)), metric_http_seconds.labels(route))
+    children[0].inc()
+    children[1].observe(seconds)
+
+# nilai yang sudah ada di dict status dibaca langsung saat scrape
+ingest_seq = 0  # jumlah panggilan on_message; juga penentu sampel latensi
+Counter("dashboard_mqtt_messages_total", "Pesan MQTT yang diterima on_message", fn=lambda: ingest_seq)
+metric_mqtt_errors = Counter("dashboard_mqtt_errors_total", "Pesan MQTT yang gagal diproses")
+station_samples = {}  # ns -> sampel ter-decode (dict biasa: paling murah di jalur panas)
+Counter("dashboard_samples_total", "Sampel ter-decode per stasiun", ["station"],
+        fn=lambda: {(ns or "default",): n for ns, n in list(station_samples.items())})
+metric_ingest_seconds = Histogram("dashboard_ingest_seconds",
+                                  "Durasi on_message (sampel 1 dari METRICS_SAMPLE_EVERY pesan)")
+Gauge("dashboard_mqtt_connected", "1 bila terhubung ke broker MQTT",
+      fn=lambda: 1 if mqtt_status["connected"] else 0)
+Counter("dashboard_mqtt_connects_total", "Koneksi (ulang) ke broker yang berhasil",
+        fn=lambda: mqtt_status["connects"])
+Counter("dashboard_mqtt_disconnects_total", "Koneksi broker yang terputus",
+        fn=lambda: mqtt_status["disconnects"])
+Counter("dashboard_ingest_late_total", "Sampel lebih tua dari sampel terbaru stasiunnya",
+        fn=lambda: ingest_status["late"])
+Counter("dashboard_ingest_station_rejected_total", "Pesan dari subtopic di atas batas STATION_MAX",
+        fn=lambda: ingest_status["station_rejected"])
+Counter("dashboard_ingest_ts_rejected_total", "Timestamp perangkat di luar rentang (dipakai waktu terima)",
+        fn=lambda: ingest_status["ts_rejected"])
+Counter("dashboard_db_rows_queued_total", "Sampel masuk antrean writer",
+        fn=lambda: db_writer_status["queued"])
+Counter("dashboard_db_rows_written_total", "Sampel ter-commit ke SQLite",
+        fn=lambda: db_writer_status["written"])
+Counter("dashboard_db_rows_dropped_total", "Item dibuang karena antrean writer penuh",
+        fn=lambda: db_writer_status["dropped"])
+Counter("dashboard_db_rows_duplicate_total", "Sampel dibuang karena (ns, ts) sudah tersimpan",
+        fn=lambda: db_writer_status["duplicates"])
+Gauge("dashboard_db_queue_depth", "Item menunggu di antrean writer", fn=lambda: db_queue.qsize())
+metric_db_batch_seconds = Histogram("dashboard_db_batch_seconds", "Durasi satu batch writer (insert + commit)")
+metric_db_batch_items = Histogram("dashboard_db_batch_items", "Item per batch writer",
+                                  buckets=(1, 10, 50, 100, 250, 500, 1000, 2000, 5000, 20000))
+metric_qc_pull_seconds = Histogram("dashboard_qc_pull_seconds", "Durasi pull CSV QC (fetch + parse)")
+metric_qc_pulls = Counter("dashboard_qc_pulls_total", "Pull CSV QC per hasil", ["result"])
+metric_schedule_seconds = Histogram("dashboard_schedule_reload_seconds", "Durasi rebuild index jadwal")
+metric_schedule_errors = Counter("dashboard_schedule_errors_total", "Reload jadwal yang gagal")
+Counter("dashboard_forward_sent_total", "Payload terkirim ke Apps Script", fn=lambda: forward_status["sent"])
+Counter("dashboard_forward_failed_total", "POST Apps Script yang gagal", fn=lambda: forward_status["failed"])
+Gauge("dashboard_forward_outbox_depth", "Payload menunggu di outbox", fn=lambda: forward_status["depth"])
+metric_forward_seconds = Histogram("dashboard_forward_post_seconds", "Durasi POST ke Apps Script")
+metric_alert_events = Counter("dashboard_alert_events_total", "Event alert per state", ["state"])
+Counter("dashboard_lock_acquired_total", "Akuisisi lock", ["lock"],
+        fn=lambda: {(l.name,): l.acquired for l in timed_locks})
+Counter("dashboard_lock_contended_total", "Akuisisi lock yang harus menunggu", ["lock"],
+        fn=lambda: {(l.name,): l.contended for l in timed_locks})
+Histogram("dashboard_lock_wait_seconds", "Waktu tunggu lock saat kontensi", ["lock"],
+          fn=lambda: {(l.name,): l.wait.value() for l in timed_locks})
+metric_http_requests = Counter("dashboard_http_requests_total", "Request HTTP",
+                               ["route", "method", "code"], scope="web")
+metric_http_seconds = Histogram("dashboard_http_request_seconds", "Latensi request sampai header terkirim",
+                                ["route"], scope="web")
+Gauge("dashboard_sse_clients", "Client SSE terhubung ke proses ini", scope="web", fn=lambda: len(sse_clients))
+metric_sse_broadcasts = Counter("dashboard_sse_broadcasts_total", "Broadcast SSE", scope="web")
+Counter("dashboard_response_cache_hits_total", "Hit cache response history", scope="web",
+        fn=lambda: response_cache_stats["hits"])
+Counter("dashboard_response_cache_misses_total", "Miss cache response history", scope="web",
+        fn=lambda: response_cache_stats["misses"])
+
+# ================== PROFILER ==================
+# Sampling profiler opt-in (PROFILER_ENABLED=1): satu thread mengambil
+# sys._current_frames() tiap PROFILER_INTERVAL dan menghitung stack dalam
+# format "collapsed" (flamegraph.pl / speedscope). Dipicu lewat
+# /debug/profile?seconds=N di proses web, atau SIGUSR2 (toggle mulai/berhenti,
+# hasil ditulis ke PROFILER_DIR) untuk proses ingest.
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "0") == "1"
+PROFILER_INTERVAL = float(os.environ.get("PROFILER_INTERVAL", "0.005"))
+PROFILER_MAX_SECONDS = 120
+PROFILER_DIR = os.environ.get("PROFILER_DIR", tempfile.gettempdir())
+profiler_lock = threading.Lock()  # satu sesi profiling per proses
+_signal_sampler = None
+
+class StackSampler:
+    def __init__(self, interval=PROFILER_INTERVAL, ignore=()):
+        self.interval = interval
+        self.ignore = set(ignore)  # thread yang tidak disampel (mis. thread peminta)
+        self.counts = {}  # "thread;f1;f2;..." -> jumlah sampel
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        self.ignore.add(threading.get_ident())
+        labels = {}  # code object -> label, supaya format string sekali per fungsi
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid in self.ignore:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = "%s (%s:%d)" % (
+                            code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(tid, "thread-%d" % tid))
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "".join("%s %d\n" % kv for kv in sorted(self.counts.items(), key=lambda kv: -kv[1]))
+
+    def top(self, limit=40):
+        own, total = {}, {}
+        for key, n in self.counts.items():
+            frames = key.split(";")[1:]  # tanpa nama thread
+            if not frames:
+                continue
+            own[frames[-1]] = own.get(frames[-1], 0) + n
+            for f in set(frames):
+                total[f] = total.get(f, 0) + n
+        lines = ["samples=%d interval=%.4fs (self/total = jumlah sampel thread)" % (self.samples, self.interval),
+                 "%8s %8s  %s" % ("self", "total", "function")]
+        for f, n in sorted(own.items(), key=lambda kv: -kv[1])[:limit]:
+            lines.append("%8d %8d  %s" % (n, total[f], f))
+        return "\n".join(lines) + "\n"
+
+def profile_for(seconds, fmt="top"):
+    if not PROFILER_ENABLED:
+        raise PermissionError("profiler nonaktif (PROFILER_ENABLED=1)")
+    seconds = float(seconds)
+    if not 0 < seconds <= PROFILER_MAX_SECONDS:
+        raise ValueError("seconds harus 0..%d" % PROFILER_MAX_SECONDS)
+    if fmt not in ("top", "collapsed"):
+        raise ValueError("format harus top atau collapsed")
+    if not profiler_lock.acquire(False):
+        raise RuntimeError("profiler sedang berjalan")
+    try:
+        sampler = StackSampler(ignore=[threading.get_ident()]).start()
+        time.sleep(seconds)
+        sampler.stop()
+    finally:
+        profiler_lock.release()
+    return sampler.collapsed() if fmt == "collapsed" else sampler.top()
+
+def _profiler_dump(sampler):
+    try:
+        sampler.stop()
+    finally:
+        profiler_lock.release()
+    path = os.path.join(PROFILER_DIR, "dashboard-profile-%d-%s.txt" % (
+        os.getpid(), datetime.now().strftime("%Y%m%d-%H%M%S")))
+    with open(path, "w") as f:
+        f.write(sampler.collapsed())
+    print("[PROFILE] %d sampel -> %s" % (sampler.samples, path))
+
+def _profiler_signal(signum, frame):
+    global _signal_sampler
+    if _signal_sampler is None:
+        if not profiler_lock.acquire(False):
+            return
+        _signal_sampler = StackSampler().start()
+        print("[PROFILE] mulai, kirim SIGUSR2 lagi untuk berhenti")
+        return
+    sampler, _signal_sampler = _signal_sampler, None
+    # join thread sampler jangan di dalam handler sinyal
+    threading.Thread(target=_profiler_dump, args=(sampler,), daemon=True).start()
+
+def profiler_install_signal():
+    if not PROFILER_ENABLED or not hasattr(signal, "SIGUSR2"):
+        return
+    try:
+        signal.signal(signal.SIGUSR2, _profiler_signal)
+    except ValueError:
+        pass  # bukan main thread (mis. start_background dari executor ASGI)
+
 # ================== GLOBAL ==================
 DB_PATH = "history.db"
-db_lock = threading.Lock()
-data_lock = threading.Lock()
+DB_QUEUE_MAX = 100000
+DB_WRITE_BATCH = 2000
+DB_COMMIT_INTERVAL = 0.5  # detik, jeda minimum antar commit writer
+DB_BACKFILL_BATCH = 20000  # item per transaksi saat antrian menumpuk (burst backfill)
+DB_FLUSH_TIMEOUT = 30  # detik, tunggu writer menulis sisa antrian saat exit
+ROLLUP_TIERS = [60, 300, 3600]  # detik per bucket (1m/5m/1h)
+
+# Retensi: sampel mentah N hari, rollup lebih lama, sisanya dibuang
+RAW_RETENTION_DAYS = float(os.environ.get("RAW_RETENTION_DAYS", "30"))
+ROLLUP_RETENTION_DAYS = {
+    60: float(os.environ.get("ROLLUP_1M_RETENTION_DAYS", "90")),
+    300: float(os.environ.get("ROLLUP_5M_RETENTION_DAYS", "365")),
+    3600: float(os.environ.get("ROLLUP_1H_RETENTION_DAYS", "1825")),
+}
+ALERT_RETENTION_DAYS = float(os.environ.get("ALERT_RETENTION_DAYS", "365"))
+MAINTENANCE_INTERVAL = 3600  # detik
+WAL_CHECKPOINT_INTERVAL = 300  # detik
+MAINTENANCE_CHUNK = 5000  # baris per DELETE
+MAINTENANCE_CHUNK_PAUSE = 0.05  # detik, beri giliran ke writer/reader
+# DB lama (auto_vacuum belum INCREMENTAL) butuh VACUUM penuh sekali; bisa lama
+# untuk DB besar, jadi hanya dijalankan sebagai migrasi eksplisit
+DB_VACUUM_MIGRATE = os.environ.get("DB_VACUUM_MIGRATE", "0") == "1"
+db_lock = metrics_lock("db")
+db_queue = queue.Queue(maxsize=DB_QUEUE_MAX)
+db_writer_stop = threading.Event()
+db_writer_thread = None
+db_writer_status = {"queued": 0, "written": 0, "dropped": 0, "batches": 0, "late": 0,
+                    "duplicates": 0, "last_error": None}
+mqtt_status = {"connected": False, "connects": 0, "disconnects": 0, "session_present": None,
+               "last_connect_dt": "-", "last_error": None}
+ingest_status = {"device_ts": 0, "ts_rejected": 0, "late": 0, "batches": 0, "station_rejected": 0}
+forward_queue = queue.Queue(maxsize=10000)
+forward_status = {"depth": 0, "sent": 0, "failed": 0, "dropped": 0, "last_latency_ms": None,
+                  "last_success_dt": "-", "last_error": None}
+maintenance_status = {"last_run_dt": "-", "last_checkpoint_dt": "-", "deleted": {},
+                      "bytes_reclaimed": 0, "seconds": 0.0, "last_error": None}
+data_lock = metrics_lock("data", hot=True)
 
 DEFAULT_DATA = {k: 0.0 for k in (NUMERIC_KEYS + DERIVED_KEYS)}
+DEFAULT_DATA.update(RES_ETA_EMPTY_S=None, RES_ETA_FULL_S=None)  # None = tidak menuju batas
+# latest_data tidak pernah dimutasi: on_message membuat dict baru lalu
+# menukar referensinya, jadi pembaca cukup mengambil referensi di bawah lock.
 latest_data = DEFAULT_DATA.copy()
 latest_ts_epoch = 0
+station_latest = {}  # ns -> (ts, data) untuk stasiun selain TOPIC utama
 last_send_time = 0.0
 
-qc_lock = threading.Lock()
+RING_CAPACITY = 20000  # sampel per series yang disimpan di memori
+
+SSE_CLIENT_BACKLOG = 32  # event antre per client sebelum dianggap lambat
+SSE_MIN_INTERVAL = 0.2  # detik, jeda minimum antar broadcast (coalescing)
+SSE_KEEPALIVE = 15  # detik
+
+RESPONSE_CACHE_MAX = 512  # entri LRU response API history
+RESPONSE_CACHE_TTL = 5  # detik
+RESPONSE_COMPRESS_MIN = 1024  # byte, body lebih kecil dikirim apa adanya
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"  # URL static ber-hash
+ASSET_CHECK_INTERVAL = 10  # detik, cek mtime folder static untuk rebuild manifest
+ASSET_COMPRESS_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+INDEX_HTML_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.html")
+# generation: nilai baru dari satu counter bersama (next() atomik di bawah GIL)
+_generation_counter = itertools.count(1)
+sample_generation = {}  # ns -> generation, diganti saat sampel masuk ring dan saat ter-commit
+qc_generation = 0  # diganti tiap isi qc_rows berubah
+
+qc_lock = metrics_lock("qc")
 qc_rows = []
 qc_latest = {p: {"ts": None, "dt": "-", "value": None} for p in QC_ORDER}
 qc_last_update_dt = "-"
 qc_last_update_chlor_dt = "-"
-qc_status = {"last_success_dt": "-", "last_error": None, "row_count": 0, "headers": []}
-
-schedule_lock = threading.Lock()
-schedule_rows = []
+qc_status = {"last_success_dt": "-", "last_error": None, "row_count": 0, "headers": [],
+             "db_generation": 0}
+# Versi isi qc_rows untuk /api/qc/snapshot: hash (ts + nilai) semua baris
+# berurutan, jadi sama di proses ingest dan tiap worker web yang memuat baris
+# yang sama. Baris dikenali dari posisinya di qc_rows (bukan ts: DateTime
+# boleh kembar); qc_changes menyimpan posisi pertama yang berubah per versi.
+QC_SNAPSHOT_MAX_HOURS = 720  # jendela baris yang dikirim (rentang grafik QC terbesar)
+QC_SNAPSHOT_SPARK = 5  # titik sparkline per parameter
+QC_DELTA_LOG = 64  # versi yang masih bisa dijawab sebagai delta
+QC_DELTA_MAX_ROWS = 2000  # selisih lebih besar dianggap ganti total (client ambil full)
+qc_version = ""
+qc_changes = deque(maxlen=QC_DELTA_LOG)  # (versi lama, versi baru, posisi pertama berubah)
+_qc_tuples = []  # tuple baris qc_rows versi saat ini
+
+schedule_lock = metrics_lock("schedule")
+schedule_index = {}
 schedule_last_loaded = "-"
 schedule_last_error = None
-_schedule_mtime = None
+_schedule_mtimes = None
+
+# Mode deploy: "all" = satu proses (default), "ingest" = MQTT/QC/jadwal/DB
+# writer + publish state ke segmen shared memory, "web" = hanya melayani HTTP
+# dan membaca segmen tersebut (boleh banyak worker).
+DASHBOARD_ROLE = os.environ.get("DASHBOARD_ROLE", "all")
+STATE_SEGMENT_PATH = os.environ.get("STATE_SEGMENT_PATH", os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "dashboard_state"))
+STATE_STATUS_INTERVAL = 2  # detik, publish /api/status dari proses ingest
 
 # ================== DB ==================
-def init_db():
-    with sqlite3.connect(DB_PATH, timeout=10) as conn:
-        cur = conn.cursor()
-        cur.execute("PRAGMA journal_mode=WAL;")
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS measurements (
-                ts INTEGER NOT NULL,
+# Satu baris per sampel (kolom per key) di tabel "samples", ditulis oleh satu
+# writer thread dengan koneksi long-lived. on_message hanya enqueue.
+def _col(key):
+    return '"%s"' % key
+
+_SAMPLE_COLS = ", ".join(_col(k) for k in SAMPLE_KEYS)
+
+# Namespace stasiun: "" = TOPIC utama (tabel samples), lainnya punya tabel
+# samples_<ns> sendiri dan key series "<ns>:<KEY>" di rollup/ring buffer.
+sample_namespaces = {""}
+
+def _samples_table(ns):
+    return "samples_%s" % ns if ns else "samples"
+
+def _series_key(ns, key):
+    return "%s:%s" % (ns, key) if ns else key
+
+def _split_series(series):
+    ns, _, key = series.rpartition(":")
+    return ns, key
+
+def _sample_insert_sql(table):
+    # ts yang sudah ada tidak ditimpa: sampel pertama per detik yang disimpan,
+    # sisanya dihitung sebagai duplicates (lihat _dedupe_samples)
+    return "INSERT OR IGNORE INTO %s(ts, %s) VALUES (?, %s)" % (
+        table, _SAMPLE_COLS, ", ".join("?" for _ in SAMPLE_KEYS))
+
+def _db_connect():
+    conn = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    return conn
+
+def _table_exists(conn, name):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+    return row is not None
+
+def _ensure_samples_table(conn, ns):
+    table = _samples_table(ns)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS %s (ts INTEGER PRIMARY KEY, %s)"
+        % (table, ", ".join("%s REAL" % _col(k) for k in SAMPLE_KEYS)))
+    have = {r[1] for r in conn.execute("PRAGMA table_info(%s)" % table)}
+    for k in SAMPLE_KEYS:
+        if k not in have:
+            conn.execute("ALTER TABLE %s ADD COLUMN %s REAL" % (table, _col(k)))
+    sample_namespaces.add(ns)
+
+def _migrate_measurements(conn):
+    # migrasi sekali jalan dari format lama (ts, key, value) ke samples
+    if not _table_exists(conn, "measurements"):
+        return
+    t0 = time.time()
+    pivot = ", ".join("AVG(CASE WHEN key = '%s' THEN value END)" % k for k in SAMPLE_KEYS)
+    cur = conn.execute(
+        "INSERT OR REPLACE INTO samples(ts, %s) SELECT ts, %s FROM measurements GROUP BY ts"
+        % (_SAMPLE_COLS, pivot))
+    n = cur.rowcount
+    conn.execute("DROP INDEX IF EXISTS idx_measurements_key_ts")
+    conn.execute("DROP TABLE measurements")
+    conn.commit()
+    print(f"[DB] migrated measurements -> samples: {n} rows in {time.time() - t0:.1f}s")
+
+def _rollup_table(tier):
+    return "rollup_%d" % tier
+
+def _rollup_upsert_sql(tier):
+    return """
+        INSERT INTO {t}(key, bucket, vmin, vmax, vsum, cnt) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(key, bucket) DO UPDATE SET
+            vmin = MIN(vmin, excluded.vmin),
+            vmax = MAX(vmax, excluded.vmax),
+            vsum = vsum + excluded.vsum,
+            cnt = cnt + excluded.cnt
+    """.format(t=_rollup_table(tier))
+
+def _init_rollups(conn):
+    for tier in ROLLUP_TIERS:
+        t = _rollup_table(tier)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS {t} (
                 key TEXT NOT NULL,
-                value REAL NOT NULL
-            )
-        """)
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_measurements_key_ts ON measurements(key, ts)")
-        conn.commit()
+                bucket INTEGER NOT NULL,
+                vmin REAL NOT NULL,
+                vmax REAL NOT NULL,
+                vsum REAL NOT NULL,
+                cnt INTEGER NOT NULL,
+                PRIMARY KEY (key, bucket)
+            ) WITHOUT ROWID
+        """.format(t=t))
+        if conn.execute("SELECT 1 FROM %s LIMIT 1" % t).fetchone() is not None:
+            continue
+        # isi awal dari data mentah yang sudah ada (mis. hasil migrasi)
+        for k in SAMPLE_KEYS:
+            conn.execute("""
+                INSERT INTO {t}(key, bucket, vmin, vmax, vsum, cnt)
+                SELECT ?, (ts / {tier}) * {tier} AS b, MIN({c}), MAX({c}), SUM({c}), COUNT({c})
+                FROM samples WHERE {c} IS NOT NULL
+                GROUP BY b
+            """.format(t=t, tier=tier, c=_col(k)), (k,))
+    conn.commit()
+
+def _rollup_rows(samples):
+    # agregasi batch di Python dulu -> satu upsert per (tier, key, bucket)
+    out = {}
+    for tier in ROLLUP_TIERS:
+        acc = {}
+        for ts, data, ns in samples:
+            b = (ts // tier) * tier
+            for k in SAMPLE_KEYS:
+                v = data.get(k)
+                if v is None:
+                    continue
+                if ns:
+                    k = _series_key(ns, k)
+                a = acc.get((k, b))
+                if a is None:
+                    acc[(k, b)] = [v, v, v, 1]
+                else:
+                    if v < a[0]:
+                        a[0] = v
+                    if v > a[1]:
+                        a[1] = v
+                    a[2] += v
+                    a[3] += 1
+        out[tier] = [(k, b, a[0], a[1], a[2], a[3]) for (k, b), a in acc.items()]
+    return out
+
+def _ensure_incremental_vacuum(conn):
+    # auto_vacuum=INCREMENTAL agar halaman bekas DELETE bisa dikembalikan
+    # sedikit demi sedikit; mengaktifkannya butuh VACUUM penuh. DB baru
+    # (belum ada tabel) langsung, DB lama hanya dengan DB_VACUUM_MIGRATE=1
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    empty = conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+    if not empty and not DB_VACUUM_MIGRATE:
+        print("[DB] auto_vacuum belum INCREMENTAL (%.0f MB): halaman bebas tidak dikembalikan; "
+              "jalankan sekali dengan DB_VACUUM_MIGRATE=1 untuk migrasi (VACUUM penuh)"
+              % (_db_size_bytes() / 1e6))
+        return
+    t0 = time.time()
+    if not empty:
+        print("[DB] migrasi sekali jalan: VACUUM penuh untuk incremental auto_vacuum ...")
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    print(f"[DB] enabled incremental auto_vacuum in {time.time() - t0:.1f}s")
+
+# seq = urutan baris (yang ter-parse) di sheet, bukan ts: dua baris QC boleh
+# ber-DateTime sama, dan DateTime baris terakhir boleh diedit
+_QC_INSERT_SQL = "INSERT INTO qc_samples(seq, ts, dt, %s) VALUES (?, ?, ?, %s)" % (
+    ", ".join(QC_ORDER), ", ".join("?" for _ in QC_ORDER))
+
+def _migrate_qc_samples(conn):
+    # migrasi sekali jalan dari qc_samples ber-PRIMARY KEY ts
+    if not _table_exists(conn, "qc_samples"):
+        return
+    if "seq" in {r[1] for r in conn.execute("PRAGMA table_info(qc_samples)")}:
+        return
+    # seq sementara = ts; pull pertama selalu parse penuh dan menulis ulang tabel
+    conn.execute("ALTER TABLE qc_samples RENAME TO qc_samples_old")
+    _create_qc_table(conn)
+    cols = ", ".join(QC_ORDER)
+    conn.execute("INSERT INTO qc_samples(seq, ts, dt, %s) SELECT ts, ts, dt, %s FROM qc_samples_old"
+                 % (cols, cols))
+    conn.execute("DROP TABLE qc_samples_old")
+    conn.commit()
+    print("[DB] migrated qc_samples -> kunci urutan baris sheet")
+
+def _create_qc_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS qc_samples (
+            seq INTEGER PRIMARY KEY,
+            ts INTEGER NOT NULL,
+            dt TEXT NOT NULL,
+            %s
+        )
+    """ % ", ".join("%s REAL" % p for p in QC_ORDER))
+    conn.execute("CREATE INDEX IF NOT EXISTS qc_samples_ts ON qc_samples(ts)")
+
+def save_qc_to_db(rows, first_seq=0):
+    # rows urut sheet mulai baris ke-first_seq; baris lama dari first_seq ke
+    # bawah dihapus di transaksi yang sama (first_seq=0: cermin penuh sheet)
+    try:
+        db_queue.put_nowait(("qc", rows, first_seq))
+    except queue.Full:
+        db_writer_status["dropped"] += len(rows)
 
-def save_to_db(ts_epoch: int, data: dict):
+def init_db():
     with db_lock:
-        with sqlite3.connect(DB_PATH, timeout=10) as conn:
-            cur = conn.cursor()
-            rows = [(ts_epoch, k, float(v)) for k, v in data.items()]
-            cur.executemany("INSERT INTO measurements(ts, key, value) VALUES (?, ?, ?)", rows)
+        conn = _db_connect()
+        try:
+            _ensure_incremental_vacuum(conn)
+            _ensure_samples_table(conn, "")
+            for (name,) in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'samples\\_%' ESCAPE '\\'").fetchall():
+                _ensure_samples_table(conn, name[len("samples_"):])
+            conn.commit()
+            _migrate_measurements(conn)
+            _init_rollups(conn)
+            _migrate_qc_samples(conn)
+            _create_qc_table(conn)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS alerts (
+                    id INTEGER PRIMARY KEY,
+                    ts INTEGER NOT NULL,
+                    rule TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    value REAL,
+                    severity TEXT,
+                    type TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS alerts_ts ON alerts(ts)")
             conn.commit()
+        finally:
+            conn.close()
+
+def save_to_db(ts_epoch: int, data: dict, ns=""):
+    try:
+        db_queue.put_nowait(("sample", int(ts_epoch), data, ns))
+        db_writer_status["queued"] += 1
+    except queue.Full:
+        db_writer_status["dropped"] += 1
+
+_committed_max_ts = {}  # ns -> ts terbesar yang sudah ter-commit (cache writer)
+
+def _dedupe_samples(conn, samples, exact=False):
+    """Buang sampel yang (ns, ts)-nya sudah ada: redelivery QoS 1 atau dua
+    pesan dalam detik yang sama. Sampel pertama yang menang, jadi baris
+    tabel, ring dan rollup (sum/count) konsisten. Hanya sampel yang tidak
+    lebih baru dari ts ter-commit terakhir yang perlu dicek ke tabel
+    (exact=True: semua dicek). Hasil: (sampel baru, jumlah yang terlambat)."""
+    first = {}
+    for s in samples:
+        first.setdefault((s[2], s[0]), s)
+    out, late, n_late = [], {}, 0
+    for (ns, ts), s in first.items():
+        hi = _committed_max_ts.get(ns)
+        if hi is None:
+            hi = -1
+            if ns in sample_namespaces:
+                hi = conn.execute("SELECT MAX(ts) FROM %s" % _samples_table(ns)).fetchone()[0]
+                hi = -1 if hi is None else hi
+            _committed_max_ts[ns] = hi
+        if ts > hi and not exact:
+            out.append(s)
+        else:
+            late.setdefault(ns, []).append(s)
+    for ns, rows in late.items():
+        tss = [s[0] for s in rows]
+        have = set()
+        for i in range(0, len(tss), 500):
+            chunk = tss[i:i + 500]
+            have.update(r[0] for r in conn.execute(
+                "SELECT ts FROM %s WHERE ts IN (%s)" % (_samples_table(ns), ",".join("?" * len(chunk))),
+                chunk))
+        kept = [s for s in rows if s[0] not in have]
+        hi = _committed_max_ts[ns]
+        n_late += sum(1 for s in kept if s[0] <= hi)
+        out.extend(kept)
+    return out, n_late
+
+class _SamplesSkipped(Exception):
+    """INSERT OR IGNORE melewatkan sampel yang lolos dedupe."""
+
+def _commit_batch(conn, items, samples):
+    by_ns = {}
+    for ts, data, ns in samples:
+        by_ns.setdefault(ns, []).append((ts, *[data.get(k) for k in SAMPLE_KEYS]))
+    rollups = _rollup_rows(samples)
+    created = [ns for ns in by_ns if ns not in sample_namespaces]
+    try:
+        with conn:
+            for ns in created:
+                _ensure_samples_table(conn, ns)
+            for ns, rows in by_ns.items():
+                # rollup dihitung dari `samples`: hanya sah bila semuanya masuk
+                cur = conn.executemany(_sample_insert_sql(_samples_table(ns)), rows)
+                if cur.rowcount != len(rows):
+                    raise _SamplesSkipped(ns)
+            for tier, rows in rollups.items():
+                if rows:
+                    conn.executemany(_rollup_upsert_sql(tier), rows)
+            alerts = [it[1] for it in items if it[0] == "alert"]
+            if alerts:
+                conn.executemany(
+                    "INSERT INTO alerts(id, ts, rule, key, state, value, severity, type) "
+                    "VALUES (:id, :ts, :rule, :key, :state, :value, :severity, :type)", alerts)
+            for it in items:
+                if it[0] == "qc":
+                    _, rows, first = it
+                    conn.execute("DELETE FROM qc_samples WHERE seq >= ?", (first,))
+                    conn.executemany(_QC_INSERT_SQL, [
+                        (first + i, r["ts"], r["dt"], *[r.get(p) for p in QC_ORDER])
+                        for i, r in enumerate(rows)])
+    except Exception:
+        sample_namespaces.difference_update(created)
+        raise
+    return by_ns
+
+def _write_batch(conn, items):
+    t0 = time.perf_counter()
+    raw = [(it[1], it[2], it[3]) for it in items if it[0] == "sample"]
+    samples, n_late = _dedupe_samples(conn, raw)
+    stale = False
+    with db_lock:
+        try:
+            by_ns = _commit_batch(conn, items, samples)
+        except _SamplesSkipped:
+            # cache ts ter-commit basi (tabel ikut ditulis koneksi lain):
+            # transaksi sudah di-rollback, cek semua ts ke tabel lalu tulis ulang
+            stale = True
+            samples, n_late = _dedupe_samples(conn, raw, exact=True)
+            by_ns = _commit_batch(conn, items, samples)
+    if stale:
+        _committed_max_ts.clear()  # batch berikutnya membaca MAX(ts) lagi
+    for ns, rows in by_ns.items():
+        if ns in _committed_max_ts:
+            _committed_max_ts[ns] = max(_committed_max_ts[ns], max(r[0] for r in rows))
+    db_writer_status["late"] += n_late
+    db_writer_status["duplicates"] += len(raw) - len(samples)
+    db_writer_status["written"] += len(samples)
+    db_writer_status["batches"] += 1
+    metric_db_batch_seconds.observe(time.perf_counter() - t0)
+    metric_db_batch_items.observe(len(items))
+    if by_ns:
+        # query history jalur DB baru melihat sampel ini setelah commit
+        for ns in by_ns:
+            sample_generation[ns] = next(_generation_counter)
+        state_notify("qty")
+    if any(it[0] == "qc" for it in items):
+        # QC sudah ter-commit; worker web boleh reload qc_rows dari DB
+        qc_status["db_generation"] += 1
+        state_notify("qc")
+
+def _drain_db_queue(block=True, limit=DB_WRITE_BATCH):
+    items = []
+    try:
+        items.append(db_queue.get(block=block))
+        while len(items) < limit:
+            items.append(db_queue.get_nowait())
+    except queue.Empty:
+        pass
+    return items
+
+def db_writer_worker():
+    global db_writer_thread
+    db_writer_thread = threading.current_thread()
+    conn = _db_connect()
+    while True:
+        stopping = db_writer_stop.is_set()
+        if stopping and db_queue.empty():
+            break
+        # burst backfill (pesan tertahan di broker setelah reconnect): batch
+        # besar dalam satu transaksi, tanpa jeda sampai antrian kembali normal
+        backlog = db_queue.qsize() > DB_WRITE_BATCH
+        items = _drain_db_queue(block=True, limit=DB_BACKFILL_BATCH if backlog else DB_WRITE_BATCH)
+        items = [it for it in items if it is not None]  # None = bangunkan dari flush_db
+        t0 = time.time()
+        try:
+            if items:
+                _write_batch(conn, items)
+            db_writer_status["last_error"] = None
+        except Exception as e:
+            db_writer_status["last_error"] = str(e)
+            print("[DB] write error:", e)
+        if stopping or db_queue.qsize() > DB_WRITE_BATCH:
+            continue
+        # beri waktu antrian terisi supaya commit berikutnya lebih besar
+        db_writer_stop.wait(max(0.0, DB_COMMIT_INTERVAL - (time.time() - t0)))
+    conn.close()
+
+def flush_db():
+    # writer yang masih hidup menulis sendiri sisa antrian (satu koneksi,
+    # tidak bertabrakan dengan batch yang sedang jalan); di sini cukup minta
+    # berhenti lalu tunggu
+    writer = db_writer_thread
+    if writer is not None and writer.is_alive():
+        db_writer_stop.set()
+        try:
+            db_queue.put(None, timeout=DB_FLUSH_TIMEOUT)
+        except queue.Full:
+            pass
+        writer.join(DB_FLUSH_TIMEOUT)
+        if writer.is_alive():
+            print("[DB] flush timeout, %d item belum tertulis" % db_queue.qsize())
+        return
+    if db_queue.empty():
+        return
+    if not os.path.exists(DB_PATH):
+        print("[DB] flush dilewati: %s belum ada, %d item dibuang" % (DB_PATH, db_queue.qsize()))
+        return
+    conn = _db_connect()
+    try:
+        if not _table_exists(conn, _samples_table("")):
+            # init_db belum pernah jalan (mis. skrip/benchmark): jangan raise di atexit
+            print("[DB] flush dilewati: skema belum dibuat, %d item dibuang" % db_queue.qsize())
+            return
+        while True:
+            items = [it for it in _drain_db_queue(block=False) if it is not None]
+            if not items:
+                break
+            _write_batch(conn, items)
+    finally:
+        conn.close()
+
+atexit.register(flush_db)
+
+# ================== MAINTENANCE ==================
+def _db_size_bytes():
+    total = 0
+    for suffix in ("", "-wal"):
+        try:
+            total += os.path.getsize(DB_PATH + suffix)
+        except OSError:
+            pass
+    return total
+
+def _delete_chunked(conn, sql, params):
+    # DELETE kecil-kecil; lock dilepas di antara chunk supaya writer dan
+    # reader tetap jalan
+    deleted = 0
+    while True:
+        with db_lock:
+            with conn:
+                n = conn.execute(sql, params + (MAINTENANCE_CHUNK,)).rowcount
+        deleted += n
+        if n < MAINTENANCE_CHUNK:
+            return deleted
+        time.sleep(MAINTENANCE_CHUNK_PAUSE)
+
+def _apply_retention(conn, now):
+    deleted = {}
+    cutoff = int(now - RAW_RETENTION_DAYS * 86400)
+    for ns in sorted(sample_namespaces):
+        t = _samples_table(ns)
+        deleted[t] = _delete_chunked(
+            conn, "DELETE FROM {t} WHERE ts IN (SELECT ts FROM {t} WHERE ts < ? ORDER BY ts LIMIT ?)".format(t=t),
+            (cutoff,))
+    for tier in ROLLUP_TIERS:
+        t = _rollup_table(tier)
+        cutoff = int(now - ROLLUP_RETENTION_DAYS[tier] * 86400)
+        keys = [r[0] for r in conn.execute("SELECT DISTINCT key FROM %s" % t)]
+        n = 0
+        for k in keys:
+            n += _delete_chunked(conn, """
+                DELETE FROM {t} WHERE key = ? AND bucket IN (
+                    SELECT bucket FROM {t} WHERE key = ? AND bucket < ? ORDER BY bucket LIMIT ?)
+            """.format(t=t), (k, k, cutoff))
+        deleted[t] = n
+    deleted["alerts"] = _delete_chunked(
+        conn, "DELETE FROM alerts WHERE id IN (SELECT id FROM alerts WHERE ts < ? ORDER BY ts LIMIT ?)",
+        (int(now - ALERT_RETENTION_DAYS * 86400),))
+    return deleted
+
+def _reclaim_free_pages(conn):
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return  # tanpa INCREMENTAL pragma di bawah no-op (lihat _ensure_incremental_vacuum)
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free > 0:
+        with db_lock:
+            # executescript menjalankan pragma sampai selesai (execute hanya satu step)
+            conn.executescript("PRAGMA incremental_vacuum(%d);" % MAINTENANCE_CHUNK)
+        time.sleep(MAINTENANCE_CHUNK_PAUSE)
+        left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if left >= free:
+            print("[MAINT] incremental_vacuum berhenti di %d halaman bebas" % left)
+            break
+        free = left
+
+def _checkpoint_wal(conn):
+    with db_lock:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    maintenance_status["last_checkpoint_dt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def run_maintenance_once(conn):
+    t0 = time.time()
+    size_before = _db_size_bytes()
+    try:
+        deleted = _apply_retention(conn, t0)
+        _reclaim_free_pages(conn)
+        _checkpoint_wal(conn)
+        maintenance_status["deleted"] = deleted
+        maintenance_status["bytes_reclaimed"] = max(0, size_before - _db_size_bytes())
+        maintenance_status["last_error"] = None
+    except Exception as e:
+        maintenance_status["last_error"] = str(e)
+        print("[MAINT] error:", e)
+    maintenance_status["seconds"] = round(time.time() - t0, 3)
+    maintenance_status["last_run_dt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print("[MAINT] deleted=%s reclaimed=%d bytes in %.2fs" % (
+        maintenance_status["deleted"], maintenance_status["bytes_reclaimed"], maintenance_status["seconds"]))
+
+def maintenance_worker():
+    conn = _db_connect()
+    last_run = 0.0
+    while True:
+        if time.time() - last_run >= MAINTENANCE_INTERVAL:
+            last_run = time.time()
+            run_maintenance_once(conn)
+        else:
+            try:
+                _checkpoint_wal(conn)
+            except Exception as e:
+                print("[MAINT] checkpoint error:", e)
+        time.sleep(WAL_CHECKPOINT_INTERVAL)
+
+# ================== RING BUFFER ==================
+# History terbaru per series di memori (array fixed-size), supaya request
+# /api/history untuk beberapa jam terakhir tidak perlu menyentuh SQLite.
+class SeriesRing:
+    def __init__(self, capacity):
+        self.cap = capacity
+        self.ts = array("q", [0]) * capacity
+        self.val = array("d", [0.0]) * capacity
+        self.n = 0
+        self.head = 0
+        self.floor = None  # ts minimum yang dijamin lengkap (None = belum diisi)
+        self.lock = threading.Lock()
+
+    def append(self, ts, v):
+        with self.lock:
+            if self.n and ts <= self.ts[self.head - 1]:
+                if ts != self.ts[self.head - 1]:
+                    self._merge(((ts, v),))
+                return
+            self.ts[self.head] = ts
+            self.val[self.head] = v
+            self.head = (self.head + 1) % self.cap
+            if self.n < self.cap:
+                self.n += 1
+
+    def insert_many(self, items):
+        """Sisipkan sampel terlambat [(ts, v)] (urut ts) sekaligus."""
+        with self.lock:
+            self._merge(items)
+
+    def _merge(self, items):
+        # sampel terlambat: ring disalin dan digabung urut sekali per panggilan
+        # (potongan array = memmove). ts yang sudah ada tidak ditimpa (sama
+        # dengan writer DB); lebih tua dari isi ring penuh dibuang karena di
+        # luar covered_from.
+        if self.n < self.cap:
+            ts_l, val_l = self.ts[:self.n], self.val[:self.n]
+        else:
+            ts_l = self.ts[self.head:] + self.ts[:self.head]
+            val_l = self.val[self.head:] + self.val[:self.head]
+        full = self.n == self.cap
+        out_t, out_v = array("q"), array("d")
+        j = 0
+        for ts, v in items:
+            i = bisect_left(ts_l, ts, j)
+            if (i < len(ts_l) and ts_l[i] == ts) or (full and i == 0) \
+                    or (out_t and out_t[-1] == ts):
+                continue
+            out_t += ts_l[j:i]
+            out_v += val_l[j:i]
+            out_t.append(ts)
+            out_v.append(v)
+            j = i
+        if not out_t:
+            return
+        out_t += ts_l[j:]
+        out_v += val_l[j:]
+        if len(out_t) > self.cap:
+            del out_t[:len(out_t) - self.cap]
+            del out_v[:len(out_v) - self.cap]
+        self.n = len(out_t)
+        self.ts[:self.n] = out_t
+        self.val[:self.n] = out_v
+        self.head = self.n % self.cap
+
+    def covered_from(self):
+        with self.lock:
+            if self.floor is None:
+                return None
+            if self.n == self.cap:
+                return max(self.floor, self.ts[self.head])
+            return self.floor
+
+    def window(self, start):
+        with self.lock:
+            if self.n < self.cap:
+                ts = self.ts[:self.n]
+                val = self.val[:self.n]
+            else:
+                ts = self.ts[self.head:] + self.ts[:self.head]
+                val = self.val[self.head:] + self.val[:self.head]
+        i = bisect_left(ts, start)
+        return ts[i:], val[i:]
+
+series_rings = {k: SeriesRing(RING_CAPACITY) for k in SAMPLE_KEYS}
+
+def _station_rings(ns):
+    # ring stasiun baru dibuat saat pesan pertamanya masuk, jadi seluruh
+    # history stasiun itu ada di ring (floor = 0)
+    rings = {}
+    for k in SAMPLE_KEYS:
+        sk = _series_key(ns, k)
+        ring = series_rings.get(sk)
+        if ring is None:
+            ring = series_rings.setdefault(sk, SeriesRing(RING_CAPACITY))
+            ring.floor = 0
+        rings[k] = ring
+    return rings
+
+_rings_by_ns = {"": {k: series_rings[k] for k in SAMPLE_KEYS}}
+
+def _rings_for(ns):
+    rings = _rings_by_ns.get(ns)
+    if rings is None:
+        rings = _rings_by_ns.setdefault(ns, _station_rings(ns))
+    return rings
+
+def _ring_append(ts_epoch, data, ns=""):
+    rings = _rings_for(ns)
+    for k, v in data.items():
+        ring = rings.get(k)
+        if ring is not None and v is not None:
+            ring.append(ts_epoch, v)
+
+def _ring_insert_late(samples, ns=""):
+    # samples = [(ts, data)] terlambat dari satu batch pesan, urut ts:
+    # tiap ring digabung sekali, bukan disalin ulang per sampel
+    for k, ring in _rings_for(ns).items():
+        items = [(ts, d[k]) for ts, d in samples if d.get(k) is not None]
+        if items:
+            ring.insert_many(items)
+
+def prefill_rings():
+    now = int(time.time())
+    try:
+        with sqlite3.connect(DB_PATH, timeout=10) as conn:
+            for ns in sorted(sample_namespaces):
+                for k, ring in _rings_for(ns).items():
+                    rows = conn.execute(
+                        "SELECT ts, {c} FROM {t} WHERE {c} IS NOT NULL ORDER BY ts DESC LIMIT ?"
+                        .format(c=_col(k), t=_samples_table(ns)), (ring.cap,)).fetchall()
+                    for ts, v in reversed(rows):
+                        ring.append(ts, v)
+                    # kurang dari kapasitas -> seluruh history ada di ring
+                    ring.floor = 0
+    except Exception as e:
+        print("[RING] prefill error:", e)
+        for ring in series_rings.values():
+            ring.floor = now
+
+def _bucket_agg(ts, vals, interval, agg="avg"):
+    # ts harus terurut naik (ring buffer / qc_rows)
+    if not len(ts):
+        return []
+    if np is not None:
+        t = np.asarray(ts, dtype=np.int64)
+        v = np.asarray(vals, dtype=np.float64)
+        b = (t // interval) * interval
+        idx = np.concatenate(([0], np.flatnonzero(np.diff(b)) + 1))
+        counts = np.diff(np.append(idx, len(b)))
+        if agg == "min":
+            res = np.minimum.reduceat(v, idx)
+        elif agg == "max":
+            res = np.maximum.reduceat(v, idx)
+        elif agg == "last":
+            res = v[idx + counts - 1]
+        elif agg == "count":
+            res = counts.astype(np.float64)
+        else:
+            res = np.add.reduceat(v, idx) / counts
+        return list(zip(b[idx].tolist(), res.tolist()))
+    out = []
+    cur_b = None
+    acc = lo = hi = last = 0.0
+    cnt = 0
+
+    def emit():
+        out.append((cur_b, {"avg": acc / cnt, "min": lo, "max": hi, "last": last,
+                            "count": float(cnt)}[agg]))
+
+    for t, v in zip(ts, vals):
+        b = (t // interval) * interval
+        if b != cur_b:
+            if cnt:
+                emit()
+            cur_b, acc, lo, hi, cnt = b, 0.0, v, v, 0
+        acc += v
+        lo = v if v < lo else lo
+        hi = v if v > hi else hi
+        last = v
+        cnt += 1
+    if cnt:
+        emit()
+    return out
+
+def _ring_history(key, start, interval, agg="avg"):
+    ring = series_rings.get(key)
+    if ring is None:
+        return None
+    covered = ring.covered_from()
+    if covered is None or start < covered:
+        return None
+    ts, vals = ring.window(start)
+    return _bucket_agg(ts, vals, interval, agg)
+
+# ================== QUERY ENGINE ==================
+# Pasca-proses bucket history (samples maupun qc_rows): agregasi per bucket,
+# pengisian gap eksplisit, dan downsampling LTTB ke jumlah titik tertentu.
+QUERY_AGGS = ("avg", "min", "max", "last", "count")
+QUERY_FILLS = ("none", "null", "previous", "linear")
+QUERY_MAX_BUCKETS = 200000  # batas grid saat fill != none
+
+def query_options(args):
+    agg = args.get("agg") or "avg"
+    fill = args.get("fill") or "none"
+    if agg not in QUERY_AGGS:
+        raise ValueError("agg harus salah satu dari %s" % ", ".join(QUERY_AGGS))
+    if fill not in QUERY_FILLS:
+        raise ValueError("fill harus salah satu dari %s" % ", ".join(QUERY_FILLS))
+    max_points = args.get("max_points")
+    if max_points not in (None, ""):
+        max_points = int(max_points)
+        if max_points < 3:
+            raise ValueError("max_points minimal 3")
+    else:
+        max_points = None
+    return {"agg": agg, "fill": fill, "max_points": max_points}
+
+def _fill_gaps(ts, vals, start, end, interval, fill):
+    first = (start // interval) * interval
+    last = (end // interval) * interval
+    if (last - first) // interval + 1 > QUERY_MAX_BUCKETS:
+        raise ValueError("rentang terlalu panjang untuk fill; perbesar interval")
+    known = dict(zip(ts, vals))
+    grid = list(range(first, last + 1, interval))
+    out = [known.get(b) for b in grid]
+
+    if fill == "previous":
+        prev = None
+        for i, v in enumerate(out):
+            if v is None:
+                out[i] = prev
+            else:
+                prev = v
+    elif fill == "linear":
+        # hanya gap yang diapit dua nilai; ujung tetap null
+        left = None
+        for i, v in enumerate(out):
+            if v is None:
+                continue
+            if left is not None and i - left > 1:
+                v0 = out[left]
+                step = (v - v0) / (i - left)
+                for j in range(left + 1, i):
+                    out[j] = v0 + step * (j - left)
+            left = i
+    return grid, out
+
+def _lttb_indices(xs, ys, n):
+    size = len(xs)
+    every = (size - 2) / (n - 2)
+    a = 0
+    out = [0]
+    for i in range(n - 2):
+        s = int((i + 1) * every) + 1
+        e = min(int((i + 2) * every) + 1, size)
+        avg_x = sum(xs[s:e]) / (e - s)
+        avg_y = sum(ys[s:e]) / (e - s)
+
+        ax, ay = xs[a], ys[a]
+        best, best_j = -1.0, None
+        for j in range(int(i * every) + 1, s):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best:
+                best, best_j = area, j
+        out.append(best_j)
+        a = best_j
+    out.append(size - 1)
+    return out
+
+def _lttb(ts, vals, n):
+    pts = [i for i, v in enumerate(vals) if v is not None]
+    if len(pts) > n:
+        xs = [ts[i] for i in pts]
+        ys = [vals[i] for i in pts]
+        pts = [pts[j] for j in _lttb_indices(xs, ys, n)]
+    if len(pts) == len(vals):
+        return [ts[i] for i in pts], [vals[i] for i in pts]
+
+    # gap (null) di antara titik terpilih dipertahankan sebagai satu penanda
+    # null supaya chart tetap memutus garis
+    next_null = [None] * (len(vals) + 1)
+    for i in range(len(vals) - 1, -1, -1):
+        next_null[i] = i if vals[i] is None else next_null[i + 1]
+    out_t, out_v = [], []
+    prev = -1
+    for i in pts + [len(vals)]:
+        g = next_null[prev + 1]
+        if g is not None and g < i:
+            out_t.append(ts[g])
+            out_v.append(None)
+        if i < len(vals):
+            out_t.append(ts[i])
+            out_v.append(vals[i])
+        prev = i
+    return out_t, out_v
+
+def shape_series(ts, vals, start, end, interval, opts, limit=None):
+    """Bucket (ts[], value[]) -> gap fill -> limit N terakhir -> LTTB."""
+    if opts["fill"] != "none":
+        ts, vals = _fill_gaps(ts, vals, start, end, interval, opts["fill"])
+    if limit:
+        ts, vals = ts[-limit:], vals[-limit:]
+    if opts["max_points"]:
+        ts, vals = _lttb(ts, vals, opts["max_points"])
+    return ts, vals
 
 # ================== QC helpers ==================
+# Parser cepat untuk sel sheet QC: float dengan memo (nilai QC banyak yang
+# berulang) dan datetime via regex + cache epoch per jam, dengan urutan
+# format yang dikunci per kolom dari sampel awal.
+QC_FLOAT_CACHE = 8192
+QC_DT_SAMPLE = 50
+
+@functools.lru_cache(maxsize=QC_FLOAT_CACHE)
 def _to_float(v):
     if v is None:
         return None
+    try:
+        f = float(v)
+        if f == f:  # NaN lewat jalur lama
+            return f
+    except (TypeError, ValueError):
+        pass
     s = str(v).strip()
     if s == "" or s.lower() in ("nan", "none"):
         return None
@@ -129,16 +1490,71 @@ def _to_float(v):
     except:
         return None
 
-def _parse_dt(s):
+# sama dengan format strptime lama: "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"
+_DT_PATTERNS = [
+    re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2}) (\d{1,2}):(\d{1,2})$"),
+    re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2}) (\d{1,2}):(\d{1,2}):(\d{1,2})$"),
+    re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})$"),
+]
+_DT_DEFAULT_ORDER = (0, 1, 2)
+_day_epoch_cache = {}
+
+def _local_epoch(y, mo, d, h, mi, sec):
+    # epoch tengah malam per tanggal di-cache; hari dengan pergantian DST
+    # (panjang != 86400 detik) dihitung penuh lewat datetime
+    key = (y, mo, d)
+    day = _day_epoch_cache.get(key)
+    if day is None:
+        if len(_day_epoch_cache) > 100000:
+            _day_epoch_cache.clear()
+        try:
+            start = datetime(y, mo, d)
+            midnight = int(start.timestamp())
+            day = midnight if int((start + timedelta(days=1)).timestamp()) - midnight == 86400 else -2
+        except (ValueError, OverflowError):
+            day = -1
+        _day_epoch_cache[key] = day
+    if day >= 0:
+        return day + h * 3600 + mi * 60 + sec
+    if day == -2:
+        return int(datetime(y, mo, d, h, mi, sec).timestamp())
+    return None
+
+def _detect_dt_order(values):
+    # format yang paling banyak cocok di sampel dicoba duluan
+    hits = [0] * len(_DT_PATTERNS)
+    for v in values:
+        s = str(v or "").strip().replace('"', "")
+        for i, pat in enumerate(_DT_PATTERNS):
+            if pat.match(s):
+                hits[i] += 1
+                break
+    return tuple(sorted(range(len(_DT_PATTERNS)), key=lambda i: -hits[i]))
+
+def _parse_dt(s, order=_DT_DEFAULT_ORDER):
+    # hasil: (epoch lokal, "YYYY-mm-dd HH:MM") atau None
     if not s:
         return None
-    s = str(s).strip().replace('"', "")
-    fmts = ["%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"]
-    for f in fmts:
-        try:
-            return datetime.strptime(s, f)
-        except:
-            pass
+    s = s.strip().replace('"', "")
+    for i in order:
+        m = _DT_PATTERNS[i].match(s)
+        if m is None:
+            continue
+        g = m.groups()
+        y, mo, d = int(g[0]), int(g[1]), int(g[2])
+        h = mi = sec = 0
+        if len(g) > 3:
+            h, mi = int(g[3]), int(g[4])
+            if len(g) > 5:
+                sec = int(g[5])
+        if h > 23 or mi > 59 or sec > 59:
+            continue
+        ep = _local_epoch(y, mo, d, h, mi, sec)
+        if ep is None:
+            continue
+        if i == 0 and len(s) == 16:
+            return ep, s  # sudah "YYYY-mm-dd HH:MM"
+        return ep, "%04d-%02d-%02d %02d:%02d" % (y, mo, d, h, mi)
     return None
 
 def _norm_header(s: str) -> str:
@@ -161,113 +1577,284 @@ def _find_col(fieldnames, candidates):
                 return orig
     return None
 
-def pull_qc_csv_once():
-    global qc_rows, qc_latest, qc_last_update_dt, qc_last_update_chlor_dt, qc_status
-    try:
-        sep = "&" if "?" in QC_CSV_URL else "?"
-        url = QC_CSV_URL + f"{sep}_={int(time.time())}"
+qc_session = requests.Session()
+qc_session.headers.update({"User-Agent": "Mozilla/5.0 (QC-Dashboard)"})
 
-        r = requests.get(url, timeout=25, allow_redirects=True,
-                         headers={"User-Agent": "Mozilla/5.0 (QC-Dashboard)"})
-        r.raise_for_status()
+QC_COLUMNS = {
+    "dt": ["DateTime", "Datetime", "DATE TIME", "Date Time"],
+    "kekeruhan": ["Kekeruhan"],
+    "warna": ["Warna"],
+    "ph": ["pH", "PH"],
+    "sisa_chlor": ["Sisa Chlor", "SisaChlor"],
+}
 
-        f = io.StringIO(r.text)
-        reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames or []
-        qc_status["headers"] = fieldnames
-
-        dt_col = _find_col(fieldnames, ["DateTime", "Datetime", "DATE TIME", "Date Time"])
-        kek_col = _find_col(fieldnames, ["Kekeruhan"])
-        war_col = _find_col(fieldnames, ["Warna"])
-        ph_col  = _find_col(fieldnames, ["pH", "PH"])
-        chl_col = _find_col(fieldnames, ["Sisa Chlor", "SisaChlor"])
-
-        rows = []
-        for row in reader:
-            dt_obj = _parse_dt(row.get(dt_col) if dt_col else None)
-            if not dt_obj:
-                continue
-            ts = int(dt_obj.timestamp())
-            rows.append({
-                "ts": ts,
-                "dt": dt_obj.strftime("%Y-%m-%d %H:%M"),
-                "kekeruhan": _to_float(row.get(kek_col)) if kek_col else None,
-                "warna": _to_float(row.get(war_col)) if war_col else None,
-                "ph": _to_float(row.get(ph_col)) if ph_col else None,
-                "sisa_chlor": _to_float(row.get(chl_col)) if chl_col else None,
-            })
-
-        rows.sort(key=lambda x: x["ts"])
-
-        latest_map = {p: {"ts": None, "dt": "-", "value": None} for p in QC_ORDER}
-
-        for p in ["kekeruhan", "warna", "ph"]:
-            for rr in reversed(rows):
-                if rr.get(p) is not None:
-                    latest_map[p] = {"ts": rr["ts"], "dt": rr["dt"], "value": rr[p]}
-                    break
+# state pull terakhir: validator HTTP, hash body, dan posisi record terakhir
+# (record terakhir selalu di-parse ulang karena bisa masih diisi); isi CSV
+# sebelum record terakhir cukup disimpan sebagai hash untuk cek prefix.
+# tail_seq = seq (urutan baris di qc_samples) baris pertama record terakhir
+_qc_cache = {"etag": None, "last_modified": None, "digest": None, "prefix_digest": None,
+             "cols": None, "tail_offset": None, "tail_rows": [], "tail_seq": 0}
+
+def _qc_columns(fieldnames):
+    cols = {}
+    for name, candidates in QC_COLUMNS.items():
+        col = _find_col(fieldnames, candidates)
+        cols[name] = fieldnames.index(col) if col is not None else None
+    return cols
+
+def _qc_parse_records(records, cols):
+    dt_i = cols.get("dt")
+    out = []
+    if dt_i is None:
+        return out
+    if "dt_order" not in cols:
+        records = iter(records)
+        head = list(itertools.islice(records, QC_DT_SAMPLE))
+        cols["dt_order"] = _detect_dt_order(r[dt_i] for r in head if dt_i < len(r))
+        records = itertools.chain(head, records)
+    order = cols["dt_order"]
+    val_cols = [(p, cols.get(p)) for p in QC_ORDER]
+    for rec in records:
+        if dt_i >= len(rec):
+            continue
+        parsed = _parse_dt(rec[dt_i], order)
+        if not parsed:
+            continue
+        row = {"ts": parsed[0], "dt": parsed[1]}
+        for p, i in val_cols:
+            row[p] = _to_float(rec[i]) if i is not None and i < len(rec) else None
+        out.append(row)
+    return out
 
-        last_chlor_dt = "-"
+def _last_record_offset(text):
+    end = len(text.rstrip("\r\n"))
+    off = text.rfind("\n", 0, end) + 1
+    if off == 0 or text.count('"', 0, off) % 2:
+        return None  # cuma header, atau ada sel multiline yang terpotong
+    return off
+
+def _qc_latest_from(rows):
+    latest_map = {p: {"ts": None, "dt": "-", "value": None} for p in QC_ORDER}
+
+    for p in ["kekeruhan", "warna", "ph"]:
         for rr in reversed(rows):
-            if rr.get("sisa_chlor") is not None:
-                latest_map["sisa_chlor"] = {"ts": rr["ts"], "dt": rr["dt"], "value": rr["sisa_chlor"]}
-                last_chlor_dt = rr["dt"]
+            if rr.get(p) is not None:
+                latest_map[p] = {"ts": rr["ts"], "dt": rr["dt"], "value": rr[p]}
                 break
 
-        cand = [latest_map["kekeruhan"]["ts"], latest_map["warna"]["ts"], latest_map["ph"]["ts"]]
-        cand = [x for x in cand if x is not None]
-        last_qc_dt = "-"
-        if cand:
-            last_qc_ts = max(cand)
-            for rr in reversed(rows):
-                if rr["ts"] == last_qc_ts:
-                    last_qc_dt = rr["dt"]
-                    break
+    last_chlor_dt = "-"
+    for rr in reversed(rows):
+        if rr.get("sisa_chlor") is not None:
+            latest_map["sisa_chlor"] = {"ts": rr["ts"], "dt": rr["dt"], "value": rr["sisa_chlor"]}
+            last_chlor_dt = rr["dt"]
+            break
+
+    cand = [latest_map["kekeruhan"]["ts"], latest_map["warna"]["ts"], latest_map["ph"]["ts"]]
+    cand = [x for x in cand if x is not None]
+    last_qc_dt = "-"
+    if cand:
+        last_qc_ts = max(cand)
+        for rr in reversed(rows):
+            if rr["ts"] == last_qc_ts:
+                last_qc_dt = rr["dt"]
+                break
+
+    return latest_map, last_qc_dt, last_chlor_dt
+
+def _qc_row_tuple(r):
+    return (r["ts"], *[r.get(p) for p in QC_ORDER])
+
+def _qc_track_changes():
+    """Hitung versi baru qc_rows dan catat selisihnya; dipanggil di bawah qc_lock
+    setiap kali qc_rows diganti/digabung."""
+    global qc_version, _qc_tuples
+    rows = [_qc_row_tuple(r) for r in qc_rows]
+    old = _qc_tuples
+    n, m = 0, min(len(old), len(rows))
+    while n < m and old[n] == rows[n]:
+        n += 1
+    if n == len(old) == len(rows) and qc_version:
+        return
+    version = hashlib.sha1(json.dumps(rows).encode()).hexdigest()[:16]
+    if qc_version and len(rows) - n <= QC_DELTA_MAX_ROWS:
+        qc_changes.append((qc_version, version, n))
+    else:
+        qc_changes.clear()
+    qc_version, _qc_tuples = version, rows
+
+def _qc_delta_since(since):
+    """Posisi pertama di qc_rows yang berubah sejak versi `since` (baris dari
+    situ ke bawah dikirim ulang), None bila versi itu sudah tidak ada di log
+    atau selisihnya terlalu besar (client harus ambil full)."""
+    if since == qc_version:
+        return len(qc_rows)
+    chain = list(qc_changes)
+    for i, (old, _, _) in enumerate(chain):
+        if old == since:
+            break
+    else:
+        return None
+    n = min(c[2] for c in chain[i:])
+    if len(qc_rows) - n > QC_DELTA_MAX_ROWS:
+        return None
+    return n
+
+def _qc_merge(rows, drop, new):
+    # rows sudah terurut; buang baris record-terakhir lama lalu sisipkan yang baru
+    for old in drop:
+        for i in range(len(rows) - 1, -1, -1):
+            if rows[i] is old:
+                del rows[i]
+                break
+    for r in new:
+        if not rows or r["ts"] >= rows[-1]["ts"]:
+            rows.append(r)
+        else:
+            rows.insert(bisect_right(rows, r["ts"], key=lambda x: x["ts"]), r)
+
+def _qc_mark_success(row_count):
+    qc_status["last_success_dt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    qc_status["last_error"] = None
+    qc_status["row_count"] = row_count
+
+def pull_qc_csv_once():
+    global qc_last_update_dt, qc_last_update_chlor_dt, qc_generation
+    try:
+        # URL tetap (tanpa cache-buster) supaya validator bisa cocok;
+        # no-cache meminta cache perantara merevalidasi ke origin
+        headers = {"Cache-Control": "no-cache"}
+        if _qc_cache["etag"]:
+            headers["If-None-Match"] = _qc_cache["etag"]
+        if _qc_cache["last_modified"]:
+            headers["If-Modified-Since"] = _qc_cache["last_modified"]
+
+        r = qc_session.get(QC_CSV_URL, timeout=25, allow_redirects=True, headers=headers)
+        if r.status_code == 304:
+            _qc_mark_success(len(qc_rows))
+            return
+        r.raise_for_status()
+        _qc_cache["etag"] = r.headers.get("ETag")
+        _qc_cache["last_modified"] = r.headers.get("Last-Modified")
+
+        digest = hashlib.sha1(r.content).digest()
+        if digest == _qc_cache["digest"]:
+            _qc_mark_success(len(qc_rows))
+            return
+
+        text = r.text
+        off = _qc_cache["tail_offset"]
+        new_off = _last_record_offset(text)
+        incremental = (off is not None and new_off is not None and new_off >= off
+                       and hashlib.sha1(text[:off].encode()).digest() == _qc_cache["prefix_digest"])
+
+        if incremental:
+            # hanya record setelah record-terakhir lama yang di-parse
+            cols = _qc_cache["cols"]
+            drop = _qc_cache["tail_rows"]
+            first_seq = _qc_cache["tail_seq"]
+            reader = csv.reader(io.StringIO(text[off:new_off]))
+        else:
+            drop = None
+            first_seq = 0
+            reader = csv.reader(io.StringIO(text if new_off is None else text[:new_off]))
+            fieldnames = next(reader, None) or []
+            qc_status["headers"] = fieldnames
+            cols = _qc_columns(fieldnames)
+
+        # new_rows tetap urut sheet (untuk seq); qc_rows diurutkan per ts
+        new_rows = _qc_parse_records(reader, cols)
+        tail_seq = first_seq + len(new_rows)
+        tail_rows = []
+        if new_off is not None:
+            tail_rows = _qc_parse_records(csv.reader(io.StringIO(text[new_off:])), cols)
+            new_rows += tail_rows
 
         with qc_lock:
-            qc_rows[:] = rows
+            if drop is None:
+                qc_rows[:] = sorted(new_rows, key=lambda x: x["ts"])
+            else:
+                _qc_merge(qc_rows, drop, new_rows)
+            latest_map, last_qc_dt, last_chlor_dt = _qc_latest_from(qc_rows)
+            changed = (latest_map != qc_latest or last_qc_dt != qc_last_update_dt
+                       or last_chlor_dt != qc_last_update_chlor_dt)
             qc_latest.clear()
             qc_latest.update(latest_map)
             qc_last_update_dt = last_qc_dt
             qc_last_update_chlor_dt = last_chlor_dt
+            row_count = len(qc_rows)
+            version = qc_version
+            _qc_track_changes()
+            changed = changed or qc_version != version
+
+        if new_rows or drop:
+            save_qc_to_db(new_rows, first_seq)
+
+        prefix_digest = None if new_off is None else hashlib.sha1(text[:new_off].encode()).digest()
+        _qc_cache.update({"digest": digest, "prefix_digest": prefix_digest, "cols": cols,
+                          "tail_offset": new_off, "tail_rows": tail_rows, "tail_seq": tail_seq})
+        _qc_mark_success(row_count)
 
-        qc_status["last_success_dt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        qc_status["last_error"] = None
-        qc_status["row_count"] = len(rows)
+        if changed:
+            qc_generation = next(_generation_counter)
+            sse_notify("qc")
+            alerts_check_qc()
+            state_notify("qc")
 
     except Exception as e:
         qc_status["last_error"] = str(e)
         print("[QC] pull error:", e)
 
-def qc_worker():
+def _timed_qc_pull():
+    t0 = time.perf_counter()
     pull_qc_csv_once()
+    metric_qc_pull_seconds.observe(time.perf_counter() - t0)
+    metric_qc_pulls.labels("error" if qc_status["last_error"] else "ok").inc()
+
+def qc_worker():
+    _timed_qc_pull()
     while True:
         time.sleep(QC_PULL_INTERVAL)
-        pull_qc_csv_once()
+        _timed_qc_pull()
 
-def qc_history(param: str, hours: float, interval: int):
+def load_qc_from_db(replace=False):
+    # qc_rows/qc_latest langsung terisi saat start, sebelum pull pertama;
+    # replace=True dipakai worker web untuk mengikuti proses ingest
+    global qc_last_update_dt, qc_last_update_chlor_dt, qc_generation
+    try:
+        with sqlite3.connect(DB_PATH, timeout=10) as conn:
+            cur = conn.execute("SELECT ts, dt, %s FROM qc_samples ORDER BY ts, seq" % ", ".join(QC_ORDER))
+            rows = [dict(zip(["ts", "dt"] + QC_ORDER, r)) for r in cur]
+    except Exception as e:
+        print("[QC] load from db error:", e)
+        return
+    with qc_lock:
+        if qc_rows and not replace:
+            return
+        qc_rows[:] = rows
+        qc_generation = next(_generation_counter)
+        _qc_track_changes()
+        latest_map, qc_last_update_dt, qc_last_update_chlor_dt = _qc_latest_from(rows)
+        qc_latest.clear()
+        qc_latest.update(latest_map)
+    qc_status["row_count"] = len(rows)
+
+def qc_history(param: str, hours: float, interval: int, opts=None):
     if param not in QC_PARAMS:
         return []
+    opts = opts or query_options({})
     now = int(time.time())
     start = now - int(hours * 3600)
 
     with qc_lock:
-        rows = list(qc_rows)
-
-    filtered = [r for r in rows if r["ts"] >= start and r.get(param) is not None]
-    if not filtered:
-        return []
-
-    buckets = {}
-    for r in filtered:
-        b = (r["ts"] // interval) * interval
-        buckets.setdefault(b, []).append(r[param])
+        i = bisect_left(qc_rows, start, key=lambda r: r["ts"])
+        rows = qc_rows[i:]
 
-    out = []
-    for b in sorted(buckets.keys()):
-        vals = buckets[b]
-        out.append({"ts": int(b), "value": float(sum(vals) / max(len(vals), 1))})
-    return out
+    filtered = [r for r in rows if r.get(param) is not None]
+    buckets = _bucket_agg([r["ts"] for r in filtered], [float(r[param]) for r in filtered],
+                          interval, opts["agg"])
+    ts, vals = shape_series([int(b) for b, _ in buckets], [v for _, v in buckets],
+                            start, now, interval, opts)
+    return [{"ts": t, "value": v} for t, v in zip(ts, vals)]
 
 # ================== JADWAL helpers ==================
 def _ms_to_datestr(ms):
@@ -277,107 +1864,857 @@ def _ms_to_datestr(ms):
     except:
         return None
 
+def _schedule_files():
+    return sorted(glob.glob(os.path.join(SCHEDULE_DIR, SCHEDULE_JSON_GLOB)))
+
+def _iter_json_array(f, chunk_size=65536):
+    # parse top-level JSON array satu elemen per kali; memori dibatasi
+    # ukuran chunk + satu elemen, bukan ukuran file
+    dec = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        need_more = pos >= len(buf)
+        if not need_more:
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("Format jadwal JSON harus list of objects")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                obj, end = dec.raw_decode(buf, pos)
+                # elemen yang menyentuh ujung buffer bisa saja terpotong
+                need_more = end >= len(buf) and not eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                need_more = True
+            if not need_more:
+                yield obj
+                pos = end
+                continue
+        if eof:
+            raise ValueError("JSON jadwal terpotong")
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+def _iter_schedule_rows(files):
+    for path in files:
+        with open(path, "r", encoding="utf-8") as f:
+            for r in _iter_json_array(f):
+                if isinstance(r, dict):
+                    yield r
+
+def _build_schedule_index(rows):
+    # tanggal -> (operator, lab, json bagian operator/lab); dibangun sekali per
+    # perubahan file sehingga /api/schedule cukup lookup dict
+    by_date = {}
+    for r in rows:
+        if not r.get("jam_mulai") or not r.get("jam_selesai"):
+            continue
+
+        nama = (r.get("nama") or "").strip()
+        jab = (r.get("jabatan") or "").strip().lower()
+        kode = (r.get("shift_kode") or "").strip().upper()
+        jam  = (r.get("jam_kerja") or "").strip()
+        lokasi = (r.get("lokasi") or "").strip().upper()
+
+        if jab == "operator produksi":
+            if lokasi != "WTP3":
+                continue
+            if "12" not in kode:
+                continue
+            item, slot = {"nama": nama, "kode": kode or "-", "jam": jam or "-", "lokasi": "WTP3"}, 0
+        elif jab == "analis laboratorium":
+            if lokasi != "LAB":
+                continue
+            item, slot = {"nama": nama, "kode": kode or "-", "jam": jam or "-", "lokasi": "LAB"}, 1
+        else:
+            continue
+
+        d = _ms_to_datestr(r.get("tanggal"))
+        if d is None:
+            continue
+        by_date.setdefault(d, ([], []))[slot].append(item)
+
+    index = {}
+    for d, (op, lab) in by_date.items():
+        op.sort(key=lambda x: x["nama"])
+        lab.sort(key=lambda x: x["nama"])
+        index[d] = (op, lab, '"operator": %s, "lab": %s' % (json.dumps(op), json.dumps(lab)))
+    return index
+
 def _load_schedule_file_if_changed(force=False):
-    global schedule_rows, schedule_last_loaded, schedule_last_error, _schedule_mtime
+    global schedule_index, schedule_last_loaded, schedule_last_error, _schedule_mtimes
 
     try:
-        if not os.path.exists(SCHEDULE_JSON_FILE):
-            raise FileNotFoundError(f"File jadwal tidak ditemukan: {SCHEDULE_JSON_FILE}")
+        files = _schedule_files()
+        if not files:
+            raise FileNotFoundError(f"File jadwal tidak ditemukan: {os.path.join(SCHEDULE_DIR, SCHEDULE_JSON_GLOB)}")
 
-        mtime = os.path.getmtime(SCHEDULE_JSON_FILE)
-        if (not force) and (_schedule_mtime is not None) and (mtime == _schedule_mtime):
+        mtimes = {p: os.path.getmtime(p) for p in files}
+        if (not force) and (mtimes == _schedule_mtimes):
             return
 
-        with open(SCHEDULE_JSON_FILE, "r", encoding="utf-8") as f:
-            rows = json.load(f)
-
-        if not isinstance(rows, list):
-            raise ValueError("Format jadwal JSON harus list of objects")
-
-        cleaned = []
-        for r in rows:
-            if not isinstance(r, dict):
-                continue
-            cleaned.append({
-                "tanggal": r.get("tanggal"),
-                "nama": r.get("nama"),
-                "jabatan": r.get("jabatan"),
-                "shift_kode": r.get("shift_kode"),
-                "jam_kerja": r.get("jam_kerja"),
-                "lokasi": r.get("lokasi"),
-                "jam_mulai": r.get("jam_mulai"),
-                "jam_selesai": r.get("jam_selesai"),
-            })
+        # index baru dibangun di samping yang lama lalu ditukar sekali assign;
+        # kalau file masih setengah ditulis (JSON rusak) index lama tetap dipakai
+        t0 = time.perf_counter()
+        index = _build_schedule_index(_iter_schedule_rows(files))
+        metric_schedule_seconds.observe(time.perf_counter() - t0)
 
         with schedule_lock:
-            schedule_rows = cleaned
+            schedule_index = index
             schedule_last_loaded = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             schedule_last_error = None
-            _schedule_mtime = mtime
+            _schedule_mtimes = mtimes
+        state_notify("schedule")
 
     except Exception as e:
         with schedule_lock:
             schedule_last_error = str(e)
             schedule_last_loaded = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        state_notify("schedule")
+        metric_schedule_errors.inc()
         print("[SCHEDULE] load error:", e)
 
+# inotify (Linux) lewat ctypes; kalau tidak tersedia kembali ke polling mtime
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+def _inotify_watch(path):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(_IN_CLOEXEC)
+        if fd < 0:
+            return None
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+        if libc.inotify_add_watch(fd, os.path.abspath(path).encode(), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+def _inotify_names(fd):
+    data = os.read(fd, 65536)
+    names = []
+    off = 0
+    while off + _INOTIFY_EVENT.size <= len(data):
+        _wd, _mask, _cookie, length = _INOTIFY_EVENT.unpack_from(data, off)
+        off += _INOTIFY_EVENT.size
+        names.append(data[off:off + length].rstrip(b"\0").decode(errors="ignore"))
+        off += length
+    return names
+
 def schedule_worker():
     _load_schedule_file_if_changed(force=True)
+    fd = _inotify_watch(SCHEDULE_DIR)
+    if fd is None:
+        print("[SCHEDULE] inotify tidak tersedia, polling tiap", SCHEDULE_RELOAD_INTERVAL, "detik")
+        while True:
+            time.sleep(SCHEDULE_RELOAD_INTERVAL)
+            _load_schedule_file_if_changed(force=False)
+
+    # dua tenggat absolut: debounce hanya digeser event file jadwal, safety
+    # poll tidak pernah digeser event; file lain di folder yang sama
+    # (history.db, WAL) boleh berubah terus tanpa menunda reload
+    reload_at = None
+    poll_at = time.monotonic() + SCHEDULE_SAFETY_POLL
     while True:
-        time.sleep(SCHEDULE_RELOAD_INTERVAL)
-        _load_schedule_file_if_changed(force=False)
-
-def _schedule_for_date(date_str):
-    with schedule_lock:
-        rows = list(schedule_rows)
-
-    op = []
-    lab = []
-
-    for r in rows:
-        d = _ms_to_datestr(r.get("tanggal"))
-        if d != date_str:
+        now = time.monotonic()
+        if (reload_at is not None and now >= reload_at) or now >= poll_at:
+            _load_schedule_file_if_changed(force=reload_at is not None and now >= reload_at)
+            reload_at = None
+            poll_at = now + SCHEDULE_SAFETY_POLL
             continue
-
-        nama = (r.get("nama") or "").strip()
-        jab = (r.get("jabatan") or "").strip().lower()
-        kode = (r.get("shift_kode") or "").strip().upper()
-        jam  = (r.get("jam_kerja") or "").strip()
-        lokasi = (r.get("lokasi") or "").strip().upper()
-
-        if not r.get("jam_mulai") or not r.get("jam_selesai"):
+        deadline = poll_at if reload_at is None else min(reload_at, poll_at)
+        ready, _, _ = select.select([fd], [], [], deadline - now)
+        if ready and any(fnmatch.fnmatch(n, SCHEDULE_JSON_GLOB) for n in _inotify_names(fd)):
+            # debounce: reload setelah SCHEDULE_DEBOUNCE tanpa event file jadwal
+            reload_at = time.monotonic() + SCHEDULE_DEBOUNCE
+
+# ================== FORWARD (Apps Script) ==================
+# Outbox persisten: MQTT thread hanya put_nowait ke forward_queue,
+# forward_worker menyimpan ke outbox.db lalu mengirim dengan Session
+# (retry + backoff). Baris baru dihapus setelah POST sukses.
+def forward_enqueue(data):
+    try:
+        forward_queue.put_nowait(json.dumps(data))
+    except queue.Full:
+        forward_status["dropped"] += 1
+
+def _outbox_connect():
+    conn = sqlite3.connect(OUTBOX_DB_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created REAL NOT NULL,
+            body TEXT NOT NULL
+        )
+    """)
+    conn.commit()
+    return conn
+
+def _outbox_store(conn, timeout):
+    bodies = []
+    try:
+        bodies.append(forward_queue.get(timeout=timeout))
+        while True:
+            bodies.append(forward_queue.get_nowait())
+    except queue.Empty:
+        pass
+    if bodies:
+        now = time.time()
+        with conn:
+            conn.executemany("INSERT INTO outbox(created, body) VALUES (?, ?)", [(now, b) for b in bodies])
+        forward_status["depth"] += len(bodies)
+
+def _outbox_send(conn, session):
+    # doPost menerima satu objek per request: kirim berurutan, baris dihapus
+    # satu per satu setelah POST-nya sukses (gagal di tengah -> sisanya tetap)
+    rows = conn.execute("SELECT id, body FROM outbox ORDER BY id LIMIT ?", (FORWARD_BATCH_MAX,)).fetchall()
+    for row_id, body in rows:
+        t0 = time.time()
+        r = session.post(WEB_APP_URL, data=body, timeout=FORWARD_TIMEOUT)
+        r.raise_for_status()
+        if FORWARD_OK_MARKER and FORWARD_OK_MARKER not in r.text:
+            raise ValueError("balasan Apps Script tanpa penanda sukses: %r" % r.text[:200])
+        dt = time.time() - t0
+        forward_status["last_latency_ms"] = round(dt * 1000.0, 1)
+        metric_forward_seconds.observe(dt)
+
+        with conn:
+            conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+        forward_status["depth"] -= 1
+        forward_status["sent"] += 1
+        forward_status["last_success_dt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        forward_status["last_error"] = None
+
+def forward_worker():
+    conn = _outbox_connect()
+    forward_status["depth"] = conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+    session = requests.Session()
+    session.headers.update({"Content-Type": "application/json"})
+    failures = 0
+    next_try = 0.0
+    while True:
+        wait = max(0.0, next_try - time.time()) if forward_status["depth"] else 1.0
+        _outbox_store(conn, timeout=max(wait, 0.05))
+        if time.time() < next_try or not forward_status["depth"]:
             continue
+        try:
+            _outbox_send(conn, session)
+            failures = 0
+            next_try = 0.0
+        except Exception as e:
+            failures += 1
+            forward_status["failed"] += 1
+            forward_status["last_error"] = str(e)
+            backoff = min(FORWARD_RETRY_MAX, FORWARD_RETRY_BASE * (2 ** min(failures, 16)))
+            next_try = time.time() + backoff
+            print("HTTP post error:", e)
+
+# ================== SSE HUB ==================
+# Satu publisher: on_message / pull_qc_csv_once hanya menandai state berubah,
+# sse_worker membuat snapshot + json.dumps sekali lalu membagikan bytes yang
+# sama ke antrian tiap client. Client yang antriannya penuh dikeluarkan.
+sse_lock = metrics_lock("sse", hot=True)
+sse_clients = set()
+sse_pending = set()
+sse_wakeup = threading.Event()
+
+def qty_payload(station=""):
+    with data_lock:
+        if not station:
+            return {"ts": int(latest_ts_epoch or time.time()), "data": latest_data}
+        ts, data = station_latest.get(station, (0, DEFAULT_DATA))
+        return {"ts": int(ts or time.time()), "station": station, "data": data}
 
-        if jab == "operator produksi":
-            if lokasi != "WTP3":
-                continue
-            if "12" not in kode:
+def qc_payload():
+    with qc_lock:
+        return {
+            "ts": int(time.time()),
+            "qc_last_update": qc_last_update_dt,
+            "chlor_last_update": qc_last_update_chlor_dt,
+            "latest": {p: dict(v) for p, v in qc_latest.items()},
+            "status": dict(qc_status),
+            "version": qc_version,
+        }
+
+def sse_encode(msg):
+    return ("data: %s\n\n" % json.dumps(msg)).encode()
+
+def sse_notify(kind):
+    with sse_lock:
+        sse_pending.add(kind)
+    sse_wakeup.set()
+
+def sse_subscribe():
+    q = queue.Queue(maxsize=SSE_CLIENT_BACKLOG + 1)  # +1 slot untuk sinyal evict
+    with sse_lock:
+        sse_clients.add(q)
+    return q
+
+def sse_unsubscribe(q):
+    with sse_lock:
+        sse_clients.discard(q)
+
+def sse_broadcast(data: bytes):
+    with sse_lock:
+        for q in list(sse_clients):
+            if q.qsize() >= SSE_CLIENT_BACKLOG:
+                sse_clients.discard(q)
+                q.put_nowait(None)
                 continue
-            op.append({"nama": nama, "kode": kode or "-", "jam": jam or "-", "lokasi": "WTP3"})
+            q.put_nowait(data)
 
-        elif jab == "analis laboratorium":
-            if lokasi != "LAB":
+def sse_worker():
+    while True:
+        sse_wakeup.wait()
+        sse_wakeup.clear()
+        with sse_lock:
+            kinds = set(sse_pending)
+            sse_pending.clear()
+        msg = {}
+        if "qty" in kinds:
+            msg["qty"] = qty_payload()
+        if "qc" in kinds:
+            msg["qc"] = qc_payload()
+        if "alerts" in kinds:
+            with sse_lock:
+                msg["alerts"] = list(sse_alerts)
+                sse_alerts.clear()
+        if msg:
+            try:
+                sse_broadcast(sse_encode(msg))
+                metric_sse_broadcasts.inc()
+            except Exception as e:
+                print("[SSE] broadcast error:", e)
+        time.sleep(SSE_MIN_INTERVAL)
+
+# ================== SHARED STATE (ingest -> web) ==================
+# Segmen mmap berisi snapshot JSON per bagian (qty, qc, schedule, status,
+# alerts, metrics).
+# Tiap bagian punya dua slot + nomor urut: writer mengisi slot yang tidak
+# aktif lalu menaikkan seq, pembaca memakai slot seq % 2 dan mengulang bila
+# seq sudah maju lebih dari satu selama membaca. Hanya proses ingest yang
+# menulis; worker web cukup memetakan file dan decode saat seq berubah.
+class StateSegment:
+    MAGIC = b"DSHSTAT1"
+    SECTIONS = [("qty", 256 * 1024), ("qc", 64 * 1024),
+                ("schedule", 4 * 1024 * 1024), ("status", 64 * 1024), ("alerts", 64 * 1024),
+                ("metrics", 256 * 1024)]
+    _HDR = struct.Struct("QII")  # seq, len slot 0, len slot 1
+    _SEQ = struct.Struct("Q")
+    _LEN = struct.Struct("I")
+
+    def __init__(self, path, writer=False):
+        self.path = path
+        self.writer = writer
+        self.offsets = {}
+        off = len(self.MAGIC)
+        for name, cap in self.SECTIONS:
+            self.offsets[name] = (off, cap)
+            off += self._HDR.size + 2 * cap
+        self.size = off
+        self.lock = threading.Lock()
+
+        fd = os.open(path, (os.O_RDWR | os.O_CREAT) if writer else os.O_RDONLY, 0o644)
+        try:
+            fresh = os.fstat(fd).st_size != self.size
+            if writer and fresh:
+                os.ftruncate(fd, self.size)
+            elif fresh:
+                raise OSError("segmen state belum siap: %s" % path)
+            self.mm = mmap.mmap(fd, self.size, access=mmap.ACCESS_WRITE if writer else mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+
+        # seq lama dipertahankan bila segmen valid, supaya pembaca yang masih
+        # terpetakan tetap melihat seq naik setelah ingest restart
+        if fresh or self.mm[:len(self.MAGIC)] != self.MAGIC:
+            if not writer:
+                raise OSError("segmen state belum siap: %s" % path)
+            self.mm[:self.size] = bytes(self.size)
+            self.mm[:len(self.MAGIC)] = self.MAGIC
+
+    def publish(self, name, obj):
+        data = json.dumps(obj).encode()
+        off, cap = self.offsets[name]
+        if len(data) > cap:
+            raise ValueError("state %s %d byte melebihi kapasitas %d" % (name, len(data), cap))
+        with self.lock:
+            seq = self._SEQ.unpack_from(self.mm, off)[0]
+            slot = (seq + 1) & 1
+            start = off + self._HDR.size + slot * cap
+            self.mm[start:start + len(data)] = data
+            # panjang dulu, baru seq: pembaca tidak pernah melihat seq baru
+            # dengan panjang slot yang lama
+            self._LEN.pack_into(self.mm, off + self._SEQ.size + slot * self._LEN.size, len(data))
+            self._SEQ.pack_into(self.mm, off, seq + 1)
+        return seq + 1
+
+    def seq(self, name):
+        return self._SEQ.unpack_from(self.mm, self.offsets[name][0])[0]
+
+    def read(self, name):
+        # seqlock: salinan hanya sah bila seq tidak berubah selama disalin;
+        # bila berubah (atau salinan robek sampai JSON-nya rusak) ulangi
+        off, cap = self.offsets[name]
+        for _ in range(5):
+            seq, l0, l1 = self._HDR.unpack_from(self.mm, off)
+            if seq == 0:
+                return 0, None
+            slot = seq & 1
+            start = off + self._HDR.size + slot * cap
+            data = self.mm[start:start + min(l1 if slot else l0, cap)]
+            if self.seq(name) != seq:
+                time.sleep(0)
                 continue
-            lab.append({"nama": nama, "kode": kode or "-", "jam": jam or "-", "lokasi": "LAB"})
+            try:
+                return seq, json.loads(data)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                time.sleep(0)
+        return None, None
+
+state_segment = None
+state_lock = threading.Lock()
+state_pending = set()
+state_wakeup = threading.Event()
+state_status = {"role": DASHBOARD_ROLE, "published": {}, "applied": {}, "last_error": None}
+remote_status = {}
+_alert_seen_id = None  # worker web: id event alert terakhir yang sudah diteruskan
+
+def state_notify(kind):
+    if state_segment is None or not state_segment.writer:
+        return
+    with state_lock:
+        state_pending.add(kind)
+    state_wakeup.set()
+
+def _state_snapshot(kind):
+    if kind == "qty":
+        with data_lock:
+            return {"ts": latest_ts_epoch, "data": latest_data,
+                    "stations": {ns: [ts, d] for ns, (ts, d) in station_latest.items()},
+                    "namespaces": sorted(sample_namespaces),
+                    "generation": dict(sample_generation)}
+    if kind == "qc":
+        with qc_lock:
+            return {"qc_last_update": qc_last_update_dt, "chlor_last_update": qc_last_update_chlor_dt,
+                    "latest": {p: dict(v) for p, v in qc_latest.items()},
+                    "status": dict(qc_status)}
+    if kind == "schedule":
+        with schedule_lock:
+            return {"index": {d: [op, lab] for d, (op, lab, _) in schedule_index.items()},
+                    "loaded_at": schedule_last_loaded, "error": schedule_last_error}
+    if kind == "alerts":
+        return alerts_payload()
+    if kind == "metrics":
+        return metrics_snapshot()
+    return status_payload()
+
+def state_publisher_worker():
+    for kind, _ in StateSegment.SECTIONS:
+        state_pending.add(kind)
+    next_status = 0.0
+    while True:
+        state_wakeup.wait(timeout=STATE_STATUS_INTERVAL)
+        state_wakeup.clear()
+        with state_lock:
+            kinds = set(state_pending)
+            state_pending.clear()
+        if time.time() >= next_status:
+            kinds.update(("status", "metrics"))
+            next_status = time.time() + STATE_STATUS_INTERVAL
+        for kind in kinds:
+            try:
+                state_status["published"][kind] = state_segment.publish(kind, _state_snapshot(kind))
+            except Exception as e:
+                state_status["last_error"] = str(e)
+                print("[STATE] publish %s error:" % kind, e)
+        time.sleep(SSE_MIN_INTERVAL)
+
+def _state_apply(kind, obj):
+    global latest_data, latest_ts_epoch, station_latest
+    global qc_last_update_dt, qc_last_update_chlor_dt
+    global schedule_index, schedule_last_loaded, schedule_last_error, _alert_seen_id
+    if kind == "qty":
+        stations = {ns: (ts, d) for ns, (ts, d) in obj["stations"].items()}
+        with data_lock:
+            latest_data = obj["data"]
+            latest_ts_epoch = obj["ts"]
+            station_latest = stations
+        sample_namespaces.update(obj["namespaces"])
+        sample_generation.update(obj["generation"])
+        sse_notify("qty")
+    elif kind == "qc":
+        if obj["status"]["db_generation"] != qc_status["db_generation"]:
+            load_qc_from_db(replace=True)
+        with qc_lock:
+            qc_latest.clear()
+            qc_latest.update(obj["latest"])
+            qc_last_update_dt = obj["qc_last_update"]
+            qc_last_update_chlor_dt = obj["chlor_last_update"]
+        qc_status.update(obj["status"])
+        sse_notify("qc")
+    elif kind == "schedule":
+        index = {d: (op, lab, '"operator": %s, "lab": %s' % (json.dumps(op), json.dumps(lab)))
+                 for d, (op, lab) in obj["index"].items()}
+        with schedule_lock:
+            schedule_index = index
+            schedule_last_loaded = obj["loaded_at"]
+            schedule_last_error = obj["error"]
+    elif kind == "alerts":
+        with alert_lock:
+            alert_active.clear()
+            alert_active.update({ev["rule"]: ev for ev in obj["active"]})
+            alert_recent.clear()
+            alert_recent.extend(obj["recent"])
+        # event baru sejak snapshot sebelumnya diteruskan ke client SSE worker ini
+        fresh = [ev for ev in obj["recent"] if _alert_seen_id is not None and ev["id"] > _alert_seen_id]
+        _alert_seen_id = max([ev["id"] for ev in obj["recent"]] + [_alert_seen_id or 0])
+        if fresh:
+            with sse_lock:
+                sse_alerts.extend(fresh)
+            sse_notify("alerts")
+    elif kind == "metrics":
+        remote_metrics.clear()
+        remote_metrics.update(obj)
+    else:
+        remote_status.clear()
+        remote_status.update(obj)
 
-    op.sort(key=lambda x: x["nama"])
-    lab.sort(key=lambda x: x["nama"])
-    return op, lab
+def state_follower_worker():
+    global state_segment
+    applied = state_status["applied"]
+    while True:
+        try:
+            if state_segment is None:
+                state_segment = StateSegment(STATE_SEGMENT_PATH)
+            for kind, _ in StateSegment.SECTIONS:
+                if state_segment.seq(kind) == applied.get(kind):
+                    continue
+                seq, obj = state_segment.read(kind)
+                if obj is None:
+                    continue
+                _state_apply(kind, obj)
+                applied[kind] = seq
+            state_status["last_error"] = None
+        except Exception as e:
+            state_status["last_error"] = str(e)
+            time.sleep(1)
+        time.sleep(SSE_MIN_INTERVAL)
+
+# ================== RESPONSE CACHE ==================
+# Hasil endpoint history disimpan sebagai bytes JSON + ETag, dengan key
+# route + parameter ternormalisasi + generation data. Generation naik tiap
+# ada sampel/QC baru sehingga entri lama tidak pernah cocok lagi dan
+# tersingkir sendiri oleh batas LRU.
+response_cache = OrderedDict()
+response_cache_lock = threading.Lock()
+response_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def cached_json(key, gen, build, encode=None):
+    # slot waktu ikut di key: window "N jam terakhir" bergeser walau data tetap
+    key = (key, gen, int(time.time() // RESPONSE_CACHE_TTL))
+    with response_cache_lock:
+        hit = response_cache.get(key)
+        if hit is not None:
+            response_cache.move_to_end(key)
+            response_cache_stats["hits"] += 1
+            return hit
+
+    if encode is None:
+        body, ctype = json.dumps(build()).encode(), "application/json"
+    else:
+        body, ctype = encode(build())
+    # "enc": varian terkompresi, diisi saat pertama diminta
+    entry = {"etag": '"%s"' % hashlib.sha1(body).hexdigest(), "body": body, "ctype": ctype, "enc": {}}
+    with response_cache_lock:
+        response_cache_stats["misses"] += 1
+        response_cache[key] = entry
+        while len(response_cache) > RESPONSE_CACHE_MAX:
+            response_cache.popitem(last=False)
+            response_cache_stats["evictions"] += 1
+    return entry
+
+def _accepts(header, token):
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == token:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+def negotiate_body(entry, accept_encoding):
+    """(body, etag, content-encoding atau None) sesuai Accept-Encoding."""
+    body = entry["body"]
+    if len(body) < RESPONSE_COMPRESS_MIN or not entry.get("compress", True):
+        return body, entry["etag"], None
+    for enc in ("br", "gzip"):
+        if enc == "br" and brotli is None:
+            continue
+        if not _accepts(accept_encoding, enc):
+            continue
+        packed = entry["enc"].get(enc)
+        if packed is None:
+            if enc == "br":
+                packed = brotli.compress(body, quality=5)
+            else:
+                packed = gzip.compress(body, compresslevel=6, mtime=0)
+            entry["enc"][enc] = packed
+        # ETag kuat harus beda per representasi
+        return packed, entry["etag"][:-1] + "-" + enc + '"', enc
+    return body, entry["etag"], None
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+
+def _history_norm(args):
+    norm = query_options(args)
+    norm.update(hours=float(args.get("hours", 24)), interval=int(args.get("interval", 60)),
+                limit=_limit_arg(args))
+    return norm
+
+def history_cached(key, args, accept=""):
+    norm = _history_norm(args)
+    fmt = history_format(args, accept)
+    ns, _ = _split_series(key)
+    return cached_json(("history", key, fmt, tuple(sorted(norm.items()))),
+                       sample_generation.get(ns, 0),
+                       lambda: [(key, *history_series(key, norm))],
+                       functools.partial(encode_series, fmt, False))
+
+def history_multi_cached(args, accept=""):
+    keys = [k.strip() for k in (args.get("keys") or "").split(",") if k.strip()]
+    if not keys:
+        raise ValueError("parameter keys kosong")
+    keys = list(dict.fromkeys(keys))[:HISTORY_MULTI_MAX]
+    norm = _history_norm(args)
+    fmt = history_format(args, accept)
+    gen = tuple(sample_generation.get(_split_series(k)[0], 0) for k in keys)
+    return cached_json(("history_multi", tuple(keys), fmt, tuple(sorted(norm.items()))), gen,
+                       lambda: [(k, *history_series(k, norm)) for k in keys],
+                       functools.partial(encode_series, fmt, True))
+
+def qc_history_cached(param, args):
+    hours = float(args.get("hours", 24))
+    interval = int(args.get("interval", 3600))
+    opts = query_options(args)
+    return cached_json(("qc_history", param, hours, interval, tuple(sorted(opts.items()))), qc_generation,
+                       lambda: qc_history(param, hours=hours, interval=interval, opts=opts))
+
+def qc_last_cached(param, args):
+    n = int(args.get("n", 5))
+    return cached_json(("qc_last", param, n), qc_generation,
+                       lambda: qc_last_payload(param, {"n": n}))
+
+# ================== ASSETS ==================
+# File di folder static disajikan dari memori dengan nama ber-hash isi
+# (app.js -> app.<sha256[:12]>.js) dan Cache-Control immutable, jadi browser
+# tidak pernah meminta ulang; varian gzip/brotli dikompres sekali saat
+# manifest dibangun (level maksimum). Nama asli tetap dilayani dengan ETag
+# + no-cache. Halaman shell dirender sekali per versi manifest dengan URL
+# static diganti ke nama ber-hash, lalu divalidasi ulang lewat ETag: reload
+# kiosk cukup satu 304. Nilai live tidak ikut di shell; datang dari
+# snapshot awal /events dan /api/latest.
+asset_lock = threading.Lock()
+_asset_state = {"sig": None, "checked": 0.0, "by_name": {}, "by_hashed": {}, "shell": None}
+
+def _asset_entry(path, name):
+    with open(path, "rb") as f:
+        body = f.read()
+    digest = hashlib.sha256(body).hexdigest()[:12]
+    root, ext = os.path.splitext(name)
+    ctype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    compress = ctype.startswith(ASSET_COMPRESS_TYPES)
+    if ctype.startswith("text/") or ctype == "application/javascript":
+        ctype += "; charset=utf-8"
+    entry = {"etag": '"%s"' % digest, "body": body, "ctype": ctype, "enc": {}, "compress": compress,
+             "hashed": "%s.%s%s" % (root, digest, ext)}
+    if compress:
+        _precompress(entry)
+    return entry
+
+def _precompress(entry):
+    body = entry["body"]
+    entry["enc"]["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+    if brotli is not None:
+        entry["enc"]["br"] = brotli.compress(body, quality=11)
+
+def _static_files():
+    root = app.static_folder
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for fn in filenames:
+            if not fn.startswith("."):
+                path = os.path.join(dirpath, fn)
+                yield path, os.path.relpath(path, root).replace(os.sep, "/")
+
+def _shell_sources():
+    # sumber halaman /: folder template Flask lalu index.html statis di root
+    paths = [INDEX_HTML_PATH]
+    if app.template_folder:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(app.root_path, app.template_folder)):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            paths += [os.path.join(dirpath, fn) for fn in filenames if not fn.startswith(".")]
+    return paths
+
+def asset_manifest():
+    """State aset saat ini; dibangun ulang bila isi folder static atau
+    sumber shell (template / index.html) berubah."""
+    state = _asset_state
+    now = time.time()
+    if now - state["checked"] < ASSET_CHECK_INTERVAL:
+        return state
+    with asset_lock:
+        state = _asset_state
+        if now - state["checked"] < ASSET_CHECK_INTERVAL:
+            return state
+        files = list(_static_files())
+        sig = []
+        for path, name in files:
+            st = os.stat(path)
+            sig.append((name, st.st_mtime_ns, st.st_size))
+        for path in _shell_sources():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            sig.append(("shell:" + path, st.st_mtime_ns, st.st_size))
+        sig = tuple(sorted(sig))
+        if sig == state["sig"]:
+            state["checked"] = now
+            return state
+        if app.jinja_env.cache is not None:
+            # Jinja tidak memeriksa ulang file template di luar mode debug
+            app.jinja_env.cache.clear()
+        by_name = {name: _asset_entry(path, name) for path, name in files}
+        # nama ber-hash versi sebelumnya tetap dilayani sampai rebuild
+        # berikutnya: halaman yang masih terbuka tidak kena 404
+        by_hashed = {e["hashed"]: e for e in state["by_name"].values()}
+        by_hashed.update((e["hashed"], e) for e in by_name.values())
+        state = {"sig": sig, "checked": now, "by_name": by_name, "by_hashed": by_hashed, "shell": None}
+        _set_asset_state(state)
+        return state
+
+def _set_asset_state(state):
+    global _asset_state
+    _asset_state = state
+
+def asset_lookup(rel):
+    """(entry, immutable) untuk path di bawah /static/; entry None bila tidak ada."""
+    state = asset_manifest()
+    entry = state["by_hashed"].get(rel)
+    if entry is not None:
+        return entry, True
+    return state["by_name"].get(rel), False
+
+def asset_url(name):
+    entry = asset_manifest()["by_name"].get(name)
+    return "/static/" + (entry["hashed"] if entry is not None else name)
+
+_STATIC_REF = re.compile(r"""(["'(]\s*(?:\.?/)?static/)([^"')?#\s]+)""")
+
+def _shell_html():
+    with app.app_context():
+        try:
+            # data default, bukan latest_data: shell di-cache lintas sampel
+            return render_index(DEFAULT_DATA)
+        except TemplateNotFound:
+            # deploy tanpa folder templates/: index.html statis di root
+            with open(INDEX_HTML_PATH, encoding="utf-8") as f:
+                return f.read()
+
+def shell_entry():
+    """Halaman / yang sudah dirender + dikompres, per versi manifest aset."""
+    state = asset_manifest()
+    entry = state["shell"]
+    if entry is None:
+        by_name = state["by_name"]
+        html = _STATIC_REF.sub(
+            lambda m: m.group(1) + (by_name[m.group(2)]["hashed"] if m.group(2) in by_name else m.group(2)),
+            _shell_html())
+        body = html.encode()
+        entry = {"etag": '"%s"' % hashlib.sha256(body).hexdigest()[:16], "body": body,
+                 "ctype": "text/html; charset=utf-8", "enc": {}}
+        _precompress(entry)
+        state["shell"] = entry
+    return entry
 
 # ================== FLASK ==================
 app = Flask(__name__)
+app.jinja_env.globals["asset_url"] = asset_url
+
+def _timed_wsgi(wsgi_app):
+    # waktu mulai disimpan di environ (dict biasa); flask.g / request lewat
+    # LocalProxy ~1 us per akses, terlalu mahal untuk tiap request
+    @functools.wraps(wsgi_app)
+    def timed(environ, start_response):
+        environ["dashboard.t0"] = time.perf_counter()
+        return wsgi_app(environ, start_response)
+    return timed
+
+app.wsgi_app = _timed_wsgi(app.wsgi_app)
+
+@app.after_request
+def record_request_metrics(resp):
+    if METRICS_ENABLED:
+        req = request._get_current_object()
+        t0 = req.environ.get("dashboard.t0")
+        if t0 is not None:
+            route = req.url_rule.rule if req.url_rule is not None else "unmatched"
+            metrics_observe_http(route, req.method, resp.status_code, time.perf_counter() - t0)
+    return resp
 
 @app.after_request
 def add_no_cache_headers(resp):
+    if "Cache-Control" in resp.headers:
+        return resp  # sudah ditentukan view (aset static, SSE)
+    if resp.headers.get("ETag"):
+        # boleh disimpan browser tapi selalu divalidasi ulang (If-None-Match)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
     resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
     resp.headers["Pragma"] = "no-cache"
     resp.headers["Expires"] = "0"
     return resp
 
-@app.route("/")
-def index():
-    with data_lock:
-        data = dict(latest_data)
+def etag_response(entry, cache_control=None):
+    body, etag, enc = negotiate_body(entry, request.headers.get("Accept-Encoding"))
+    headers = {"ETag": etag, "Vary": "Accept, Accept-Encoding"}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status=304, headers=headers)
+    if enc:
+        headers["Content-Encoding"] = enc
+    return Response(body, content_type=entry["ctype"], headers=headers)
+
+def render_index(data=None):
+    if data is None:
+        with data_lock:
+            data = latest_data
     return render_template(
         "index.html",
         data=data,
@@ -388,138 +2725,477 @@ def index():
         RES_LITER_PER_M=RES_LITER_PER_M,
     )
 
-# ===== API kuantitas =====
-@app.route("/api/latest")
-def api_latest():
-    with data_lock:
-        data = dict(latest_data)
-        ts = int(latest_ts_epoch or time.time())
-    return jsonify({"ts": ts, "data": data})
+@app.route("/")
+def index():
+    return etag_response(shell_entry())
 
-@app.route("/api/history/<key>")
-def api_history(key):
-    hours = float(request.args.get("hours", 24))
-    interval = int(request.args.get("interval", 60))
-    now = int(time.time())
-    start = now - int(hours * 3600)
+def static_asset(filename):
+    entry, immutable = asset_lookup(filename)
+    if entry is None:
+        return Response("Not Found", status=404, mimetype="text/plain")
+    return etag_response(entry, ASSET_CACHE_CONTROL if immutable else "no-cache")
+
+# route /static bawaan Flask (send_file dari disk per request) diganti
+app.view_functions["static"] = static_asset
 
+# ===== API kuantitas =====
+def _pick_rollup(interval):
+    # tier paling kasar yang bucket-nya masih habis membagi interval
+    best = None
+    for tier in ROLLUP_TIERS:
+        if tier <= interval and interval % tier == 0:
+            best = tier
+    return best
+
+_ROLLUP_AGG_SQL = {"avg": "SUM(vsum) / SUM(cnt)", "min": "MIN(vmin)", "max": "MAX(vmax)",
+                   "count": "SUM(cnt)"}
+# "last": kolom bare bersama MAX(ts) di SQLite mengambil nilai dari baris ts terbesar
+_RAW_AGG_SQL = {"avg": "AVG({col})", "min": "MIN({col})", "max": "MAX({col})",
+                "count": "COUNT({col})", "last": "{col}, MAX(ts)"}
+
+def _history_rows(key, start, interval, agg="avg"):
+    # rollup tidak menyimpan nilai terakhir per bucket -> agg=last selalu dari mentah
+    tier = _pick_rollup(interval) if agg in _ROLLUP_AGG_SQL else None
     with sqlite3.connect(DB_PATH, timeout=10) as conn:
         cur = conn.cursor()
-        cur.execute("""
-            SELECT
-                (CAST(ts / ? AS INTEGER) * ?) AS bucket,
-                AVG(value) AS avg_value
-            FROM measurements
-            WHERE key = ? AND ts >= ?
-            GROUP BY bucket
-            ORDER BY bucket
-        """, (interval, interval, key, start))
-        rows = cur.fetchall()
-
-    out = [{"ts": int(r[0]), "value": float(r[1])} for r in rows]
-
-    limit = request.args.get("limit")
+        if tier is not None:
+            cur.execute("""
+                SELECT
+                    (bucket / ?) * ? AS b,
+                    {agg} AS value
+                FROM {t}
+                WHERE key = ? AND bucket >= ?
+                GROUP BY b
+                ORDER BY b
+            """.format(t=_rollup_table(tier), agg=_ROLLUP_AGG_SQL[agg]), (interval, interval, key, start))
+        else:
+            ns, base = _split_series(key)
+            cur.execute("""
+                SELECT
+                    (CAST(ts / ? AS INTEGER) * ?) AS bucket,
+                    {agg} AS value
+                FROM {t}
+                WHERE ts >= ? AND {col} IS NOT NULL
+                GROUP BY bucket
+                ORDER BY bucket
+            """.format(col=_col(base), t=_samples_table(ns), agg=_RAW_AGG_SQL[agg].format(col=_col(base))),
+                (interval, interval, start))
+        return cur.fetchall()
+
+def _limit_arg(args):
+    limit = args.get("limit")
     if limit:
         try:
-            n = max(1, int(limit))
-            out = out[-n:]
+            return max(1, int(limit))
         except:
             pass
+    return None
+
+def history_series(key, args):
+    """(ts[], value[]) per bucket untuk satu series, sesuai agg/fill/max_points."""
+    hours = float(args.get("hours", 24))
+    interval = int(args.get("interval", 60))
+    if interval < 1:
+        raise ValueError("interval minimal 1")
+    opts = query_options(args)
+    now = int(time.time())
+    # bucket pertama utuh di semua jalur: rollup hanya bisa menjawab per
+    # bucket tier (interval kelipatan tier), jadi ring/mentah ikut dibulatkan
+    start = (now - int(hours * 3600)) // interval * interval
+
+    ns, base = _split_series(key)
+    if base not in SAMPLE_KEYS or ns not in sample_namespaces:
+        return [], []
+
+    rows = _ring_history(key, start, interval, opts["agg"])
+    if rows is None:
+        rows = _history_rows(key, start, interval, opts["agg"])
+    ts = [int(r[0]) for r in rows]
+    vals = [float(r[1]) for r in rows]
+    return shape_series(ts, vals, start, now, interval, opts, _limit_arg(args))
+
+def history_payload(key, args):
+    ts, vals = history_series(key, args)
+    return [{"ts": t, "value": v} for t, v in zip(ts, vals)]
+
+# Format response history:
+#   rows    : [{"ts", "value"}, ...] (default, format lama)
+#   columns : {"ts": [...], "value": [...]}
+#   delta   : {"t0": ts pertama, "dt": [selisih ts, elemen pertama 0], "value": [...]}
+#   f32     : biner little-endian per series:
+#             u16 panjang key, key utf-8, u32 n, i64 t0, i32[n] dt, f32[n] value
+#             (gap dari fill=null dikirim sebagai NaN)
+HISTORY_FORMATS = ("rows", "columns", "delta", "f32")
+HISTORY_F32_MIMETYPE = "application/octet-stream"
+HISTORY_MULTI_MAX = 32  # key per request /api/history?keys=
+_F32_KEY = struct.Struct("<H")
+_F32_HEAD = struct.Struct("<Iq")
+
+def history_format(args, accept=""):
+    fmt = args.get("format")
+    if fmt is None:
+        return "f32" if _accepts(accept, HISTORY_F32_MIMETYPE) else "rows"
+    if fmt not in HISTORY_FORMATS:
+        raise ValueError("format harus salah satu dari %s" % ", ".join(HISTORY_FORMATS))
+    return fmt
+
+def _deltas(ts):
+    return [0] + [b - a for a, b in zip(ts, ts[1:])] if ts else []
+
+def _pack_f32(series):
+    out = []
+    for key, ts, vals in series:
+        k = key.encode()
+        dt = array("i", _deltas(ts))
+        fv = array("f", [float("nan") if v is None else v for v in vals])  # gap -> NaN
+        if sys.byteorder == "big":
+            dt.byteswap()
+            fv.byteswap()
+        out += [_F32_KEY.pack(len(k)), k, _F32_HEAD.pack(len(ts), ts[0] if ts else 0),
+                dt.tobytes(), fv.tobytes()]
+    return b"".join(out)
+
+def encode_series(fmt, multi, series):
+    """series: [(key, ts[], value[])] -> (body bytes, content-type)."""
+    if fmt == "f32":
+        return _pack_f32(series), HISTORY_F32_MIMETYPE
+    out = {}
+    for key, ts, vals in series:
+        if fmt == "columns":
+            out[key] = {"ts": ts, "value": vals}
+        elif fmt == "delta":
+            out[key] = {"t0": ts[0] if ts else None, "dt": _deltas(ts), "value": vals}
+        else:
+            out[key] = [{"ts": t, "value": v} for t, v in zip(ts, vals)]
+    obj = {"series": out} if multi else out[series[0][0]]
+    return json.dumps(obj, separators=(",", ":")).encode(), "application/json"
+
+@app.route("/api/latest")
+def api_latest():
+    return jsonify(qty_payload(request.args.get("station", "")))
 
-    return jsonify(out)
+@app.route("/api/history/<key>")
+def api_history(key):
+    try:
+        entry = history_cached(key, request.args, request.headers.get("Accept", ""))
+    except ValueError as e:
+        return Response(str(e), status=400, mimetype="text/plain")
+    return etag_response(entry)
+
+@app.route("/api/history")
+def api_history_multi():
+    try:
+        entry = history_multi_cached(request.args, request.headers.get("Accept", ""))
+    except ValueError as e:
+        return Response(str(e), status=400, mimetype="text/plain")
+    return etag_response(entry)
 
 # ===== API QC =====
-@app.route("/api/qc/latest")
-def api_qc_latest():
+def qc_history_payload(param, args):
+    hours = float(args.get("hours", 24))
+    interval = int(args.get("interval", 3600))
+    return qc_history(param, hours=hours, interval=interval, opts=query_options(args))
+
+def qc_last_payload(param, args):
+    n = int(args.get("n", 5))
+    if param not in QC_PARAMS:
+        return []
+
+    out = []
     with qc_lock:
-        payload = {
-            "ts": int(time.time()),
+        for rr in reversed(qc_rows):
+            v = rr.get(param)
+            if v is None:
+                continue
+            out.append({"ts": rr["ts"], "value": float(v)})
+            if len(out) >= n:
+                break
+
+    out.reverse()
+    return out
+
+def qc_snapshot_payload(args):
+    """Snapshot QC ringkas untuk dashboard: nilai terbaru, sparkline dan baris
+    dalam jendela `hours` sebagai kolom tetap. `from` = posisi baris pertama
+    di qc_rows; dengan since=<versi> yang masih ada di log hanya baris mulai
+    posisi pertama yang berubah yang dikirim (client memotong di situ)."""
+    hours = min(float(args.get("hours", QC_SNAPSHOT_MAX_HOURS)), QC_SNAPSHOT_MAX_HOURS)
+    n = max(0, min(int(args.get("spark", QC_SNAPSHOT_SPARK)), 50))
+    start = int(time.time() - hours * 3600)
+    with qc_lock:
+        out = {
+            "version": qc_version,
+            "cols": ["ts"] + QC_ORDER,
             "qc_last_update": qc_last_update_dt,
             "chlor_last_update": qc_last_update_chlor_dt,
-            "latest": qc_latest,
-            "status": qc_status,
+            "latest": {p: dict(v) for p, v in qc_latest.items()},
+            "spark": {p: [] for p in QC_ORDER},
         }
-    return jsonify(payload)
+        if n:
+            for rr in reversed(qc_rows):
+                for p in QC_ORDER:
+                    pts = out["spark"][p]
+                    if len(pts) < n and rr.get(p) is not None:
+                        pts.append([rr["ts"], rr[p]])
+                if all(len(pts) >= n for pts in out["spark"].values()):
+                    break
+        i = _qc_delta_since(args.get("since"))
+        full = i is None
+        if full:
+            i = bisect_left(qc_rows, start, key=lambda r: r["ts"])
+        out.update(full=full, rows=_qc_tuples[i:])
+        out["from"] = i
+    for pts in out["spark"].values():
+        pts.reverse()
+    return out
+
+def qc_snapshot_cached(args):
+    key = ("qc_snapshot", args.get("since"), args.get("hours"), args.get("spark"))
+    return cached_json(key, qc_version, lambda: qc_snapshot_payload(args))
+
+@app.route("/api/qc/snapshot")
+def api_qc_snapshot():
+    try:
+        entry = qc_snapshot_cached(request.args)
+    except ValueError as e:
+        return Response(str(e), status=400, mimetype="text/plain")
+    return etag_response(entry)
+
+@app.route("/api/qc/latest")
+def api_qc_latest():
+    return jsonify(qc_payload())
 
 @app.route("/api/qc/history/<param>")
 def api_qc_history(param):
-    hours = float(request.args.get("hours", 24))
-    interval = int(request.args.get("interval", 3600))
-    return jsonify(qc_history(param, hours=hours, interval=interval))
+    try:
+        entry = qc_history_cached(param, request.args)
+    except ValueError as e:
+        return Response(str(e), status=400, mimetype="text/plain")
+    return etag_response(entry)
 
 @app.route("/api/qc/last/<param>")
 def api_qc_last(param):
-    n = int(request.args.get("n", 5))
-    if param not in QC_PARAMS:
-        return jsonify([])
+    return etag_response(qc_last_cached(param, request.args))
 
-    with qc_lock:
-        rows = list(qc_rows)
+# ===== API JADWAL =====
+_EMPTY_SCHEDULE_JSON = '"operator": [], "lab": []'
 
-    out = []
-    for rr in reversed(rows):
-        v = rr.get(param)
-        if v is None:
-            continue
-        out.append({"ts": rr["ts"], "value": float(v)})
-        if len(out) >= n:
-            break
+def schedule_body(args):
+    # JSON operator/lab per tanggal sudah disiapkan saat load; di sini hanya
+    # disambung dengan tanggal dan meta
+    date_str = (args.get("date") or "").strip()
+    if not date_str:
+        date_str = datetime.now().strftime("%Y-%m-%d")
 
-    out.reverse()
-    return jsonify(out)
+    entry = schedule_index.get(date_str)
+
+    with schedule_lock:
+        meta = {"loaded_at": schedule_last_loaded, "error": schedule_last_error,
+                "file": os.path.join(SCHEDULE_DIR, SCHEDULE_JSON_GLOB)}
+
+    return '{"date": %s, %s, "meta": %s}' % (
+        json.dumps(date_str), entry[2] if entry else _EMPTY_SCHEDULE_JSON, json.dumps(meta))
 
-# ===== API JADWAL =====
 @app.route("/api/schedule")
 def api_schedule():
-    date_str = (request.args.get("date") or "").strip()
-    if not date_str:
-        date_str = datetime.now().strftime("%Y-%m-%d")
+    return Response(schedule_body(request.args), mimetype="application/json")
+
+# ===== API export =====
+# Stream CSV/NDJSON langsung dari cursor read-only (fetchmany), tanpa
+# db_lock: di mode WAL pembaca tidak menghalangi writer. Key dari beberapa
+# stasiun (tabel berbeda) digabung on the fly per ts lewat merge cursor
+# yang sama-sama terurut, jadi memori tetap konstan berapa pun rentangnya.
+EXPORT_FETCH = 2000  # baris per fetchmany / chunk response
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+def _parse_time_arg(v, default):
+    if v is None or v == "":
+        return default
+    try:
+        return int(float(v))
+    except ValueError:
+        return int(datetime.fromisoformat(v).timestamp())
 
-    op, lab = _schedule_for_date(date_str)
+def _iter_cursor(cur, tag):
+    while True:
+        rows = cur.fetchmany(EXPORT_FETCH)
+        if not rows:
+            return
+        for r in rows:
+            yield r[0], tag, r
+
+def _export_sources(source, keys):
+    """[(tabel, [kolom], [posisi output])] untuk key yang diminta."""
+    if source == "qc":
+        keys = keys or list(QC_ORDER)
+        bad = [k for k in keys if k not in QC_PARAMS]
+        if bad:
+            raise ValueError("key QC tidak dikenal: %s" % ", ".join(bad))
+        return keys, [("qc_samples", keys, list(range(len(keys))))]
+
+    keys = keys or list(SAMPLE_KEYS)
+    by_ns = {}
+    for i, key in enumerate(keys):
+        ns, base = _split_series(key)
+        if base not in SAMPLE_KEYS or ns not in sample_namespaces:
+            raise ValueError("key tidak dikenal: %s" % key)
+        cols, pos = by_ns.setdefault(ns, ([], []))
+        cols.append(_col(base))
+        pos.append(i)
+    return keys, [(_samples_table(ns), cols, pos) for ns, (cols, pos) in by_ns.items()]
+
+def _export_rows(sources, start, end, width):
+    # check_same_thread=False: mode ASGI melanjutkan generator dari thread
+    # executor yang berbeda-beda (tetap berurutan, tidak pernah paralel)
+    conn = sqlite3.connect("file:%s?mode=ro" % DB_PATH, uri=True, timeout=10, check_same_thread=False)
+    try:
+        if sources[0][0] == "qc_samples":
+            # baris QC boleh ber-DateTime sama (kunci qc_samples = seq):
+            # satu baris output per baris sheet, tidak digabung per ts
+            _, cols, _ = sources[0]
+            cur = conn.execute("SELECT ts, %s FROM qc_samples WHERE ts >= ? AND ts < ? ORDER BY ts, seq"
+                               % ", ".join(cols), (start, end))
+            for ts, _, r in _iter_cursor(cur, 0):
+                yield ts, list(r[1:])
+            return
+        streams = []
+        for i, (table, cols, pos) in enumerate(sources):
+            cur = conn.execute("SELECT ts, %s FROM %s WHERE ts >= ? AND ts < ? ORDER BY ts"
+                               % (", ".join(cols), table), (start, end))
+            streams.append(_iter_cursor(cur, i))
+        for ts, group in itertools.groupby(heapq.merge(*streams), key=lambda x: x[0]):
+            out = [None] * width
+            for _, i, r in group:
+                for p, v in zip(sources[i][2], r[1:]):
+                    out[p] = v
+            yield ts, out
+    finally:
+        conn.close()
+
+def export_stream(args):
+    """(generator bytes, mimetype, nama file); validasi terjadi sebelum streaming."""
+    source = args.get("source", "samples")
+    fmt = args.get("format", "csv")
+    if source not in ("samples", "qc"):
+        raise ValueError("source harus samples atau qc")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError("format harus csv atau ndjson")
+    end = _parse_time_arg(args.get("end"), int(time.time()))
+    start = _parse_time_arg(args.get("start"), end - 86400)
+    keys, sources = _export_sources(
+        source, [k.strip() for k in (args.get("keys") or "").split(",") if k.strip()])
 
-    with schedule_lock:
-        meta = {"loaded_at": schedule_last_loaded, "error": schedule_last_error, "file": SCHEDULE_JSON_FILE}
+    def gen():
+        rows = _export_rows(sources, start, end, len(keys))
+        try:
+            buf = io.StringIO()
+            w = csv.writer(buf, lineterminator="\n")
+            if fmt == "csv":
+                w.writerow(["ts", "datetime"] + keys)
+            n = 0
+            for ts, vals in rows:
+                dt = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+                if fmt == "csv":
+                    w.writerow([ts, dt] + ["" if v is None else v for v in vals])
+                else:
+                    rec = {"ts": ts, "datetime": dt}
+                    rec.update(zip(keys, vals))
+                    buf.write(json.dumps(rec) + "\n")
+                n += 1
+                if n % EXPORT_FETCH == 0:
+                    yield buf.getvalue().encode()
+                    buf.seek(0)
+                    buf.truncate()
+            if buf.tell():
+                yield buf.getvalue().encode()
+        finally:
+            rows.close()
+
+    name = "export_%s_%s_%s.%s" % (source, datetime.fromtimestamp(start).strftime("%Y%m%d"),
+                                   datetime.fromtimestamp(end).strftime("%Y%m%d"), fmt)
+    return gen(), EXPORT_FORMATS[fmt], name
+
+@app.route("/api/export")
+def api_export():
+    try:
+        body, mimetype, name = export_stream(request.args)
+    except ValueError as e:
+        return Response(str(e), status=400, mimetype="text/plain")
+    return Response(body, mimetype=mimetype,
+                    headers={"Content-Disposition": 'attachment; filename="%s"' % name})
+
+# ===== API alert =====
+@app.route("/api/alerts")
+def api_alerts():
+    return jsonify(alert_history(request.args))
+
+@app.route("/api/alerts/active")
+def api_alerts_active():
+    return jsonify(alerts_payload())
+
+# ===== API status =====
+def status_payload():
+    cache = dict(response_cache_stats, entries=len(response_cache))
+    if DASHBOARD_ROLE == "web":
+        return dict(remote_status, state=state_status, response_cache=cache)
+    return {
+        "db_writer": dict(db_writer_status, queue_depth=db_queue.qsize()),
+        "maintenance": maintenance_status,
+        "forward": forward_status,
+        "mqtt": mqtt_status,
+        "ingest": ingest_status,
+        "state": state_status,
+        "response_cache": cache,
+    }
+
+@app.route("/api/status")
+def api_status():
+    return jsonify(status_payload())
+
+# ===== metrics / profiler =====
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@app.route("/metrics")
+def api_metrics():
+    if not METRICS_ENABLED:
+        return Response("Not Found", status=404, mimetype="text/plain")
+    return Response(metrics_text(), content_type=METRICS_CONTENT_TYPE)
 
-    return jsonify({"date": date_str, "operator": op, "lab": lab, "meta": meta})
+def profile_response(args):
+    """(status, body) untuk /debug/profile, dipakai Flask dan ASGI."""
+    try:
+        return 200, profile_for(args.get("seconds", "10"), args.get("format", "top"))
+    except PermissionError:
+        return 404, "Not Found"
+    except RuntimeError as e:
+        return 409, str(e)
+    except ValueError as e:
+        return 400, str(e)
+
+@app.route("/debug/profile")
+def debug_profile():
+    status, body = profile_response(request.args)
+    return Response(body, status=status, mimetype="text/plain")
 
 # ===== SSE stream =====
 @app.route("/events")
 def events():
+    q = sse_subscribe()
+
     def gen():
-        last_qc_sent = None
-        last_qty_sent = None
-        while True:
-            time.sleep(2)
-
-            with data_lock:
-                qty = {"ts": int(latest_ts_epoch or time.time()), "data": dict(latest_data)}
-            with qc_lock:
-                qc = {
-                    "ts": int(time.time()),
-                    "qc_last_update": qc_last_update_dt,
-                    "chlor_last_update": qc_last_update_chlor_dt,
-                    "latest": dict(qc_latest),
-                    "status": dict(qc_status),
-                }
-
-            qty_sig = (qty["ts"], qty["data"].get("TOTAL_FLOW_DST"), qty["data"].get("PRESSURE_DST"), qty["data"].get("LVL_RES_WTP3"))
-            qc_sig = (qc.get("qc_last_update"), qc.get("chlor_last_update"),
-                      qc["latest"].get("kekeruhan", {}).get("value"),
-                      qc["latest"].get("sisa_chlor", {}).get("value"))
-
-            send_qty = (qty_sig != last_qty_sent)
-            send_qc = (qc_sig != last_qc_sent)
-
-            if send_qty or send_qc:
-                msg = {}
-                if send_qty:
-                    msg["qty"] = qty
-                    last_qty_sent = qty_sig
-                if send_qc:
-                    msg["qc"] = qc
-                    last_qc_sent = qc_sig
-
-                yield f"data: {json.dumps(msg)}\n\n"
+        try:
+            yield sse_encode({"qty": qty_payload(), "qc": qc_payload()})
+            while True:
+                try:
+                    data = q.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+                    continue
+                if data is None:
+                    return
+                yield data
+        finally:
+            sse_unsubscribe(q)
 
     headers = {
         "Content-Type": "text/event-stream",
@@ -529,97 +3205,642 @@ def events():
     }
     return Response(gen(), headers=headers)
 
+# ================== DECODER PAYLOAD ==================
+# Satu decoder per topic: peta key mentah -> key kanonik dipelajari sekali
+# (upper-case + cek NUMERIC_KEYS), lalu tiap pesan cukup satu lintasan
+# lookup dict + konversi float tanpa membangun dict upper-case baru.
+DECODER_CACHE_MAX = 256  # topic berbeda yang di-cache
+
+class PayloadDecoder:
+    KEYMAP_MAX = 1024
+    FLOW_KEYS = frozenset(("TOTAL_FLOW_ITK", "TOTAL_FLOW_DST"))
+
+    def __init__(self, ns=""):
+        self.ns = ns
+        self.keys = frozenset(NUMERIC_KEYS)
+        self.keymap = {}
+        self.seen = set()  # key yang pernah ada di pesan topic ini
+        self.present = set()  # key yang ada di pesan terakhir (+ SELISIH_FLOW)
+
+    def _canonical(self, rk):
+        k = str(rk).upper()
+        k = k if k in self.keys else None
+        if len(self.keymap) < self.KEYMAP_MAX:
+            self.keymap[rk] = k
+        return k
+
+    def decode(self, raw, prev):
+        """Kembalikan dict baru (nilai lama dari prev untuk key yang tidak
+        ada / gagal dikonversi) atau None bila tidak ada key yang cocok."""
+        keymap = self.keymap
+        data = dict(prev)
+        present = self.present = set()
+        for rk, v in raw.items():
+            k = keymap.get(rk, False)
+            if k is False:
+                k = self._canonical(rk)
+            if k is None:
+                continue
+            if type(v) is float:
+                data[k] = v
+                present.add(k)
+                continue
+            try:
+                if isinstance(v, str):
+                    v = v.strip().replace(",", ".")
+                data[k] = float(v)
+                present.add(k)
+            except:
+                pass
+
+        if not present:
+            return None
+
+        data["SELISIH_FLOW"] = data["TOTAL_FLOW_ITK"] - data["TOTAL_FLOW_DST"]
+        self.seen |= present
+        if not present.isdisjoint(self.FLOW_KEYS) and self.FLOW_KEYS <= self.seen:
+            present.add("SELISIH_FLOW")
+        return data
+
+_decoders = OrderedDict()  # topic -> PayloadDecoder (LRU), None = topic ditolak
+_auto_stations = set()  # namespace baru dari SUBTOPIC_AS_STATION
+
+def _station_ns(name):
+    return re.sub(r"\W", "_", name, flags=re.ASCII).lower()
+
+def _auto_station_ns(sub):
+    ns = _station_ns(sub)
+    if ns in _auto_stations or ns in sample_namespaces:
+        return ns
+    if len(_auto_stations) >= STATION_MAX:
+        print(f"[MQTT] subtopic {sub!r} ditolak: sudah {STATION_MAX} stasiun (STATION_MAX)")
+        return None
+    _auto_stations.add(ns)
+    return ns
+
+def _decoder_for(topic):
+    try:
+        dec = _decoders[topic]
+        _decoders.move_to_end(topic)
+        return dec
+    except KeyError:
+        pass
+    ns = ""
+    if topic.startswith(TOPIC + "/"):
+        sub = topic[len(TOPIC) + 1:]
+        if sub in STATION_TOPICS:
+            ns = _station_ns(STATION_TOPICS[sub])
+        elif SUBTOPIC_AS_STATION:
+            ns = _auto_station_ns(sub)
+    if len(_decoders) >= DECODER_CACHE_MAX:
+        # hanya topic yang paling lama diam yang dibuang (beserta `seen`-nya)
+        _decoders.popitem(last=False)
+    dec = _decoders[topic] = None if ns is None else PayloadDecoder(ns)
+    return dec
+
+def _unwrap_payload(raw):
+    if isinstance(raw, dict):
+        if "data" in raw and isinstance(raw["data"], dict):
+            raw = raw["data"]
+        elif "payload" in raw and isinstance(raw["payload"], dict):
+            raw = raw["payload"]
+        elif "payload" in raw and isinstance(raw["payload"], str):
+            try:
+                j2 = json.loads(raw["payload"])
+                if isinstance(j2, dict):
+                    raw = j2
+            except:
+                pass
+    return raw if isinstance(raw, dict) else None
+
+def _parse_device_ts(v, now):
+    # epoch detik / milidetik (angka atau string) atau ISO 8601; ISO tanpa
+    # zona waktu dianggap waktu lokal (sama dengan kolom DateTime QC)
+    try:
+        if isinstance(v, str):
+            v = v.strip()
+            try:
+                t = float(v)
+            except ValueError:
+                t = datetime.fromisoformat(v.replace("Z", "+00:00")).timestamp()
+        else:
+            t = float(v)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if t > 1e11:
+        t /= 1000.0
+    if not now - RAW_RETENTION_DAYS * 86400 <= t <= now + DEVICE_TS_MAX_SKEW:
+        return None
+    return int(t)
+
+def _device_ts(raw, outer, now):
+    """ts sampel: timestamp perangkat bila ada dan masuk akal, selain itu
+    waktu terima. Key dicari di record lalu di wrapper-nya."""
+    for src in (raw, outer):
+        if src is None:
+            continue
+        for k in DEVICE_TS_KEYS:
+            v = src.get(k)
+            if v is not None:
+                ts = _parse_device_ts(v, now)
+                if ts is None:
+                    ingest_status["ts_rejected"] += 1
+                    return int(now)
+                ingest_status["device_ts"] += 1
+                return ts
+    return int(now)
+
+# ================== ANALYTICS ==================
+# Tahap analitik inkremental per stasiun, dipanggil on_message sebelum data
+# dipublish: integral volume intake/distribusi (trapesium, reset per shift
+# dan per hari), volume + laju isi/kuras reservoir dari LVL_RES_WTP3, dan
+# ETA ke level minimum/penuh. O(1) per sampel; hasilnya kolom DERIVED_KEYS
+# biasa sehingga ikut tersimpan, di-rollup dan bisa diquery history.
+class ReservoirAnalytics:
+    def __init__(self):
+        self.ts = None
+        self.itk = self.dst = self.vol = 0.0
+        self.rate = 0.0
+        self.day = self.shift = None
+        self.acc = {"VOL_ITK_SHIFT_M3": 0.0, "VOL_DST_SHIFT_M3": 0.0,
+                    "VOL_ITK_DAY_M3": 0.0, "VOL_DST_DAY_M3": 0.0}
+
+    @staticmethod
+    def periods(ts):
+        t = time.localtime(ts)
+        sh = max(h for h in SHIFT_START_HOURS if h <= t.tm_hour)
+        return (_local_epoch(t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0),
+                _local_epoch(t.tm_year, t.tm_mon, t.tm_mday, sh, 0, 0))
+
+    def restore(self, ts, row):
+        # lanjutkan integral shift/hari dari sampel tersimpan terakhir (restart)
+        self.ts = ts
+        self.itk = row.get("TOTAL_FLOW_ITK") or 0.0
+        self.dst = row.get("TOTAL_FLOW_DST") or 0.0
+        self.vol = row.get("RES_VOLUME_M3") or 0.0
+        self.rate = row.get("RES_RATE_LPS") or 0.0
+        self.day, self.shift = self.periods(ts)
+        for k in self.acc:
+            self.acc[k] = row.get(k) or 0.0
+
+    def update(self, ts, data, late=True):
+        if self.ts is not None and ts < self.ts:
+            if late:
+                # sampel terlambat: state tidak dimundurkan; volume dihitung dari
+                # level, laju/ETA/integral periode pada ts itu tidak diketahui
+                data.update(dict.fromkeys(ANALYTICS_KEYS))
+                data["RES_VOLUME_M3"] = data["LVL_RES_WTP3"] * RES_LITER_PER_M / 1000.0
+                return
+            # jam perangkat dikoreksi mundur: mulai lagi dari sampel ini
+            self.ts = None
+            self.rate = 0.0
+        itk = data["TOTAL_FLOW_ITK"]
+        dst = data["TOTAL_FLOW_DST"]
+        vol = data["LVL_RES_WTP3"] * RES_LITER_PER_M / 1000.0
+        day, shift = self.periods(ts)
+        dt = ts - self.ts if self.ts is not None else 0
+
+        for period, start, keys in ((self.day, day, ("VOL_ITK_DAY_M3", "VOL_DST_DAY_M3")),
+                                    (self.shift, shift, ("VOL_ITK_SHIFT_M3", "VOL_DST_SHIFT_M3"))):
+            if period != start:
+                for k in keys:
+                    self.acc[k] = 0.0
+            if 0 < dt <= ANALYTICS_MAX_GAP:
+                # hanya bagian segmen setelah awal periode yang dihitung
+                span = ts - max(self.ts, start)
+                if span > 0:
+                    self.acc[keys[0]] += (self.itk + itk) / 2.0 * span / 1000.0
+                    self.acc[keys[1]] += (self.dst + dst) / 2.0 * span / 1000.0
+
+        if 0 < dt <= ANALYTICS_MAX_GAP:
+            raw = (vol - self.vol) * 1000.0 / dt
+            self.rate += (1.0 - math.exp(-dt / ANALYTICS_RATE_TAU)) * (raw - self.rate)
+        elif dt > ANALYTICS_MAX_GAP:
+            self.rate = 0.0
+
+        if dt >= 0:
+            self.ts, self.day, self.shift = ts, day, shift
+            self.itk, self.dst, self.vol = itk, dst, vol
+
+        data.update(self.acc)
+        data["RES_VOLUME_M3"] = vol
+        data["RES_RATE_LPS"] = self.rate
+        data["RES_ETA_EMPTY_S"] = data["RES_ETA_FULL_S"] = None
+        if self.rate < -ANALYTICS_RATE_DEADBAND:
+            left = (vol - RES_MIN_M * RES_LITER_PER_M / 1000.0) * 1000.0
+            data["RES_ETA_EMPTY_S"] = max(0.0, left / -self.rate)
+        elif self.rate > ANALYTICS_RATE_DEADBAND:
+            data["RES_ETA_FULL_S"] = max(0.0, (RES_TOTAL_M3 - vol) * 1000.0 / self.rate)
+
+analytics_by_ns = {}
+_analytics_restore = {}  # ns -> (ts, kolom) dari DB, dipakai saat analitik dibuat
+
+def analytics_update(ns, ts, data, late=True, level=True):
+    """level: pesan ini membawa LVL_RES_WTP3. Analitik stasiun baru dibuat
+    setelah level pertamanya masuk; sebelum itu kolom analitik tidak diisi."""
+    an = analytics_by_ns.get(ns)
+    if an is None:
+        if not level:
+            for k in ANALYTICS_KEYS:
+                data.pop(k, None)
+            return
+        an = analytics_by_ns[ns] = ReservoirAnalytics()
+        restored = _analytics_restore.pop(ns, None)
+        if restored is not None:
+            an.restore(*restored)
+    an.update(ts, data, late)
+
+def init_analytics():
+    cols = ["TOTAL_FLOW_ITK", "TOTAL_FLOW_DST", "RES_VOLUME_M3", "RES_RATE_LPS"] + list(ReservoirAnalytics().acc)
+    try:
+        with sqlite3.connect(DB_PATH, timeout=10) as conn:
+            for ns in sorted(sample_namespaces):
+                r = conn.execute("SELECT ts, %s FROM %s ORDER BY ts DESC LIMIT 1"
+                                 % (", ".join(_col(c) for c in cols), _samples_table(ns))).fetchone()
+                if r:
+                    _analytics_restore[ns] = (r[0], dict(zip(cols, r[1:])))
+    except Exception as e:
+        print("[ANALYTICS] restore error:", e)
+
+# ================== ALERTS ==================
+# Rule engine di jalur ingest. Tiap aturan menyimpan state detektornya
+# sendiri (konstan, tanpa window sampel):
+#   threshold : di luar [min, max]
+#   roc       : menyimpang dari baseline EMA (tau = window detik) lebih dari
+#               max_drop / max_rise, untuk penurunan/kenaikan mendadak
+#   zscore    : |z| terhadap mean/varian EWMA (alpha) melebihi z
+# Semua detektor menghasilkan "excess" (>0 = melanggar). Alert aktif baru
+# pulih setelah excess <= -hysteresis, dan perubahan state harus bertahan
+# `debounce` sampel berturut-turut. Key "qc.<param>" dievaluasi dari baris QC.
+class AlertRule:
+    TYPES = ("threshold", "roc", "zscore")
+
+    def __init__(self, cfg):
+        self.id = cfg["id"]
+        self.key = cfg["key"]
+        self.type = cfg.get("type", "threshold")
+        if self.type not in self.TYPES:
+            raise ValueError("alert %s: type tidak dikenal %r" % (self.id, self.type))
+        self.lo = cfg.get("min")
+        self.hi = cfg.get("max")
+        self.max_drop = cfg.get("max_drop")
+        self.max_rise = cfg.get("max_rise")
+        self.window = float(cfg.get("window", 300))
+        self.z = float(cfg.get("z", 4.0))
+        self.alpha = float(cfg.get("alpha", 0.02))
+        self.min_samples = int(cfg.get("min_samples", 50))
+        self.hyst = float(cfg.get("hysteresis", 0.0))
+        self.debounce = max(1, int(cfg.get("debounce", 1)))
+        self.severity = cfg.get("severity", "warning")
+
+        self.active = False
+        self.streak = 0
+        self.mean = None
+        self.var = 0.0
+        self.n = 0
+        self.last_ts = None
+
+    def _excess(self, ts, v):
+        ex = float("-inf")
+        if self.type == "threshold":
+            if self.lo is not None:
+                ex = self.lo - v
+            if self.hi is not None:
+                ex = max(ex, v - self.hi)
+            return ex
+
+        if self.type == "roc":
+            if self.mean is None:
+                self.mean = v
+            else:
+                if self.max_drop is not None:
+                    ex = (self.mean - v) - self.max_drop
+                if self.max_rise is not None:
+                    ex = max(ex, (v - self.mean) - self.max_rise)
+                dt = max(ts - self.last_ts, 0)
+                self.mean += (1.0 - math.exp(-dt / self.window)) * (v - self.mean)
+            self.last_ts = ts
+            return ex
+
+        # zscore (EWMA mean/varian, West 1979)
+        if self.mean is None:
+            self.mean = v
+        else:
+            if self.n >= self.min_samples and self.var > 0.0:
+                ex = abs(v - self.mean) / math.sqrt(self.var) - self.z
+            diff = v - self.mean
+            incr = self.alpha * diff
+            self.mean += incr
+            self.var = (1.0 - self.alpha) * (self.var + diff * incr)
+        self.n += 1
+        return ex
+
+    def feed(self, ts, v):
+        """Evaluasi satu sampel; kembalikan event bila state berubah."""
+        ex = self._excess(ts, v)
+        bad = ex > (-self.hyst if self.active else 0.0)
+        if bad == self.active:
+            self.streak = 0
+            return None
+        self.streak += 1
+        if self.streak < self.debounce:
+            return None
+        self.active = bad
+        self.streak = 0
+        return {"id": next(_alert_ids), "ts": int(ts), "rule": self.id, "key": self.key,
+                "state": "raised" if bad else "cleared", "value": v,
+                "severity": self.severity, "type": self.type}
+
+_DECODED_KEYS = frozenset(NUMERIC_KEYS + ["SELISIH_FLOW"])
+
+class AlertEngine:
+    def __init__(self, rules):
+        self.rules = [AlertRule(c) for c in rules]
+        self.by_ns = {}  # ns -> [(KEY, rule)]
+        self.qc = []  # [(param, rule)]
+        self.qc_last_ts = 0
+        for r in self.rules:
+            if r.key.startswith("qc."):
+                self.qc.append((r.key[3:], r))
+            else:
+                ns, base = _split_series(r.key)
+                self.by_ns.setdefault(ns, []).append((base, r))
+
+    def evaluate(self, ns, ts, data, present=None):
+        # present = PayloadDecoder.present: key dekoder yang tidak ada di pesan
+        # masih berisi nilai lama / default 0.0, jadi tidak dievaluasi
+        events = []
+        for key, rule in self.by_ns.get(ns, ()):
+            if present is not None and key in _DECODED_KEYS and key not in present:
+                continue
+            v = data.get(key)
+            if v is not None:
+                ev = rule.feed(ts, v)
+                if ev is not None:
+                    events.append(ev)
+        return events
+
+    def evaluate_qc(self, rows):
+        events = []
+        for r in rows:
+            if r["ts"] <= self.qc_last_ts:
+                continue
+            for param, rule in self.qc:
+                v = r.get(param)
+                if v is not None:
+                    ev = rule.feed(r["ts"], v)
+                    if ev is not None:
+                        events.append(ev)
+            self.qc_last_ts = r["ts"]
+        return events
+
+alert_engine = None
+# id event naik monoton lintas restart; init_alerts melanjutkan dari id
+# tersimpan terbesar (basis milidetik saja bisa bentrok setelah restart cepat
+# atau jam server dikoreksi mundur)
+_alert_ids = itertools.count(int(time.time() * 1000))
+alert_lock = threading.Lock()
+alert_active = {}  # rule id -> event raised terakhir
+alert_recent = deque(maxlen=ALERT_RECENT_MAX)
+sse_alerts = []  # event yang belum dikirim hub SSE
+
+def init_alerts():
+    global alert_engine, _alert_ids
+    try:
+        with sqlite3.connect(DB_PATH, timeout=10) as conn:
+            last_id = conn.execute("SELECT MAX(id) FROM alerts").fetchone()[0] or 0
+    except sqlite3.Error as e:
+        print("[ALERT] baca id terakhir gagal:", e)
+        last_id = 0
+    _alert_ids = itertools.count(max(last_id + 1, int(time.time() * 1000)))
+    rules = ALERT_RULES
+    if ALERT_RULES_FILE:
+        with open(ALERT_RULES_FILE, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+    engine = AlertEngine(rules)
+    with qc_lock:
+        engine.qc_last_ts = qc_rows[-1]["ts"] if qc_rows else 0  # history lama tidak di-alert ulang
+    alert_engine = engine
+
+def alert_emit(events):
+    if not events:
+        return
+    with alert_lock:
+        for ev in events:
+            alert_recent.append(ev)
+            if ev["state"] == "raised":
+                alert_active[ev["rule"]] = ev
+            else:
+                alert_active.pop(ev["rule"], None)
+    for ev in events:
+        metric_alert_events.labels(ev["state"]).inc()
+        print("[ALERT] %s %s %s=%.3f" % (ev["state"], ev["rule"], ev["key"], ev["value"]))
+        try:
+            db_queue.put_nowait(("alert", ev))
+        except queue.Full:
+            db_writer_status["dropped"] += 1
+    with sse_lock:
+        sse_alerts.extend(events)
+    sse_notify("alerts")
+    state_notify("alerts")
+
+def alerts_check_qc():
+    if alert_engine is None:
+        return
+    with qc_lock:
+        i = bisect_right(qc_rows, alert_engine.qc_last_ts, key=lambda r: r["ts"])
+        rows = qc_rows[i:]
+    alert_emit(alert_engine.evaluate_qc(rows))
+
+def alerts_payload():
+    with alert_lock:
+        return {"active": sorted(alert_active.values(), key=lambda e: e["ts"]),
+                "recent": list(alert_recent)}
+
+def alert_history(args):
+    hours = float(args.get("hours", 24))
+    limit = int(args.get("limit", 500))
+    start = int(time.time() - hours * 3600)
+    with sqlite3.connect(DB_PATH, timeout=10) as conn:
+        cur = conn.execute(
+            "SELECT id, ts, rule, key, state, value, severity, type FROM alerts "
+            "WHERE ts >= ? ORDER BY ts DESC, id DESC LIMIT ?", (start, limit))
+        cols = [c[0] for c in cur.description]
+        return [dict(zip(cols, r)) for r in cur]
+
 # ================== MQTT ==================
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
-        print("Connected to MQTT broker")
-        client.subscribe(TOPIC, qos=0)
-        client.subscribe(TOPIC + "/#", qos=0)
+        mqtt_status.update(connected=True, connects=mqtt_status["connects"] + 1, last_error=None,
+                           session_present=bool(flags.get("session present")),
+                           last_connect_dt=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        print("Connected to MQTT broker (session present: %s)" % mqtt_status["session_present"])
+        # subscribe ulang juga saat sesi masih ada di broker (idempoten)
+        client.subscribe([(TOPIC, MQTT_QOS), (TOPIC + "/#", MQTT_QOS)])
     else:
+        mqtt_status["last_error"] = "connect rc=%s" % rc
         print("Failed to connect to MQTT, code:", rc)
 
+def on_disconnect(client, userdata, rc):
+    if mqtt_status["connected"]:
+        mqtt_status["disconnects"] += 1
+    mqtt_status["connected"] = False
+    if rc != 0:
+        mqtt_status["last_error"] = "disconnect rc=%s" % rc
+        print("MQTT disconnected (rc=%s), reconnect dengan backoff" % rc)
+
+_latest_recv = {}  # ns -> waktu terima (monotonic) sampel terbaru terakhir
+
+def _ingest_sample(dec, raw, ts, late_rows=None):
+    """late_rows: list penampung (ts, data) sampel terlambat untuk ring,
+    digabung pemanggil sekali per batch; None = langsung disisipkan."""
+    global last_send_time, latest_data, latest_ts_epoch
+    ns = dec.ns
+    if ns:
+        last_ts, prev = station_latest.get(ns, (0, DEFAULT_DATA))
+    else:
+        last_ts, prev = latest_ts_epoch, latest_data
+    data = dec.decode(raw, prev)
+    if data is None:
+        return
+
+    if METRICS_ENABLED:
+        station_samples[ns] = station_samples.get(ns, 0) + 1
+    # sampel terlambat (store-and-forward perangkat / redelivery) hanya masuk
+    # history: nilai terkini, alert, SSE dan forward tetap dari sampel terbaru.
+    # Lama tanpa sampel terbaru (menurut waktu terima) = jam perangkat mundur.
+    mono = time.monotonic()
+    late = ts < last_ts and mono - _latest_recv.setdefault(ns, mono) < LATE_RESET_AFTER
+    analytics_update(ns, ts, data, late, "LVL_RES_WTP3" in dec.present)
+    if late:
+        ingest_status["late"] += 1
+    else:
+        _latest_recv[ns] = mono
+        if alert_engine is not None:
+            alert_emit(alert_engine.evaluate(ns, ts, data, dec.present))
+        with data_lock:
+            if ns:
+                station_latest[ns] = (ts, data)
+            else:
+                latest_data = data
+                latest_ts_epoch = ts
+
+    if late and late_rows is not None:
+        late_rows.append((ts, data))
+    else:
+        _ring_append(ts, data, ns)
+    save_to_db(ts, data, ns)
+    sample_generation[ns] = next(_generation_counter)
+    state_notify("qty")
+    if ns or late:
+        return
+    sse_notify("qty")
+
+    now = time.time()
+    if now - last_send_time >= SEND_INTERVAL:
+        # Apps Script tetap menerima kolom yang sama seperti sebelumnya
+        forward_enqueue({k: data[k] for k in FORWARD_KEYS})
+        last_send_time = now
+
 def on_message(client, userdata, msg):
-    global last_send_time, latest_ts_epoch
+    global ingest_seq
+    t0 = None
+    if METRICS_ENABLED:
+        ingest_seq += 1
+        if not ingest_seq % METRICS_SAMPLE_EVERY:
+            t0 = time.perf_counter()
     try:
         payload_text = msg.payload.decode(errors="ignore").strip()
         if not payload_text:
             return
 
-        raw = json.loads(payload_text)
-
-        if isinstance(raw, dict):
-            if "data" in raw and isinstance(raw["data"], dict):
-                raw = raw["data"]
-            elif "payload" in raw and isinstance(raw["payload"], dict):
-                raw = raw["payload"]
-            elif "payload" in raw and isinstance(raw["payload"], str):
-                try:
-                    j2 = json.loads(raw["payload"])
-                    if isinstance(j2, dict):
-                        raw = j2
-                except:
-                    pass
-
-        if not isinstance(raw, dict):
-            return
-
-        raw_u = {str(k).upper(): v for k, v in raw.items()}
-
-        with data_lock:
-            prev = dict(latest_data)
-
-        data = {}
-        matched = 0
-        for key in NUMERIC_KEYS:
-            if key in raw_u:
-                v = raw_u.get(key)
-                try:
-                    if isinstance(v, str):
-                        v = v.strip().replace(",", ".")
-                    data[key] = float(v)
-                    matched += 1
-                except:
-                    data[key] = float(prev.get(key, 0.0))
-            else:
-                data[key] = float(prev.get(key, 0.0))
-
-        if matched == 0:
+        dec = _decoder_for(msg.topic)
+        if dec is None:
+            ingest_status["station_rejected"] += 1
             return
-
-        data["SELISIH_FLOW"] = float(data.get("TOTAL_FLOW_ITK", 0.0)) - float(data.get("TOTAL_FLOW_DST", 0.0))
-
-        with data_lock:
-            latest_data.clear()
-            latest_data.update(data)
-            latest_ts_epoch = int(time.time())
-
-        save_to_db(latest_ts_epoch, data)
-
+        obj = json.loads(payload_text)
         now = time.time()
-        if now - last_send_time >= SEND_INTERVAL:
+        records = obj if isinstance(obj, list) else obj.get("data") if isinstance(obj, dict) else None
+        if isinstance(records, list):
+            # batch dari buffer perangkat ({"data": [...]} atau list): urut ts
+            outer = obj if isinstance(obj, dict) else None
+            batch = []
+            for r in records:
+                raw = _unwrap_payload(r)
+                if raw is not None:
+                    batch.append((_device_ts(raw, r if r is not raw else outer, now), raw))
+            batch.sort(key=lambda b: b[0])
+            ingest_status["batches"] += 1
+            late_rows = []
             try:
-                requests.post(WEB_APP_URL, headers={"Content-Type": "application/json"},
-                              data=json.dumps(data), timeout=10)
-            except Exception as e:
-                print("HTTP post error:", e)
-            last_send_time = now
+                for ts, raw in batch:
+                    _ingest_sample(dec, raw, ts, late_rows)
+            finally:
+                if late_rows:
+                    _ring_insert_late(late_rows, dec.ns)
+            return
+
+        raw = _unwrap_payload(obj)
+        if raw is None:
+            return
+        _ingest_sample(dec, raw, _device_ts(raw, obj if obj is not raw else None, now))
 
     except Exception as e:
+        metric_mqtt_errors.inc()
         print("MQTT processing error:", e)
+    finally:
+        if t0 is not None:
+            metric_ingest_seconds.observe(time.perf_counter() - t0)
 
 def mqtt_thread():
-    client = mqtt.Client()
+    client = mqtt.Client(client_id=MQTT_CLIENT_ID, clean_session=MQTT_CLEAN_SESSION)
     client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
     client.on_message = on_message
-    client.connect(BROKER, PORT, 60)
-    client.loop_forever()
+    client.reconnect_delay_set(min_delay=MQTT_RECONNECT_MIN, max_delay=MQTT_RECONNECT_MAX)
+    client.connect_async(BROKER, PORT, MQTT_KEEPALIVE)
+    # broker belum bisa dihubungi saat start juga dicoba ulang dengan backoff
+    client.loop_forever(retry_first_connection=True)
 
 # ================== MAIN ==================
-if __name__ == "__main__":
+_background_started = False
+
+def start_background():
+    global _background_started, state_segment
+    if _background_started:
+        return
+    _background_started = True
+    profiler_install_signal()
+
+    if DASHBOARD_ROLE == "web":
+        # tanpa MQTT/QC/jadwal/writer: semua state datang dari proses ingest
+        load_qc_from_db()
+        threading.Thread(target=state_follower_worker, daemon=True).start()
+        threading.Thread(target=sse_worker, daemon=True).start()
+        return
+
     init_db()
+    prefill_rings()
+    init_analytics()
+    load_qc_from_db()
+    init_alerts()
+    if DASHBOARD_ROLE == "ingest":
+        state_segment = StateSegment(STATE_SEGMENT_PATH, writer=True)
+        threading.Thread(target=state_publisher_worker, daemon=True).start()
+    threading.Thread(target=db_writer_worker, daemon=True).start()
     threading.Thread(target=mqtt_thread, daemon=True).start()
     threading.Thread(target=qc_worker, daemon=True).start()
     threading.Thread(target=schedule_worker, daemon=True).start()
+    threading.Thread(target=maintenance_worker, daemon=True).start()
+    threading.Thread(target=sse_worker, daemon=True).start()
+    threading.Thread(target=forward_worker, daemon=True).start()
+
+if DASHBOARD_ROLE == "web" and __name__ != "__main__":
+    # gunicorn -w N app:app (tanpa --preload): tiap worker mulai follower sendiri
+    start_background()
+
+if __name__ == "__main__":
+    start_background()
 
     port = int(os.environ.get("PORT", "3000"))
     app.run(host="0.0.0.0", port=port, debug=False, threaded=True)
@@ -0,0 +1,276 @@
+# ==========================================================
+# Mode ASGI (asyncio) untuk dashboard:
+#   uvicorn asgi:app --host 0.0.0.0 --port 3000
+#   gunicorn asgi:app -k uvicorn.workers.UvicornWorker -w 1
+#
+# Route sama dengan app.py (Flask), tapi /events berjalan sebagai async
+# generator sehingga ribuan koneksi SSE tidak memakan satu thread per
+# client. Kerja SQLite yang blocking dijalankan di executor berukuran tetap.
+# ==========================================================
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from werkzeug.exceptions import HTTPException
+
+import app as core
+
+ASGI_DB_WORKERS = int(os.environ.get("ASGI_DB_WORKERS", "8"))
+
+executor = ThreadPoolExecutor(max_workers=ASGI_DB_WORKERS, thread_name_prefix="asgi-db")
+
+NO_CACHE_HEADERS = [
+    (b"cache-control", b"no-store, no-cache, must-revalidate, max-age=0"),
+    (b"pragma", b"no-cache"),
+    (b"expires", b"0"),
+]
+REVALIDATE_HEADERS = [(b"cache-control", b"no-cache")]
+IMMUTABLE_HEADERS = [(b"cache-control", core.ASSET_CACHE_CONTROL.encode())]
+
+# ================== SSE fan-out ==================
+# Satu subscriber ke hub app.py per event loop; bytes yang sudah di-encode
+# diteruskan sekali ke loop lalu dibagikan ke asyncio.Queue tiap client.
+class AsyncSSEFanout:
+    def __init__(self):
+        self.clients = set()
+        self.loop = None
+
+    def start(self, loop):
+        self.loop = loop
+        threading.Thread(target=self._bridge, daemon=True).start()
+
+    def _bridge(self):
+        while True:
+            q = core.sse_subscribe()
+            while True:
+                data = q.get()
+                if data is None:  # dievict hub, subscribe ulang
+                    break
+                self.loop.call_soon_threadsafe(self._fanout, data)
+
+    def _fanout(self, data):
+        for aq in list(self.clients):
+            if aq.qsize() >= core.SSE_CLIENT_BACKLOG:
+                self.clients.discard(aq)
+                aq.put_nowait(None)
+                continue
+            aq.put_nowait(data)
+
+    def subscribe(self):
+        aq = asyncio.Queue(maxsize=core.SSE_CLIENT_BACKLOG + 1)
+        self.clients.add(aq)
+        return aq
+
+    def unsubscribe(self, aq):
+        self.clients.discard(aq)
+
+fanout = AsyncSSEFanout()
+
+# ================== helpers ==================
+async def _run_blocking(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, fn, *args)
+
+async def _send(send, status, body, content_type, extra_headers=(), cache_headers=NO_CACHE_HEADERS):
+    headers = [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]
+    headers += cache_headers
+    headers += list(extra_headers)
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+async def _send_json(send, obj, status=200):
+    await _send(send, status, json.dumps(obj).encode(), b"application/json")
+
+def _header(headers, name):
+    return headers.get(name, b"").decode("latin-1")
+
+async def _send_etag(send, headers, entry, cache_headers=REVALIDATE_HEADERS):
+    body, etag, enc = core.negotiate_body(entry, _header(headers, b"accept-encoding"))
+    extra = [(b"etag", etag.encode()), (b"vary", b"Accept, Accept-Encoding")]
+    ctype = entry["ctype"].encode()
+    if core.etag_matches(_header(headers, b"if-none-match"), etag):
+        return await _send(send, 304, b"", ctype, extra, cache_headers)
+    if enc:
+        extra.append((b"content-encoding", enc.encode()))
+    await _send(send, 200, body, ctype, extra, cache_headers)
+
+# label route metrik sama dengan Flask (pola rule, bukan path mentah)
+_url_adapter = core.app.url_map.bind("localhost")
+
+def _route_label(path, method):
+    try:
+        return _url_adapter.match(path, method=method, return_rule=True)[0].rule
+    except HTTPException:
+        return "unmatched"
+
+# ================== routes ==================
+async def _events(receive, send):
+    aq = fanout.subscribe()
+
+    async def watch_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        fanout.unsubscribe(aq)
+        while True:
+            try:
+                aq.put_nowait(None)
+                return
+            except asyncio.QueueFull:
+                aq.get_nowait()  # client sudah pergi; event lama boleh dibuang
+
+    headers = [
+        (b"content-type", b"text/event-stream"),
+        (b"cache-control", b"no-cache"),
+        (b"connection", b"keep-alive"),
+        (b"x-accel-buffering", b"no"),
+    ]
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+
+    async def gen():
+        yield core.sse_encode({"qty": core.qty_payload(), "qc": core.qc_payload()})
+        while True:
+            try:
+                data = await asyncio.wait_for(aq.get(), timeout=core.SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if data is None:
+                return
+            yield data
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        async for chunk in gen():
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    except OSError:
+        pass  # client putus
+    finally:
+        watcher.cancel()
+        fanout.unsubscribe(aq)
+
+async def _export(args, receive, send):
+    body, mimetype, name = core.export_stream(args)
+    headers = [(b"content-type", mimetype.encode()),
+               (b"content-disposition", ('attachment; filename="%s"' % name).encode())]
+    headers += NO_CACHE_HEADERS
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+
+    # send() server (mis. uvicorn) diam saja setelah client putus, jadi
+    # disconnect harus dibaca dari receive() supaya query berhenti
+    gone = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        gone.set()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        # tiap chunk (fetchmany + encode) dikerjakan di executor; chunk yang
+        # sedang jalan ditunggu selesai, generator tidak boleh di-close di tengah
+        while not gone.is_set():
+            chunk = await _run_blocking(next, body, None)
+            if chunk is None:
+                await send({"type": "http.response.body", "body": b""})
+                break
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    except OSError:
+        pass  # client putus
+    finally:
+        watcher.cancel()
+        await _run_blocking(body.close)
+
+async def _dispatch(path, args, headers, receive, send):
+    parts = [p for p in path.split("/") if p]
+
+    if path == "/":
+        # shell + manifest aset di-cache; hanya build pertama yang menyentuh disk
+        return await _send_etag(send, headers, await _run_blocking(core.shell_entry))
+    if path == "/events":
+        return await _events(receive, send)
+    if parts[:1] == ["static"] and len(parts) > 1:
+        entry, immutable = await _run_blocking(core.asset_lookup, "/".join(parts[1:]))
+        if entry is None:
+            return await _send(send, 404, b"Not Found", b"text/plain")
+        return await _send_etag(send, headers, entry, IMMUTABLE_HEADERS if immutable else REVALIDATE_HEADERS)
+
+    if path == "/api/latest":
+        return await _send_json(send, core.qty_payload(args.get("station", "")))
+    if path == "/api/qc/snapshot":
+        # cache miss = filter + serialisasi + kompres jendela QC: di executor
+        return await _send_etag(send, headers, await _run_blocking(core.qc_snapshot_cached, args))
+    if path == "/api/qc/latest":
+        return await _send_json(send, core.qc_payload())
+    if path == "/api/alerts":
+        return await _send_json(send, await _run_blocking(core.alert_history, args))
+    if path == "/api/alerts/active":
+        return await _send_json(send, core.alerts_payload())
+    if path == "/api/status":
+        return await _send_json(send, core.status_payload())
+    if path == "/metrics":
+        if not core.METRICS_ENABLED:
+            return await _send(send, 404, b"Not Found", b"text/plain")
+        return await _send(send, 200, core.metrics_text().encode(), core.METRICS_CONTENT_TYPE.encode())
+    if path == "/debug/profile":
+        status, body = await _run_blocking(core.profile_response, args)
+        return await _send(send, status, body.encode(), b"text/plain")
+    if path == "/api/schedule":
+        return await _send(send, 200, core.schedule_body(args).encode(), b"application/json")
+    if path == "/api/export":
+        return await _export(args, receive, send)
+    if path == "/api/history":
+        entry = await _run_blocking(core.history_multi_cached, args, _header(headers, b"accept"))
+        return await _send_etag(send, headers, entry)
+    if len(parts) == 3 and parts[:2] == ["api", "history"]:
+        entry = await _run_blocking(core.history_cached, parts[2], args, _header(headers, b"accept"))
+        return await _send_etag(send, headers, entry)
+    if len(parts) == 4 and parts[:3] == ["api", "qc", "history"]:
+        entry = await _run_blocking(core.qc_history_cached, parts[3], args)
+        return await _send_etag(send, headers, entry)
+    if len(parts) == 4 and parts[:3] == ["api", "qc", "last"]:
+        entry = await _run_blocking(core.qc_last_cached, parts[3], args)
+        return await _send_etag(send, headers, entry)
+
+    await _send(send, 404, b"Not Found", b"text/plain")
+
+async def _lifespan(receive, send):
+    while True:
+        msg = await receive()
+        if msg["type"] == "lifespan.startup":
+            core.profiler_install_signal()  # handler sinyal hanya bisa dari main thread
+            if os.environ.get("DASHBOARD_BACKGROUND", "1") != "0":
+                await _run_blocking(core.start_background)
+            fanout.start(asyncio.get_running_loop())
+            await send({"type": "lifespan.startup.complete"})
+        elif msg["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+def _timed_send(send, path, method):
+    t0 = time.perf_counter()
+
+    async def timed(msg):
+        if msg["type"] == "http.response.start":
+            core.metrics_observe_http(_route_label(path, method), method, msg["status"],
+                                      time.perf_counter() - t0)
+        await send(msg)
+    return timed
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+    headers = dict(scope.get("headers") or [])
+    if core.METRICS_ENABLED:
+        send = _timed_send(send, scope["path"], scope.get("method", "GET"))
+    try:
+        await _dispatch(scope["path"], args, headers, receive, send)
+    except (ValueError, TypeError) as e:
+        await _send(send, 400, str(e).encode(), b"text/plain")
@@ -0,0 +1,72 @@
+# ==========================================================
+# Micro-benchmark AlertEngine.evaluate: banyak stasiun x rule
+# (threshold/roc/zscore) diumpankan sampel sintetis, ukur sampel/s dan
+# jumlah event yang keluar (harus sedikit berkat hysteresis/debounce).
+#
+#   python bench/alerts.py --samples 200000 --stations 8
+# ==========================================================
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+def station_rules(stations):
+    rules = []
+    for st in range(stations):
+        ns = "" if st == 0 else "st%d" % st
+        for cfg in app.ALERT_RULES:
+            if cfg["key"].startswith("qc."):
+                continue
+            c = dict(cfg)
+            c["id"] = "%s@%s" % (cfg["id"], ns or "default")
+            c["key"] = app._series_key(ns, cfg["key"])
+            rules.append(c)
+    return rules
+
+
+def synthetic_samples(n, stations, seed=1):
+    rnd = random.Random(seed)
+    out = []
+    p = [2.0] * stations
+    for i in range(n):
+        st = i % stations
+        p[st] += rnd.gauss(0, 0.02) + (2.0 - p[st]) * 0.01
+        if rnd.random() < 0.0005:
+            p[st] -= 1.6  # drop mendadak
+        itk = 120 + rnd.gauss(0, 2)
+        dst = 110 + rnd.gauss(0, 2)
+        data = {"PRESSURE_DST": p[st], "TOTAL_FLOW_ITK": itk, "TOTAL_FLOW_DST": dst,
+                "SELISIH_FLOW": itk - dst}
+        out.append(("" if st == 0 else "st%d" % st, 1700000000 + i // stations, data))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--samples", type=int, default=200000)
+    ap.add_argument("--stations", type=int, default=8)
+    args = ap.parse_args()
+
+    rules = station_rules(args.stations)
+    samples = synthetic_samples(args.samples, args.stations)
+    engine = app.AlertEngine(rules)
+
+    t0 = time.perf_counter()
+    events = 0
+    for ns, ts, data in samples:
+        events += len(engine.evaluate(ns, ts, data))
+    dt = time.perf_counter() - t0
+
+    n = len(samples)
+    print("samples=%d stations=%d rules=%d (1 core)" % (n, args.stations, len(rules)))
+    print("%-10s %10.1f ms %10.0f samples/s %8.2f us/sample" % ("evaluate", dt * 1000, n / dt, dt / n * 1e6))
+    print("events     %d" % events)
+
+
+if __name__ == "__main__":
+    main()
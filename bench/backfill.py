@@ -0,0 +1,116 @@
+# ==========================================================
+# Benchmark burst backfill ke writer SQLite: N sampel (ts perangkat ke
+# belakang, sebagian out-of-order, sebagian redelivery QoS 1) masuk antrian
+# sekaligus seperti setelah reconnect sesi persisten. Dibandingkan dengan
+# satu transaksi per pesan. Hasil DB dicek: tiap ts tepat satu baris dan
+# count rollup 1 menit = jumlah sampel unik.
+#
+#   python bench/backfill.py --samples 100000 --dup 0.05 --shuffle 0.1
+# ==========================================================
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+def burst(n, dup, shuffle, seed=1):
+    rnd = random.Random(seed)
+    now = int(time.time())
+    base = {k: 0.0 for k in app.SAMPLE_KEYS}
+    items = []
+    for i in range(n):
+        d = dict(base, PRESSURE_DST=2.0 + rnd.gauss(0, 0.05), TOTAL_FLOW_ITK=500.0 + i % 50)
+        items.append(("sample", now - n + i, d, ""))
+        if rnd.random() < dup:
+            items.append(items[-1])  # redelivery: pesan sama dikirim ulang
+    # sebagian kecil datang terlambat (urutan acak dalam jendela 60 sampel)
+    for i in range(0, len(items) - 60, 60):
+        if rnd.random() < shuffle:
+            win = items[i:i + 60]
+            rnd.shuffle(win)
+            items[i:i + 60] = win
+    return items
+
+
+def fresh_db(workdir, name):
+    app.DB_PATH = os.path.join(workdir, name)
+    app.sample_namespaces.clear()
+    app.sample_namespaces.add("")
+    app._committed_max_ts.clear()
+    app.init_db()
+
+
+def per_message(items):
+    conn = app._db_connect()
+    t0 = time.perf_counter()
+    for it in items:
+        app._write_batch(conn, [it])
+    dt = time.perf_counter() - t0
+    conn.close()
+    return dt
+
+
+def bulk(items):
+    for it in items:
+        app.db_queue.put_nowait(it)
+    t0 = time.perf_counter()
+    threading.Thread(target=app.db_writer_worker, daemon=True).start()
+    while app.db_writer_status["written"] + app.db_writer_status["duplicates"] < len(items):
+        time.sleep(0.01)
+    return time.perf_counter() - t0
+
+
+def check(unique):
+    with sqlite3.connect(app.DB_PATH) as conn:
+        rows, distinct = conn.execute("SELECT COUNT(*), COUNT(DISTINCT ts) FROM samples").fetchone()
+        cnt = conn.execute("SELECT SUM(cnt) FROM rollup_60 WHERE key = 'PRESSURE_DST'").fetchone()[0]
+    return rows == distinct == unique and cnt == unique, rows, cnt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--samples", type=int, default=100000)
+    ap.add_argument("--dup", type=float, default=0.05, help="fraksi pesan yang dikirim ulang")
+    ap.add_argument("--shuffle", type=float, default=0.1, help="fraksi jendela 60 sampel yang diacak")
+    ap.add_argument("--per-message", type=int, default=5000, help="sampel untuk jalur 1 transaksi/pesan")
+    args = ap.parse_args()
+
+    items = burst(args.samples, args.dup, args.shuffle)
+    unique = len({it[1] for it in items})
+    workdir = tempfile.mkdtemp(prefix="backfill_")
+    db_path = app.DB_PATH
+    try:
+        app.db_queue.maxsize = 0
+        sub = burst(args.per_message, args.dup, args.shuffle)
+        fresh_db(workdir, "per_message.db")
+        t_one = per_message(sub)
+        ok_one = check(len({it[1] for it in sub}))[0]
+
+        app.db_writer_status.update(written=0, duplicates=0, late=0, batches=0)
+        fresh_db(workdir, "bulk.db")
+        t_bulk = bulk(items)
+        ok, rows, cnt = check(unique)
+
+        print("items=%d unique_ts=%d dup=%.2f shuffle=%.2f" % (len(items), unique, args.dup, args.shuffle))
+        print("%-12s %9d items %9.1f ms %10.0f items/s  ok=%s" % (
+            "per-message", len(sub), t_one * 1000, len(sub) / t_one, ok_one))
+        print("%-12s %9d items %9.1f ms %10.0f items/s  ok=%s batches=%d" % (
+            "bulk", len(items), t_bulk * 1000, len(items) / t_bulk, ok, app.db_writer_status["batches"]))
+        print("rows=%d rollup_cnt=%d late=%d duplicates=%d" % (
+            rows, cnt or 0, app.db_writer_status["late"], app.db_writer_status["duplicates"]))
+    finally:
+        app.db_queue.queue.clear()  # flush_db atexit tidak menulis ke DB yang sudah dihapus
+        app.DB_PATH = db_path
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
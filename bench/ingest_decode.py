@@ -0,0 +1,143 @@
+# ==========================================================
+# Micro-benchmark normalisasi payload MQTT: jalur lama (dict upper-case +
+# lock-copy prev per pesan) vs PayloadDecoder di app.py, plus on_message
+# end-to-end (ring buffer + enqueue ke writer) per topic/stasiun.
+#
+#   python bench/ingest_decode.py --messages 200000 --stations 4
+# ==========================================================
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="decode_bench_"))
+import app  # noqa: E402
+
+
+# ---- salinan normalisasi lama (sebelum PayloadDecoder) ----
+legacy_lock = threading.Lock()
+legacy_latest = app.DEFAULT_DATA.copy()
+
+
+def legacy_normalize(raw):
+    raw_u = {str(k).upper(): v for k, v in raw.items()}
+
+    with legacy_lock:
+        prev = dict(legacy_latest)
+
+    data = {}
+    matched = 0
+    for key in app.NUMERIC_KEYS:
+        if key in raw_u:
+            v = raw_u.get(key)
+            try:
+                if isinstance(v, str):
+                    v = v.strip().replace(",", ".")
+                data[key] = float(v)
+                matched += 1
+            except:
+                data[key] = float(prev.get(key, 0.0))
+        else:
+            data[key] = float(prev.get(key, 0.0))
+
+    if matched == 0:
+        return None
+
+    data["SELISIH_FLOW"] = float(data.get("TOTAL_FLOW_ITK", 0.0)) - float(data.get("TOTAL_FLOW_DST", 0.0))
+
+    with legacy_lock:
+        legacy_latest.clear()
+        legacy_latest.update(data)
+    return data
+
+
+def new_normalize(raw, dec=app.PayloadDecoder()):
+    global new_latest
+    data = dec.decode(raw, new_latest)
+    if data is not None:
+        new_latest = data
+    return data
+
+
+new_latest = app.DEFAULT_DATA.copy()
+
+
+def synthetic_payloads(n, seed=1):
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        raw = {}
+        for k in app.NUMERIC_KEYS:
+            if rnd.random() < 0.8:
+                v = rnd.uniform(0, 500)
+                # perangkat lapangan kirim campuran angka, string koma, dan key lowercase
+                if i % 3 == 0:
+                    v = ("%.2f" % v).replace(".", ",")
+                raw[k.lower() if i % 5 == 0 else k] = v
+        raw["RSSI"] = -70
+        out.append(raw)
+    return out
+
+
+def bench(fn, payloads):
+    t0 = time.perf_counter()
+    results = [fn(raw) for raw in payloads]
+    return time.perf_counter() - t0, results
+
+
+class Msg:
+    pass
+
+
+def bench_on_message(payloads, stations):
+    msgs = []
+    for i, raw in enumerate(payloads):
+        m = Msg()
+        st = i % stations
+        m.topic = app.TOPIC if st == 0 else "%s/st%d" % (app.TOPIC, st)
+        m.payload = json.dumps({"data": raw}).encode()
+        msgs.append(m)
+
+    app.SUBTOPIC_AS_STATION = True
+    app.SEND_INTERVAL = float("inf")
+    app.db_queue.maxsize = 0  # writer tidak jalan di benchmark, jangan drop
+    t0 = time.perf_counter()
+    for m in msgs:
+        app.on_message(None, None, m)
+    dt = time.perf_counter() - t0
+    # antrian writer hanya diukur, bukan ditulis (flush_db saat exit)
+    app.db_queue.queue.clear()
+    return dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=200000)
+    ap.add_argument("--stations", type=int, default=4)
+    args = ap.parse_args()
+
+    payloads = synthetic_payloads(args.messages)
+    t_old, out_old = bench(legacy_normalize, payloads)
+    t_new, out_new = bench(new_normalize, payloads)
+    n = len(payloads)
+
+    print("messages=%d stations=%d (1 core)" % (n, args.stations))
+    print("%-12s %10.1f ms %10.0f msg/s" % ("legacy", t_old * 1000, n / t_old))
+    print("%-12s %10.1f ms %10.0f msg/s" % ("decoder", t_new * 1000, n / t_new))
+    # decoder juga membawa kolom analitik dari prev; bandingkan kolom lama saja
+    same = all((old is None and new is None) or
+               (old is not None and new is not None and {k: new[k] for k in old} == old)
+               for old, new in zip(out_old, out_new))
+    print("speedup      %.1fx  identical=%s" % (t_old / t_new, same))
+
+    t_e2e = bench_on_message(payloads, args.stations)
+    print("%-12s %10.1f ms %10.0f msg/s" % ("on_message", t_e2e * 1000, n / t_e2e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+# ==========================================================
+# Load test end-to-end dengan stand-in lokal (bench/standins.py):
+# broker MQTT mini, CSV QC palsu, dan WEB_APP_URL palsu. Server app
+# (Flask threaded atau ASGI) jalan sebagai subprocess dengan semua worker
+# background aktif (writer DB, pull QC, forward, jadwal, SSE).
+#
+#   python bench/loadtest.py --rate 200 --stations 4 --clients 16 --sse 50 --duration 30
+#   python bench/loadtest.py --server asgi --transport inject --rate 2000
+#   python bench/loadtest.py --replay telemetry.jsonl --save base.json
+#   python bench/loadtest.py --compare base.json
+#   python bench/loadtest.py --rate 50 --duration 60 --outage 10:20
+#
+# --transport mqtt   : publisher paho -> MiniBroker -> client paho di app
+# --transport inject : feeder di proses server memanggil on_message langsung
+# --replay FILE      : JSONL, tiap baris {"topic": ..., "payload": {...}} atau
+#                      payload saja (topic utama); diulang terus pada --rate
+# --outage AT:SEC    : AT detik setelah pengukuran mulai, broker memutus client
+#                      app dan menolak reconnect selama SEC detik; publisher
+#                      QoS 1 jalan terus sehingga sesi persisten menumpuk lalu
+#                      dikirim sebagai burst backfill (ts perangkat di payload)
+#
+# Laporan: throughput ingest (terkirim / diterima / ditulis DB), latensi
+# ingest dari histogram /metrics, p50/p99 per endpoint HTTP, event SSE,
+# pertumbuhan DB dan RSS server (output server ke <workdir>/server.log).
+# --save menyimpan hasil sebagai baseline, --compare mencetak selisih
+# terhadap baseline.
+# ==========================================================
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from standins import FakeSheets, MiniBroker
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "history=4,qc=2,schedule=1,latest=2"
+HISTORY_KEYS = ["PRESSURE_DST", "TOTAL_FLOW_ITK", "LVL_RES_WTP3", "SELISIH_FLOW"]
+
+
+# ---------------- telemetry ----------------
+def telemetry(topic, stations, seed=1, replay=None):
+    """Generator (topic, payload bytes) tanpa akhir."""
+    if replay:
+        with open(replay) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        for i in range(sys.maxsize):
+            rec = records[i % len(records)]
+            if "payload" in rec:
+                yield rec.get("topic") or topic, json.dumps(rec["payload"]).encode()
+            else:
+                yield topic, json.dumps(rec).encode()
+
+    rnd = random.Random(seed)
+    level = [4.0 + s * 0.3 for s in range(stations)]
+    for i in range(sys.maxsize):
+        st = i % stations
+        t = i / float(stations)
+        itk = 520 + 40 * math.sin(t / 300.0) + rnd.gauss(0, 3)
+        dst = 500 + 60 * math.sin(t / 240.0 + st) + rnd.gauss(0, 3)
+        level[st] = min(7.9, max(0.5, level[st] + (itk - dst) * 1e-5))
+        payload = {
+            "ts": int(time.time() * 1000),  # timestamp perangkat (ms) saat publish
+            "PRESSURE_DST": round(2.4 + 0.3 * math.sin(t / 60.0) + rnd.gauss(0, 0.02), 3),
+            "LVL_RES_WTP3": round(level[st], 3),
+            "TOTAL_FLOW_ITK": round(itk, 2),
+            "TOTAL_FLOW_DST": round(dst, 2),
+            "FLOW_WTP3": round(dst * 0.4, 2),
+            "FLOW_50_WTP1": round(dst * 0.1, 2),
+            "FLOW_CIJERUK": round(dst * 0.3, 2),
+            "FLOW_CARENANG": round(dst * 0.2, 2),
+        }
+        yield (topic if st == 0 else "%s/st%d" % (topic, st)), json.dumps(payload).encode()
+
+
+def paced(rate, stop):
+    """Yield tiap 1/rate detik (dikejar dalam batch bila tertinggal)."""
+    interval = 1.0 / rate
+    nxt = time.perf_counter()
+    while not stop.is_set():
+        now = time.perf_counter()
+        if now < nxt:
+            time.sleep(min(nxt - now, 0.05))
+            continue
+        nxt += interval
+        if now - nxt > 1.0:
+            nxt = now  # tertinggal jauh: jangan kirim burst tak terbatas
+        yield
+
+
+# ---------------- server subprocess ----------------
+class Msg:
+    pass
+
+
+def serve(cfg):
+    sys.path.insert(0, ROOT)
+    os.chdir(cfg["workdir"])
+    os.environ["DASHBOARD_BACKGROUND"] = "0"  # lifespan ASGI tidak start ulang
+    import app as core
+
+    core.BROKER, core.PORT = "127.0.0.1", cfg["broker_port"]
+    core.QC_CSV_URL = cfg["qc_url"]
+    core.QC_PULL_INTERVAL = cfg["qc_pull"]
+    core.WEB_APP_URL = cfg["post_url"]
+    core.SEND_INTERVAL = cfg["send_interval"]
+    core.SCHEDULE_DIR = ROOT
+    core.SUBTOPIC_AS_STATION = cfg["stations"] > 1
+    core.MQTT_CLIENT_ID = cfg["client_id"]
+    core.MQTT_RECONNECT_MAX = 2
+
+    if cfg["transport"] == "inject":
+        def feeder():
+            stop = threading.Event()
+            gen = telemetry(core.TOPIC, cfg["stations"], cfg["seed"], cfg["replay"])
+            for _ in paced(cfg["rate"], stop):
+                m = Msg()
+                m.topic, m.payload = next(gen)
+                core.on_message(None, None, m)
+        core.mqtt_thread = feeder
+    core.start_background()
+
+    if cfg["server"] == "flask":
+        import logging
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        make_server("127.0.0.1", cfg["port"], core.app, threaded=True).serve_forever()
+    else:
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.app, host="127.0.0.1", port=cfg["port"], log_level="warning", backlog=4096)
+
+
+# ---------------- pengukuran ----------------
+def rss_kb(pid):
+    try:
+        with open("/proc/%d/status" % pid) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def db_bytes(workdir):
+    return sum(os.path.getsize(os.path.join(workdir, "history.db" + sfx))
+               for sfx in ("", "-wal") if os.path.exists(os.path.join(workdir, "history.db" + sfx)))
+
+
+def parse_metrics(text):
+    out = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            out[name] = float(value)
+    return out
+
+
+def hist_quantile(before, after, name, q):
+    """Kuantil kasar (batas atas bucket) dari selisih dua scrape histogram."""
+    buckets = []
+    for k, v in after.items():
+        if k.startswith(name + "_bucket{") and 'le="' in k:
+            le = k.split('le="')[1].split('"')[0]
+            buckets.append((float("inf") if le == "+Inf" else float(le), v - before.get(k, 0.0)))
+    buckets.sort()
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    target = q * buckets[-1][1]
+    for le, cum in buckets:
+        if cum >= target:
+            return le
+    return None
+
+
+def pct(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * q))]
+
+
+async def http_get(port, path):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(("GET %s HTTP/1.1\r\nHost: x\r\nAccept-Encoding: gzip\r\nConnection: close\r\n\r\n"
+                      % path).encode())
+        await writer.drain()
+        data = await reader.read()
+    finally:
+        writer.close()
+    return int(data.split(b" ", 2)[1]), data
+
+
+def endpoint_path(kind, rnd):
+    if kind == "history":
+        return "/api/history/%s?hours=%d" % (rnd.choice(HISTORY_KEYS), rnd.choice([1, 6, 24, 168]))
+    if kind == "qc":
+        return "/api/qc/history/%s?hours=%d" % (rnd.choice(["ph", "kekeruhan", "sisa_chlor"]), rnd.choice([24, 168, 720]))
+    if kind == "schedule":
+        return "/api/schedule?date=2026-%02d-%02d" % (rnd.randint(1, 12), rnd.randint(1, 28))
+    return "/api/latest"
+
+
+async def api_client(port, mix, rnd, stop, results):
+    kinds = [k for k, w in mix for _ in range(w)]
+    while not stop.is_set():
+        kind = rnd.choice(kinds)
+        t0 = time.perf_counter()
+        try:
+            status, _ = await http_get(port, endpoint_path(kind, rnd))
+        except OSError:
+            status = 0
+        rec = results.get("recording")
+        if rec is not None:
+            rec.setdefault(kind, []).append(((time.perf_counter() - t0) * 1000.0, status))
+
+
+async def sse_client(port, stop, counter):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /events HTTP/1.1\r\nHost: x\r\nAccept: text/event-stream\r\n\r\n")
+    await writer.drain()
+    try:
+        while not stop.is_set():
+            try:
+                chunk = await asyncio.wait_for(reader.read(65536), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            if not chunk:
+                break
+            counter[0] += chunk.count(b"data:")
+    except OSError:
+        pass
+    finally:
+        writer.close()
+
+
+def mqtt_publisher(broker_port, args, stop, sent):
+    sys.path.insert(0, ROOT)
+    import paho.mqtt.client as mqtt
+    from app import TOPIC
+
+    client = mqtt.Client()
+    client.connect("127.0.0.1", broker_port, 60)
+    client.loop_start()
+    gen = telemetry(TOPIC, args.stations, args.seed, args.replay)
+    for _ in paced(args.rate, stop):
+        topic, payload = next(gen)
+        client.publish(topic, payload, qos=args.pub_qos)
+        sent[0] += 1
+    client.loop_stop()
+    client.disconnect()
+
+
+async def scrape(port):
+    status, data = await http_get(port, "/metrics")
+    return parse_metrics(data.split(b"\r\n\r\n", 1)[1].decode()) if status == 200 else {}
+
+
+async def run(args):
+    workdir = args.workdir or os.path.join("/tmp", "loadtest_%s" % args.server)
+    if os.path.isdir(workdir) and not args.keep_db:
+        shutil.rmtree(workdir)
+    os.makedirs(workdir, exist_ok=True)
+
+    broker = MiniBroker().start()
+    sheets = FakeSheets(rows=args.qc_rows, qc_every=args.qc_every, post_latency=args.post_latency,
+                        seed=args.seed).start()
+    cfg = {"server": args.server, "port": args.port, "workdir": workdir, "transport": args.transport,
+           "broker_port": broker.port, "qc_url": sheets.url("/qc.csv"), "qc_pull": args.qc_pull,
+           "post_url": sheets.url("/exec"), "send_interval": args.send_interval, "rate": args.rate,
+           "stations": args.stations, "seed": args.seed, "replay": args.replay,
+           "client_id": "loadtest-dashboard"}
+    log = open(os.path.join(workdir, "server.log"), "w")
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", json.dumps(cfg)],
+                            stdout=log, stderr=subprocess.STDOUT)
+
+    stop_pub = threading.Event()
+    sent = [0]
+    stop_clients = asyncio.Event()
+    results = {}
+    sse_events = [0]
+    try:
+        for _ in range(200):
+            try:
+                await http_get(args.port, "/api/latest")
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+        if args.transport == "mqtt":
+            threading.Thread(target=mqtt_publisher, args=(broker.port, args, stop_pub, sent), daemon=True).start()
+
+        mix = [(k, int(w)) for k, w in (p.split("=") for p in args.mix.split(",") if p)]
+        rnd = random.Random(args.seed)
+        tasks = [asyncio.ensure_future(sse_client(args.port, stop_clients, sse_events)) for _ in range(args.sse)]
+        tasks += [asyncio.ensure_future(api_client(args.port, mix, random.Random(rnd.random()), stop_clients, results))
+                  for _ in range(args.clients)]
+
+        await asyncio.sleep(args.warmup)
+        m0, sent0, sse0, sheets0 = await scrape(args.port), sent[0], sse_events[0], dict(sheets.stats)
+        db0, rss0 = db_bytes(workdir), rss_kb(proc.pid)
+        rss_peak = rss0
+        results["recording"] = {}
+        outage = [float(x) for x in args.outage.split(":")] if args.outage else None
+        t_start = time.perf_counter()
+        while time.perf_counter() - t_start < args.duration:
+            await asyncio.sleep(0.5)
+            rss_peak = max(rss_peak, rss_kb(proc.pid))
+            if outage and time.perf_counter() - t_start >= outage[0]:
+                broker.block(cfg["client_id"], outage[1])
+                outage = None
+        elapsed = time.perf_counter() - t_start
+        rec = results.pop("recording")
+        m1, sent1, sse1 = await scrape(args.port), sent[0], sse_events[0]
+        db1, rss1 = db_bytes(workdir), rss_kb(proc.pid)
+
+        stop_clients.set()
+        stop_pub.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+
+    def delta(name):
+        return m1.get(name, 0.0) - m0.get(name, 0.0)
+
+    received = delta("dashboard_mqtt_messages_total")
+    written = delta("dashboard_db_rows_written_total")
+    p50 = hist_quantile(m0, m1, "dashboard_ingest_seconds", 0.5)
+    p99 = hist_quantile(m0, m1, "dashboard_ingest_seconds", 0.99)
+    report = {
+        "config": {k: getattr(args, k) for k in ("server", "transport", "rate", "stations", "clients", "sse",
+                                                 "duration", "mix", "replay", "outage")},
+        "ingest": {
+            "sent_per_s": (sent1 - sent0) / elapsed if args.transport == "mqtt" else None,
+            "received_per_s": received / elapsed,
+            "written_per_s": written / elapsed,
+            "dropped": delta("dashboard_db_rows_dropped_total"),
+            "queue_depth_end": m1.get("dashboard_db_queue_depth"),
+            "p50_ms_le": p50 * 1000 if p50 is not None else None,
+            "p99_ms_le": p99 * 1000 if p99 is not None else None,
+        },
+        "mqtt": {"connects": delta("dashboard_mqtt_connects_total"),
+                 "disconnects": delta("dashboard_mqtt_disconnects_total"),
+                 "broker_queued": broker.stats["queued"], "broker_refused": broker.stats["refused"],
+                 "late": delta("dashboard_ingest_late_total"),
+                 "ts_rejected": delta("dashboard_ingest_ts_rejected_total"),
+                 "duplicates": delta("dashboard_db_rows_duplicate_total")},
+        "http": {},
+        "sse": {"connections": args.sse, "events_per_s": (sse1 - sse0) / elapsed},
+        "upstream": {"qc_gets": sheets.stats["qc_gets"] - sheets0["qc_gets"],
+                     "qc_304": sheets.stats["qc_304"] - sheets0["qc_304"],
+                     "forward_posts": sheets.stats["posts"] - sheets0["posts"],
+                     "forward_samples": sheets.stats["posted_samples"] - sheets0["posted_samples"]},
+        "db": {"start_bytes": db0, "end_bytes": db1, "growth_bytes": db1 - db0,
+               "bytes_per_sample": (db1 - db0) / written if written else None},
+        "rss_mb": {"start": rss0 / 1024.0, "end": rss1 / 1024.0, "peak": rss_peak / 1024.0},
+        "elapsed_s": elapsed,
+        "server_log": log.name,
+    }
+    for kind, samples in sorted(rec.items()):
+        lat = sorted(ms for ms, _ in samples)
+        report["http"][kind] = {
+            "requests": len(samples), "rps": len(samples) / elapsed,
+            "p50_ms": pct(lat, 0.5), "p99_ms": pct(lat, 0.99), "max_ms": lat[-1] if lat else None,
+            "errors": sum(1 for _, st in samples if st not in (200, 304)),
+        }
+    return report
+
+
+# ---------------- laporan ----------------
+def _fmt(v, spec="%.2f"):
+    return "-" if v is None else spec % v
+
+
+def print_report(r):
+    c = r["config"]
+    print("server=%s transport=%s rate=%s/s stations=%d clients=%d sse=%d duration=%.0fs" % (
+        c["server"], c["transport"], c["rate"], c["stations"], c["clients"], c["sse"], r["elapsed_s"]))
+    i = r["ingest"]
+    print("ingest   sent=%s/s received=%s/s written=%s/s dropped=%d queue_end=%s p50<=%sms p99<=%sms" % (
+        _fmt(i["sent_per_s"], "%.1f"), _fmt(i["received_per_s"], "%.1f"), _fmt(i["written_per_s"], "%.1f"),
+        i["dropped"], _fmt(i["queue_depth_end"], "%d"), _fmt(i["p50_ms_le"], "%.3g"), _fmt(i["p99_ms_le"], "%.3g")))
+    q = r["mqtt"]
+    print("mqtt     connects=%d disconnects=%d broker_queued=%d refused=%d late=%d ts_rejected=%d dup=%d" % (
+        q["connects"], q["disconnects"], q["broker_queued"], q["broker_refused"], q["late"], q["ts_rejected"],
+        q["duplicates"]))
+    print("%-10s %9s %9s %9s %9s %9s %7s" % ("endpoint", "requests", "rps", "p50_ms", "p99_ms", "max_ms", "errors"))
+    for kind, h in r["http"].items():
+        print("%-10s %9d %9.1f %9s %9s %9s %7d" % (kind, h["requests"], h["rps"], _fmt(h["p50_ms"]),
+                                                   _fmt(h["p99_ms"]), _fmt(h["max_ms"]), h["errors"]))
+    print("sse      conns=%d events=%.1f/s" % (r["sse"]["connections"], r["sse"]["events_per_s"]))
+    u = r["upstream"]
+    print("upstream qc_gets=%d (304=%d) forward_posts=%d forward_samples=%d" % (
+        u["qc_gets"], u["qc_304"], u["forward_posts"], u["forward_samples"]))
+    d = r["db"]
+    print("db       start=%.1fMB end=%.1fMB growth=%.1fKB (%s B/sampel)" % (
+        d["start_bytes"] / 1e6, d["end_bytes"] / 1e6, d["growth_bytes"] / 1e3, _fmt(d["bytes_per_sample"], "%.0f")))
+    m = r["rss_mb"]
+    print("rss      start=%.1fMB end=%.1fMB peak=%.1fMB" % (m["start"], m["end"], m["peak"]))
+    print("log      %s" % r["server_log"])
+
+
+def print_compare(base, cur):
+    # angka utama saja; positif = naik terhadap baseline
+    rows = [("ingest received/s", ("ingest", "received_per_s")), ("ingest written/s", ("ingest", "written_per_s")),
+            ("ingest p99 ms", ("ingest", "p99_ms_le")), ("sse events/s", ("sse", "events_per_s")),
+            ("db growth bytes", ("db", "growth_bytes")), ("rss peak MB", ("rss_mb", "peak"))]
+    for kind in cur["http"]:
+        rows += [("%s rps" % kind, ("http", kind, "rps")), ("%s p50 ms" % kind, ("http", kind, "p50_ms")),
+                 ("%s p99 ms" % kind, ("http", kind, "p99_ms"))]
+    print("%-22s %12s %12s %9s" % ("vs baseline", "base", "now", "change"))
+    for label, path in rows:
+        b, n = base, cur
+        for p in path:
+            b = b.get(p, {}) if isinstance(b, dict) else None
+            n = n.get(p, {}) if isinstance(n, dict) else None
+        if not isinstance(b, (int, float)) or not isinstance(n, (int, float)):
+            continue
+        change = "%+8.1f%%" % ((n - b) / b * 100.0) if b else "-"
+        print("%-22s %12.2f %12.2f %9s" % (label, b, n, change))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--server", choices=["flask", "asgi"], default="flask")
+    ap.add_argument("--transport", choices=["mqtt", "inject"], default="mqtt")
+    ap.add_argument("--rate", type=float, default=100.0, help="pesan telemetry per detik")
+    ap.add_argument("--stations", type=int, default=1)
+    ap.add_argument("--replay", default=None)
+    ap.add_argument("--pub-qos", type=int, choices=[0, 1], default=1, help="QoS publisher telemetry")
+    ap.add_argument("--outage", default=None, help="AT:SEC, putus client app dari broker")
+    ap.add_argument("--clients", type=int, default=8, help="client API konkuren")
+    ap.add_argument("--sse", type=int, default=20, help="koneksi /events")
+    ap.add_argument("--mix", default=DEFAULT_MIX)
+    ap.add_argument("--duration", type=float, default=30.0)
+    ap.add_argument("--warmup", type=float, default=3.0)
+    ap.add_argument("--qc-rows", type=int, default=2000)
+    ap.add_argument("--qc-every", type=float, default=5.0, help="detik per baris QC baru")
+    ap.add_argument("--qc-pull", type=float, default=2.0, help="QC_PULL_INTERVAL server")
+    ap.add_argument("--send-interval", type=float, default=1.0, help="SEND_INTERVAL server")
+    ap.add_argument("--post-latency", type=float, default=0.0, help="latensi buatan Apps Script (detik)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--port", type=int, default=5088)
+    ap.add_argument("--workdir", default=None)
+    ap.add_argument("--keep-db", action="store_true", help="pakai history.db dari run sebelumnya")
+    ap.add_argument("--save", default=None)
+    ap.add_argument("--compare", default=None)
+    ap.add_argument("--serve", default=None)
+    args = ap.parse_args()
+
+    if args.serve:
+        serve(json.loads(args.serve))
+        return
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.compare:
+        with open(args.compare) as f:
+            print_compare(json.load(f), report)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
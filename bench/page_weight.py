@@ -0,0 +1,92 @@
+# ==========================================================
+# Byte yang dikirim server untuk satu page load dashboard (shell + aset
+# static yang direferensikan), dihitung dari header + body response:
+#   cold   : browser tanpa cache
+#   reload : kiosk reload; shell divalidasi ulang (If-None-Match), aset
+#            immutable diambil dari cache browser tanpa request
+# Pembanding "no-store" = perilaku lama: semua file dikirim utuh tanpa
+# kompresi di tiap load.
+#
+#   python bench/page_weight.py
+# ==========================================================
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+REF = re.compile(r"""["'(]\s*((?:\.?/)?static/[^"')?#\s]+)""")
+
+
+def wire_bytes(resp):
+    head = "HTTP/1.1 %s\r\n" % resp.status + "".join("%s: %s\r\n" % kv for kv in resp.headers.items()) + "\r\n"
+    return len(head.encode()) + len(resp.get_data())
+
+
+class Browser:
+    def __init__(self, client, encoding):
+        self.client = client
+        self.encoding = encoding
+        self.cache = {}  # url -> (etag, immutable)
+
+    def get(self, url):
+        headers = {"Accept-Encoding": self.encoding}
+        cached = self.cache.get(url)
+        if cached is not None:
+            if cached[1]:
+                return 0, 0  # immutable: tidak ada request
+            headers["If-None-Match"] = cached[0]
+        resp = self.client.get(url, headers=headers)
+        cc = resp.headers.get("Cache-Control", "")
+        if resp.headers.get("ETag") and "no-store" not in cc:
+            self.cache[url] = (resp.headers["ETag"], "immutable" in cc)
+        return 1, wire_bytes(resp)
+
+    def load(self):
+        requests, total = self.get("/")
+        html = self.client.get("/").get_data(as_text=True)
+        for ref in dict.fromkeys(REF.findall(html)):
+            r, b = self.get("/" + ref.lstrip("./"))
+            requests += r
+            total += b
+        return requests, total
+
+
+def legacy_bytes():
+    # no-store + tanpa kompresi: shell dan setiap file static utuh tiap load
+    with open(app.INDEX_HTML_PATH, "rb") as f:
+        total = len(f.read())
+    for path, _ in app._static_files():
+        total += os.path.getsize(path)
+    return total
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--encoding", default="gzip, deflate, br")
+    ap.add_argument("--reloads", type=int, default=100)
+    args = ap.parse_args()
+
+    client = app.app.test_client()
+    browser = Browser(client, args.encoding)
+    t0 = time.perf_counter()
+    cold_req, cold = browser.load()
+    t_cold = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for _ in range(args.reloads):
+        reload_req, reload = browser.load()
+    t_reload = (time.perf_counter() - t0) / args.reloads
+
+    legacy = legacy_bytes()
+    print("encoding=%r (brotli %s)" % (args.encoding, "ada" if app.brotli is not None else "tidak ada"))
+    print("%-10s %9s %12s %12s" % ("load", "requests", "bytes", "server_ms"))
+    print("%-10s %9s %12d %12s" % ("no-store", "-", legacy, "-"))
+    print("%-10s %9d %12d %12.2f" % ("cold", cold_req, cold, t_cold * 1000))
+    print("%-10s %9d %12d %12.2f" % ("reload", reload_req, reload, t_reload * 1000))
+
+
+if __name__ == "__main__":
+    main()
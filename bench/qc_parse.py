@@ -0,0 +1,115 @@
+# ==========================================================
+# Micro-benchmark parsing sheet QC: helper lama (strptime + normalisasi
+# string per sel, csv.DictReader) vs parser cepat di app.py.
+#
+#   python bench/qc_parse.py --rows 100000
+# ==========================================================
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+# ---- salinan helper lama (sebelum parser cepat) ----
+def legacy_to_float(v):
+    if v is None:
+        return None
+    s = str(v).strip()
+    if s == "" or s.lower() in ("nan", "none"):
+        return None
+    s = s.replace('"', "").strip().replace(",", ".")
+    try:
+        return float(s)
+    except:
+        return None
+
+
+def legacy_parse_dt(s):
+    if not s:
+        return None
+    s = str(s).strip().replace('"', "")
+    fmts = ["%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"]
+    for f in fmts:
+        try:
+            return datetime.strptime(s, f)
+        except:
+            pass
+    return None
+
+
+def legacy_parse(text):
+    reader = csv.DictReader(io.StringIO(text))
+    fieldnames = reader.fieldnames or []
+    dt_col = app._find_col(fieldnames, app.QC_COLUMNS["dt"])
+    cols = {p: app._find_col(fieldnames, app.QC_COLUMNS[p]) for p in app.QC_ORDER}
+    rows = []
+    for row in reader:
+        dt_obj = legacy_parse_dt(row.get(dt_col) if dt_col else None)
+        if not dt_obj:
+            continue
+        r = {"ts": int(dt_obj.timestamp()), "dt": dt_obj.strftime("%Y-%m-%d %H:%M")}
+        for p in app.QC_ORDER:
+            r[p] = legacy_to_float(row.get(cols[p])) if cols[p] else None
+        rows.append(r)
+    return rows
+
+
+def fast_parse(text):
+    reader = csv.reader(io.StringIO(text))
+    cols = app._qc_columns(next(reader))
+    return app._qc_parse_records(reader, cols)
+
+
+def synthetic_csv(n, seed=1):
+    rnd = random.Random(seed)
+    t = datetime(2021, 1, 1)
+    out = ["Timestamp,DateTime,Kekeruhan,Warna,pH,Sisa Chlor,Petugas"]
+    for i in range(n):
+        t += timedelta(minutes=rnd.choice([30, 60, 60, 120]))
+        dt = t.strftime("%Y-%m-%d %H:%M") if i % 50 else t.strftime("%Y-%m-%d %H:%M:%S")
+        kek = "%.2f" % rnd.uniform(0.1, 5) if rnd.random() > 0.1 else ""
+        war = str(rnd.choice([1, 2, 3, 5, 10]))
+        ph = ("%.1f" % rnd.uniform(6.5, 8.5)).replace(".", ",") if i % 7 == 0 else "%.1f" % rnd.uniform(6.5, 8.5)
+        chl = '"%.2f"' % rnd.uniform(0.2, 1.0) if i % 3 == 0 else ""
+        out.append("%s,%s,%s,%s,%s,%s,OP%d" % (t.isoformat(), dt, kek, war, ph, chl, i % 9))
+    return "\r\n".join(out)
+
+
+def bench(fn, text, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        app._to_float.cache_clear()
+        app._day_epoch_cache.clear()
+        t0 = time.perf_counter()
+        result = fn(text)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    text = synthetic_csv(args.rows)
+    t_old, rows_old = bench(legacy_parse, text, args.repeat)
+    t_new, rows_new = bench(fast_parse, text, args.repeat)
+
+    print("rows=%d bytes=%d" % (args.rows, len(text)))
+    print("%-8s %10.1f ms %10.0f rows/s" % ("legacy", t_old * 1000, len(rows_old) / t_old))
+    print("%-8s %10.1f ms %10.0f rows/s" % ("fast", t_new * 1000, len(rows_new) / t_new))
+    print("speedup  %.1fx  identical=%s" % (t_old / t_new, rows_old == rows_new))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# ==========================================================
+# Byte QC per refresh dashboard: CSV publish Google Sheets utuh (cara lama,
+# diparse di browser tiap 20 detik) vs /api/qc/snapshot:
+#   full  : load pertama (jendela 30 hari, kolom tetap)
+#   delta : since=<versi> setelah satu baris QC baru masuk
+#   304   : versi tidak berubah (revalidasi ETag)
+# Data QC sintetis: --days hari, --per-day baris per hari.
+#
+#   python bench/qc_snapshot.py --days 365 --per-day 12
+# ==========================================================
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+ENC = "gzip"
+
+
+def qc_rows(days, per_day, seed=1):
+    rnd = random.Random(seed)
+    now = int(time.time())
+    step = 86400 // per_day
+    rows = []
+    for ts in range(now - days * 86400, now, step):
+        rows.append({
+            "ts": ts,
+            "dt": time.strftime("%d/%m/%Y %H:%M:%S", time.localtime(ts)),
+            "kekeruhan": round(rnd.uniform(0.5, 3.0), 2),
+            "warna": round(rnd.uniform(1, 10), 1),
+            "ph": round(rnd.uniform(6.8, 7.6), 2),
+            "sisa_chlor": round(rnd.uniform(0.2, 1.0), 2) if rnd.random() < 0.5 else None,
+        })
+    return rows
+
+
+def csv_bytes(rows):
+    lines = ["DateTime,Kekeruhan,Warna,pH,Sisa Chlor"]
+    for r in rows:
+        vals = ["" if r[p] is None else str(r[p]).replace(".", ",") for p in app.QC_ORDER]
+        lines.append(r["dt"] + "," + ",".join('"%s"' % v if "," in v else v for v in vals))
+    raw = ("\r\n".join(lines) + "\r\n").encode()
+    return len(raw), len(gzip.compress(raw))
+
+
+def set_rows(rows):
+    with app.qc_lock:
+        app.qc_rows[:] = rows
+        app._qc_track_changes()
+
+
+def get(client, url, etag=None):
+    headers = {"Accept-Encoding": ENC}
+    if etag:
+        headers["If-None-Match"] = etag
+    resp = client.get(url, headers=headers)
+    return resp, len(resp.get_data())
+
+
+def body_json(resp):
+    data = resp.get_data()
+    if resp.headers.get("Content-Encoding") == "gzip":
+        data = gzip.decompress(data)
+    return json.loads(data)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--per-day", type=int, default=12)
+    args = ap.parse_args()
+
+    rows = qc_rows(args.days, args.per_day)
+    raw, gz = csv_bytes(rows)
+    client = app.app.test_client()
+    url = "/api/qc/snapshot?hours=%d&spark=%d" % (app.QC_SNAPSHOT_MAX_HOURS, app.QC_SNAPSHOT_SPARK)
+
+    set_rows(rows[:-1])
+    resp, full = get(client, url)
+    body = body_json(resp)
+    v1, etag, n_full = body["version"], resp.headers["ETag"], len(body["rows"])
+    resp, not_modified = get(client, url, etag)
+    assert resp.status_code == 304
+
+    set_rows(rows)
+    resp, delta = get(client, url + "&since=" + v1)
+    body = body_json(resp)
+    assert not body["full"] and len(body["rows"]) == 1
+
+    print("qc rows=%d (jendela %d jam: %d baris) encoding=%s" % (
+        len(rows), app.QC_SNAPSHOT_MAX_HOURS, n_full, ENC))
+    print("%-18s %10s" % ("response", "bytes"))
+    print("%-18s %10d" % ("csv (raw)", raw))
+    print("%-18s %10d" % ("csv (gzip)", gz))
+    print("%-18s %10d" % ("snapshot full", full))
+    print("%-18s %10d" % ("snapshot delta", delta))
+    print("%-18s %10d" % ("snapshot 304", not_modified))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# ==========================================================
+# Load test koneksi SSE: Flask threaded vs ASGI (uvicorn).
+#
+#   python bench/sse_load.py --mode flask --steps 0,100,500,1000
+#   python bench/sse_load.py --mode asgi  --steps 0,100,500,1000,2000
+#
+# Server dijalankan sebagai subprocess tanpa MQTT/QC asli; satu thread
+# feeder memanggil on_message tiap detik supaya hub SSE punya event.
+# Per langkah: jumlah koneksi /events terbuka, RSS server, dan latensi
+# p50/p99 /api/latest yang diukur di bawah beban koneksi tersebut.
+# ==========================================================
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def serve(mode, port, workdir):
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+    os.environ["DASHBOARD_BACKGROUND"] = "0"
+    import json
+    import threading
+    import app as core
+
+    core.WEB_APP_URL = "http://127.0.0.1:9/"
+    core.init_db()
+    threading.Thread(target=core.db_writer_worker, daemon=True).start()
+    threading.Thread(target=core.sse_worker, daemon=True).start()
+
+    class Msg:
+        pass
+
+    def feeder():
+        i = 0
+        while True:
+            m = Msg()
+            m.topic = core.TOPIC
+            m.payload = json.dumps({"PRESSURE_DST": i % 10, "TOTAL_FLOW_ITK": 500 + i}).encode()
+            core.on_message(None, None, m)
+            i += 1
+            time.sleep(1)
+
+    threading.Thread(target=feeder, daemon=True).start()
+
+    if mode == "flask":
+        import logging
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        make_server("127.0.0.1", port, core.app, threaded=True).serve_forever()
+    else:
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.app, host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+def rss_kb(pid):
+    with open("/proc/%d/status" % pid) as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def open_sse(port, conns):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /events HTTP/1.1\r\nHost: x\r\nAccept: text/event-stream\r\n\r\n")
+    await writer.drain()
+    await reader.readuntil(b"data:")  # snapshot awal sudah diterima
+    conns.append((reader, writer))
+
+    async def drain():
+        try:
+            while await reader.read(65536):
+                pass
+        except Exception:
+            pass
+    asyncio.ensure_future(drain())
+
+
+async def get_latency(port):
+    t0 = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /api/latest HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+    await writer.drain()
+    await reader.read()
+    writer.close()
+    return (time.perf_counter() - t0) * 1000.0
+
+
+async def run(args):
+    workdir = args.workdir or os.path.join("/tmp", "sse_bench_%s" % args.mode)
+    os.makedirs(workdir, exist_ok=True)
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", args.mode,
+                             "--port", str(args.port), "--workdir", workdir])
+    try:
+        for _ in range(100):
+            try:
+                await get_latency(args.port)
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+
+        conns = []
+        print("mode=%s" % args.mode)
+        print("%8s %10s %10s %10s" % ("conns", "rss_mb", "p50_ms", "p99_ms"))
+        for target in [int(x) for x in args.steps.split(",")]:
+            while len(conns) < target:
+                batch = min(100, target - len(conns))
+                await asyncio.gather(*[open_sse(args.port, conns) for _ in range(batch)])
+            await asyncio.sleep(1.5)
+            lat = []
+            for _ in range(args.requests):
+                lat.append(await get_latency(args.port))
+            lat.sort()
+            p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))]
+            print("%8d %10.1f %10.2f %10.2f" % (len(conns), rss_kb(proc.pid) / 1024.0,
+                                                statistics.median(lat), p99))
+        for _, w in conns:
+            w.close()
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=["flask", "asgi"], default="asgi")
+    ap.add_argument("--steps", default="0,100,500,1000")
+    ap.add_argument("--requests", type=int, default=100)
+    ap.add_argument("--port", type=int, default=5077)
+    ap.add_argument("--workdir", default=None)
+    ap.add_argument("--serve", choices=["flask", "asgi"], default=None)
+    args = ap.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.workdir)
+    else:
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
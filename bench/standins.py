@@ -0,0 +1,348 @@
+# ==========================================================
+# Stand-in lokal untuk layanan luar yang dipakai app.py, supaya benchmark
+# bisa jalan tanpa broker asli / Google Sheets / Apps Script:
+#
+#   MiniBroker  - subset MQTT 3.1.1 (CONNECT, SUBSCRIBE/UNSUBSCRIBE,
+#                 PUBLISH QoS 0/1, PINGREQ, DISCONNECT) di atas asyncio.
+#                 Sesi persisten (clean session = 0) menyimpan langganan dan
+#                 antrian pesan QoS 1 selama client offline; block() memutus
+#                 satu client id sementara untuk uji reconnect/backfill.
+#                 Tanpa retain maupun will.
+#   FakeSheets  - HTTP: GET /qc.csv (CSV QC publish-to-web yang bertambah
+#                 satu baris tiap qc_every detik, dengan ETag/304) dan
+#                 POST /exec (Apps Script, menghitung sampel yang diterima).
+#
+# Dipakai bench/loadtest.py; bisa juga dijalankan sendiri:
+#   python bench/standins.py --broker-port 1883 --http-port 8099
+# ==========================================================
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def topic_matches(flt, topic):
+    fp, tp = flt.split("/"), topic.split("/")
+    for i, f in enumerate(fp):
+        if f == "#":
+            return True
+        if i >= len(tp) or (f != "+" and f != tp[i]):
+            return False
+    return len(fp) == len(tp)
+
+
+class MiniBroker:
+    def __init__(self, host="127.0.0.1", port=0, session_queue_max=1000000):
+        self.host = host
+        self.port = port
+        self.sessions = {}  # client id -> {"subs", "queue", "writer", "persistent"}
+        self.blocked = {}  # client id -> ditolak sampai (epoch)
+        self.session_queue_max = session_queue_max
+        self.stats = {"connections": 0, "refused": 0, "received": 0, "delivered": 0, "queued": 0}
+        self.loop = None
+        self._pid = 0
+        self._anon = 0
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            server = self.loop.run_until_complete(asyncio.start_server(self._client, self.host, self.port))
+            self.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, name="mini-broker", daemon=True).start()
+        ready.wait()
+        return self
+
+    def block(self, client_id, seconds):
+        """Putus client_id dan tolak CONNECT-nya selama `seconds` (sesi tetap)."""
+        def do():
+            self.blocked[client_id] = time.time() + seconds
+            sess = self.sessions.get(client_id)
+            if sess and sess["writer"] is not None:
+                w, sess["writer"] = sess["writer"], None
+                self._requeue(sess)
+                w.close()
+        self.loop.call_soon_threadsafe(do)
+
+    @staticmethod
+    def packet(first, body):
+        out = bytearray([first])
+        n = len(body)
+        while True:
+            d, n = n % 128, n // 128
+            out.append(d | 0x80 if n else d)
+            if not n:
+                break
+        return bytes(out) + body
+
+    @staticmethod
+    async def read_packet(reader):
+        first = (await reader.readexactly(1))[0]
+        mult, length = 1, 0
+        while True:
+            d = (await reader.readexactly(1))[0]
+            length += (d & 0x7F) * mult
+            if not d & 0x80:
+                break
+            mult *= 128
+        body = await reader.readexactly(length) if length else b""
+        return first >> 4, first & 0x0F, body
+
+    def _connect(self, body, writer):
+        # variable header: nama protokol, level, flags, keepalive; lalu client id
+        off = 2 + struct.unpack_from("!H", body)[0] + 1
+        clean = bool(body[off] & 0x02)
+        off += 3
+        n = struct.unpack_from("!H", body, off)[0]
+        cid = body[off + 2:off + 2 + n].decode()
+        if not cid:
+            self._anon += 1
+            cid, clean = "anon-%d" % self._anon, True
+        if self.blocked.get(cid, 0) > time.time():
+            self.stats["refused"] += 1
+            writer.write(b"\x20\x02\x00\x03")  # server unavailable
+            return None
+        sess = self.sessions.get(cid)
+        present = sess is not None and not clean
+        if sess is not None and sess["writer"] is not None:
+            # client id sama: koneksi lama diambil alih
+            old, sess["writer"] = sess["writer"], None
+            self._requeue(sess)
+            old.close()
+        if not present:
+            sess = self.sessions[cid] = {"subs": [], "queue": deque(maxlen=self.session_queue_max),
+                                         "inflight": {}}
+        sess["persistent"] = not clean
+        sess["writer"] = writer
+        writer.write(b"\x20\x02" + bytes([1 if present else 0]) + b"\x00")
+        while sess["queue"]:
+            self._deliver(sess, *sess["queue"].popleft())
+        return cid
+
+    @staticmethod
+    def _requeue(sess):
+        # QoS 1 yang belum di-PUBACK dikirim ulang (DUP) setelah reconnect
+        if sess["persistent"]:
+            sess["queue"].extendleft(reversed(list(sess["inflight"].values())))
+        sess["inflight"].clear()
+
+    async def _client(self, reader, writer):
+        self.stats["connections"] += 1
+        cid = None
+        try:
+            while True:
+                ptype, flags, body = await self.read_packet(reader)
+                if ptype == 1:  # CONNECT
+                    cid = self._connect(body, writer)
+                    if cid is None:
+                        await writer.drain()
+                        break
+                elif ptype == 3:  # PUBLISH
+                    qos = (flags >> 1) & 3
+                    tlen = struct.unpack_from("!H", body)[0]
+                    topic = body[2:2 + tlen].decode()
+                    off = 2 + tlen
+                    if qos:
+                        writer.write(b"\x40\x02" + body[off:off + 2])  # PUBACK
+                        off += 2
+                    self._route(topic, body[off:], qos)
+                elif ptype == 8:  # SUBSCRIBE
+                    off, granted = 2, []
+                    subs = self.sessions[cid]["subs"]
+                    while off < len(body):
+                        n = struct.unpack_from("!H", body, off)[0]
+                        flt = body[off + 2:off + 2 + n].decode()
+                        qos = min(body[off + 2 + n], 1)
+                        off += 3 + n
+                        subs[:] = [s for s in subs if s[0] != flt] + [(flt, qos)]
+                        granted.append(qos)
+                    writer.write(self.packet(0x90, body[:2] + bytes(granted)))
+                elif ptype == 10:  # UNSUBSCRIBE
+                    off, gone = 2, set()
+                    while off < len(body):
+                        n = struct.unpack_from("!H", body, off)[0]
+                        gone.add(body[off + 2:off + 2 + n].decode())
+                        off += 2 + n
+                    subs = self.sessions[cid]["subs"]
+                    subs[:] = [s for s in subs if s[0] not in gone]
+                    writer.write(b"\xb0\x02" + body[:2])
+                elif ptype == 12:  # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif ptype == 14:  # DISCONNECT
+                    break
+                elif ptype == 4:  # PUBACK dari subscriber
+                    sess = self.sessions.get(cid)
+                    if sess is not None:
+                        sess["inflight"].pop(struct.unpack_from("!H", body)[0], None)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            sess = self.sessions.get(cid)
+            if sess is not None and sess["writer"] is writer:
+                sess["writer"] = None
+                self._requeue(sess)
+                if not sess["persistent"]:
+                    del self.sessions[cid]
+            writer.close()
+
+    def _deliver(self, sess, tb, payload, qos):
+        w = sess["writer"]
+        if qos:
+            self._pid = self._pid % 65535 + 1
+            sess["inflight"][self._pid] = (tb, payload, qos)
+            w.write(self.packet(0x32, struct.pack("!H", len(tb)) + tb + struct.pack("!H", self._pid) + payload))
+        else:
+            w.write(self.packet(0x30, struct.pack("!H", len(tb)) + tb + payload))
+        self.stats["delivered"] += 1
+
+    def _route(self, topic, payload, qos):
+        self.stats["received"] += 1
+        tb = topic.encode()
+        for sess in list(self.sessions.values()):
+            # langganan yang tumpang tindih (TOPIC dan TOPIC/#) dikirim sekali
+            q = max((fq for f, fq in sess["subs"] if topic_matches(f, topic)), default=None)
+            if q is None:
+                continue
+            q = min(q, qos)
+            if sess["writer"] is not None:
+                self._deliver(sess, tb, payload, q)
+            elif sess["persistent"] and q:
+                # client offline: QoS 1 ditahan sampai reconnect
+                sess["queue"].append((tb, payload, q))
+                self.stats["queued"] += 1
+
+
+QC_HEADER = "Timestamp,DateTime,Kekeruhan,Warna,pH,Sisa Chlor,Petugas"
+
+
+def _qc_line(rnd, t, i):
+    dt = t.strftime("%Y-%m-%d %H:%M")
+    # nilai dalam rentang normal (aturan alert default), sesekali desimal koma
+    kek = "%.2f" % rnd.uniform(0.1, 2.5) if rnd.random() > 0.1 else ""
+    war = str(rnd.choice([1, 2, 3, 5]))
+    ph = '"%s"' % ("%.1f" % rnd.uniform(6.8, 8.2)).replace(".", ",") if i % 7 == 0 else "%.1f" % rnd.uniform(6.8, 8.2)
+    chl = "%.2f" % rnd.uniform(0.3, 0.9) if i % 3 == 0 else ""
+    return "%s,%s,%s,%s,%s,%s,OP%d" % (t.isoformat(), dt, kek, war, ph, chl, i % 9)
+
+
+class FakeSheets:
+    def __init__(self, host="127.0.0.1", port=0, rows=2000, qc_every=5.0, post_latency=0.0, seed=1):
+        self.rnd = random.Random(seed)
+        self.qc_every = qc_every
+        self.post_latency = post_latency
+        self.lock = threading.Lock()
+        self.stats = {"qc_gets": 0, "qc_304": 0, "qc_rows": 0, "posts": 0, "posted_samples": 0,
+                      "post_errors": 0}
+        now = datetime.now().replace(second=0, microsecond=0)
+        # history per jam sampai sekarang, lalu baris baru per menit (dt beda tiap baris)
+        self.next_t = now - timedelta(hours=rows)
+        self.lines = [QC_HEADER]
+        for _ in range(rows):
+            self._append(timedelta(hours=1))
+        self.started = time.time()
+        self.appended = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def _append(self, step):
+        self.next_t += step
+        self.lines.append(_qc_line(self.rnd, self.next_t, len(self.lines)))
+        self.stats["qc_rows"] = len(self.lines) - 1
+
+    def csv(self):
+        with self.lock:
+            due = int((time.time() - self.started) / self.qc_every) if self.qc_every > 0 else 0
+            while self.appended < due:
+                self._append(timedelta(minutes=1))
+                self.appended += 1
+            body = ("\r\n".join(self.lines) + "\r\n").encode()
+        return body, '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-sheets", daemon=True).start()
+        return self
+
+    def url(self, path):
+        return "http://127.0.0.1:%d%s" % (self.port, path)
+
+    def _handler(self):
+        sheets = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body=b"", ctype="text/plain", headers=()):
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in headers:
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if not self.path.startswith("/qc.csv"):
+                    return self._reply(404, b"not found")
+                body, etag = sheets.csv()
+                sheets.stats["qc_gets"] += 1
+                if self.headers.get("If-None-Match") == etag:
+                    sheets.stats["qc_304"] += 1
+                    return self._reply(304, headers=[("ETag", etag)])
+                self._reply(200, body, "text/csv", [("ETag", etag)])
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if sheets.post_latency:
+                    time.sleep(sheets.post_latency)
+                try:
+                    obj = json.loads(body)
+                except ValueError:
+                    return self._reply(400, b"bad json")
+                if not isinstance(obj, dict):
+                    # seperti doPost asli: script error tetap dibalas 200 (halaman HTML)
+                    sheets.stats["post_errors"] += 1
+                    return self._reply(200, b"<title>Error</title>TypeError", "text/html")
+                sheets.stats["posts"] += 1
+                sheets.stats["posted_samples"] += 1
+                self._reply(200, b"ok")
+
+        return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--broker-port", type=int, default=1883)
+    ap.add_argument("--http-port", type=int, default=8099)
+    ap.add_argument("--qc-rows", type=int, default=2000)
+    ap.add_argument("--qc-every", type=float, default=5.0)
+    args = ap.parse_args()
+
+    broker = MiniBroker(port=args.broker_port).start()
+    sheets = FakeSheets(port=args.http_port, rows=args.qc_rows, qc_every=args.qc_every).start()
+    print("MQTT     127.0.0.1:%d" % broker.port)
+    print("QC CSV   %s" % sheets.url("/qc.csv"))
+    print("WEB_APP  %s" % sheets.url("/exec"))
+    while True:
+        time.sleep(10)
+        print("broker=%s sheets=%s" % (broker.stats, sheets.stats))
+
+
+if __name__ == "__main__":
+    main()
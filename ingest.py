@@ -0,0 +1,21 @@
+# ==========================================================
+# Proses ingest untuk deploy multi-proses:
+#   python ingest.py
+#   DASHBOARD_ROLE=web gunicorn app:app -w 4 --threads 8
+#   DASHBOARD_ROLE=web uvicorn asgi:app --workers 4
+#
+# Hanya proses ini yang subscribe MQTT, menarik CSV QC, reload jadwal dan
+# menulis SQLite. latest_data, qc_latest, index jadwal dan status dipublish
+# ke segmen mmap (STATE_SEGMENT_PATH) yang dibaca worker web.
+# ==========================================================
+import time
+
+import app as core
+
+if __name__ == "__main__":
+    core.DASHBOARD_ROLE = "ingest"
+    core.state_status["role"] = "ingest"
+    core.start_background()
+    print("[INGEST] publish state ke", core.STATE_SEGMENT_PATH)
+    while True:
+        time.sleep(3600)
@@ -1,38 +1,22 @@
 // ==========================================================
-// FULL STATIC DASHBOARD:
-// - Kuantitas: MQTT over WebSocket (mqtt.js)
-// - QC: Google Sheets publish CSV
-// - NO backend (/api/*, /events) lagi
+// DASHBOARD (data dari backend app.py / asgi.py):
+// - Kuantitas: nilai live dari /events (SSE), grafik dari /api/history
+// - QC: /api/qc/snapshot (ringkas, delta per versi), dipicu event qc
+// - Browser tidak lagi parse CSV Google Sheets / konek MQTT WS sendiri
 // ==========================================================
 
 // ===================== KONFIG =====================
-// MQTT
-const TOPIC = "data/sctkiotserver/groupsctkiotserver/123";
-
-// coba beberapa kandidat (edit kalau kamu sudah tahu yang bener)
-const WS_CANDIDATES = [
-  "ws://103.217.145.168:8083/mqtt",
-  "ws://103.217.145.168:8083",
-  "ws://103.217.145.168:9001",
-  "wss://103.217.145.168:8084/mqtt",
-];
-
-const NUMERIC_KEYS = [
-  "PRESSURE_DST",
-  "LVL_RES_WTP3",
-  "TOTAL_FLOW_ITK",
-  "TOTAL_FLOW_DST",
-  "FLOW_WTP3",
-  "FLOW_50_WTP1",
-  "FLOW_CIJERUK",
-  "FLOW_CARENANG",
-];
-
-// QC CSV (publish CSV)
-const QC_CSV_URL =
-  "https://docs.google.com/spreadsheets/d/e/2PACX-1vSMKrU7GU9pisN4ihKgSqyC1bDuT1ia6kp-vKWrdUhvaPyX95ZqOBOFy8iBCpQieizqTBJ3R4wNmRII/pub?gid=2046456175&single=true&output=csv";
-const QC_PULL_INTERVAL_MS = 20000;
+// endpoint backend (origin yang sama)
+const EVENTS_URL = "/events";
+const HISTORY_URL = "/api/history";
+const QC_SNAPSHOT_URL = "/api/qc/snapshot";
 
+// big chart kuantitas: titik maksimum per range (server yang downsample)
+const QTY_BIG_POINTS = 300;
+
+// QC: jendela baris yang disimpan di browser (= opsi qcRange terbesar)
+const QC_WINDOW_HOURS = 720;
+const QC_SPARK_POINTS = 5;
 // ======= konstanta dari backend (kalau tidak ada, fallback) =======
 const RES_MAX_M = Number(window.RES_MAX_M || 8.0);
 const RES_LITER_PER_M = Number(window.RES_LITER_PER_M || 375000.0);
@@ -52,12 +36,11 @@ function fmtTime(tsSec, withSec=false){
     : {hour:"2-digit", minute:"2-digit"}
   );
 }
-async function fetchTextNoCache(url){
-  const sep = url.includes("?") ? "&" : "?";
-  const u = url + sep + "_=" + Date.now();
-  const res = await fetch(u, { cache: "no-store" });
+async function fetchJSON(url){
+  // no-cache: browser tetap revalidasi pakai ETag, jawaban 304 tanpa body
+  const res = await fetch(url, { cache: "no-cache" });
   if (!res.ok) throw new Error(`HTTP ${res.status} ${url}`);
-  return await res.text();
+  return await res.json();
 }
 
 // ===================== THEME =====================
@@ -299,7 +282,7 @@ function yFromBaseline(ctx){
 }
 
 // ==========================================================
-// KUANTITAS (spark + big chart) -> source: MQTT
+// KUANTITAS (spark + big chart) -> source: /events + /api/history
 // ==========================================================
 const QTY_TILE_SHIFT_SEC = 10;
 const QTY_TILE_POINTS    = 18;
@@ -360,9 +343,9 @@ function initQtyTileCharts(){
   }
 }
 
-// Big chart kuantitas (pakai data rolling dari MQTT)
+// Big chart kuantitas (history server + titik live dari /events)
 let qtyChart = null;
-let qtyBigSeries = { labels: [], data: [], lastBucket: null };
+let qtyBigSeries = { key: null, hours: 1, interval: 10, ts: [], data: [], lastBucket: null };
 function qtyLabel(key){
   const map = {
     "TOTAL_FLOW_DST":"TOTAL FLOW DISTRIBUSI",
@@ -409,33 +392,98 @@ function ensureQtyBigChart(){
   });
 }
 
-function pushQtyBigPoint(tsSec, key, value){
+function qtyInterval(hours){
+  // bucket server per range: 1 jam -> 10 dtk, 12 jam -> 1 menit, 24 jam -> 5 menit
+  if (hours <= 1) return 10;
+  if (hours <= 12) return 60;
+  return 300;
+}
+
+function renderQtyBig(animate){
+  if (!qtyChart) return;
+  const s = qtyBigSeries;
+  qtyChart.data.labels = s.ts.map(t => fmtTime(t, s.interval < 60));
+  qtyChart.data.datasets[0].data = [...s.data];
+  qtyChart.data.datasets[0].label = `${qtyLabel(s.key)} - ${s.hours} JAM`;
+  qtyChart.options.animation = animate ? POP_ANIM : { duration: 180, easing: "linear" };
+  qtyChart.update();
+}
+
+let qtyBigReq = 0;
+
+async function loadQtyBig(animate=true){
   ensureQtyBigChart();
   if (!qtyChart) return;
 
-  // bucket per 10 detik supaya smooth tapi gak kebanyakan
-  const bucket = Math.floor(tsSec / 10) * 10;
-  const label = fmtTime(bucket, true);
+  const key = document.getElementById("qtyParam")?.value || "TOTAL_FLOW_DST";
+  const hours = Number(document.getElementById("qtyRange")?.value || 1);
+  const interval = qtyInterval(hours);
+  const req = ++qtyBigReq;
+
+  try{
+    const col = await fetchJSON(
+      `${HISTORY_URL}/${encodeURIComponent(key)}?hours=${hours}&interval=${interval}&format=columns&max_points=${QTY_BIG_POINTS}`
+    );
+    if (req !== qtyBigReq) return; // dropdown sudah diganti lagi
+    qtyBigSeries = {
+      key, hours, interval,
+      ts: [...col.ts],
+      data: [...col.value],
+      lastBucket: col.ts.length ? col.ts[col.ts.length - 1] : null,
+    };
+    renderQtyBig(animate);
+  }catch(e){
+    console.log("qty history error", e);
+  }
+}
+
+function pushQtyBigPoint(tsSec, data){
+  const s = qtyBigSeries;
+  if (!qtyChart || !s.key) return; // history belum termuat
+  const v = Number(data[s.key]);
+  if (!isFinite(v)) return;
+
+  const bucket = Math.floor(tsSec / s.interval) * s.interval;
+  if (s.lastBucket != null && bucket < s.lastBucket) return;
 
-  const isNewBucket = (qtyBigSeries.lastBucket !== bucket);
+  const isNewBucket = (s.lastBucket !== bucket);
   if (isNewBucket){
-    qtyBigSeries.labels.push(label);
-    qtyBigSeries.data.push(value);
-    qtyBigSeries.lastBucket = bucket;
-    // keep max ~ 300 points
-    while (qtyBigSeries.labels.length > 300){
-      qtyBigSeries.labels.shift();
-      qtyBigSeries.data.shift();
+    s.ts.push(bucket);
+    s.data.push(v);
+    s.lastBucket = bucket;
+    // buang titik di luar range
+    const start = bucket - s.hours * 3600;
+    while (s.ts.length && s.ts[0] < start){
+      s.ts.shift();
+      s.data.shift();
     }
   } else {
-    if (qtyBigSeries.data.length) qtyBigSeries.data[qtyBigSeries.data.length - 1] = value;
+    s.data[s.data.length - 1] = v;
   }
+  renderQtyBig(isNewBucket);
+}
 
-  const selKey = document.getElementById("qtyParam")?.value || key;
-  qtyChart.data.labels = [...qtyBigSeries.labels];
-  qtyChart.data.datasets[0].data = [...qtyBigSeries.data];
-  qtyChart.data.datasets[0].label = `${qtyLabel(selKey)} (MQTT)`;
-  qtyChart.update();
+async function loadQtyTiles(){
+  // isi awal spark tiles: satu request untuk semua key
+  if (!qtyTileKeys.length) return;
+  const hours = (QTY_TILE_SHIFT_SEC * QTY_TILE_POINTS) / 3600;
+  try{
+    const res = await fetchJSON(
+      `${HISTORY_URL}?keys=${qtyTileKeys.map(encodeURIComponent).join(",")}&hours=${hours}&interval=${QTY_TILE_SHIFT_SEC}&format=columns`
+    );
+    for (const key of qtyTileKeys){
+      const col = res.series?.[key];
+      if (!col || !col.ts.length) continue;
+      const s = ensureQtySeries(key);
+      const n = Math.min(col.ts.length, QTY_TILE_POINTS);
+      s.labels = col.ts.slice(-n).map(t => fmtTime(t, true));
+      s.data = col.value.slice(-n);
+      s.lastBucket = col.ts[col.ts.length - 1];
+      renderQtyTile(key);
+    }
+  }catch(e){
+    console.log("qty tiles history error", e);
+  }
 }
 
 // =========================
@@ -533,12 +581,14 @@ function applySelisihColor(v){
   else if (n < 0) el.classList.add("valNeg");
 }
 
-// ===================== APPLY QTY FROM MQTT =====================
+// ===================== APPLY QTY (/events) =====================
 let lastQtyTsApplied = 0;
 
-function applyQtyFromMQTT(data){
-  const ts = Math.floor(Date.now()/1000);
-  const isNew = (ts && ts > lastQtyTsApplied);
+function applyQty(payload){
+  const data = payload?.data;
+  if (!data) return;
+  const ts = Number(payload.ts) || Math.floor(Date.now()/1000);
+  const isNew = (ts > lastQtyTsApplied);
 
   // update lastUpdate label
   const lastUpdate = document.getElementById("lastUpdate");
@@ -546,6 +596,7 @@ function applyQtyFromMQTT(data){
 
   // render angka
   for (const [k,v] of Object.entries(data)){
+    if (v == null) continue;
     const el = document.getElementById("val_" + k);
     if (el) el.textContent = fmt(v, 2);
   }
@@ -556,7 +607,7 @@ function applyQtyFromMQTT(data){
   updateEstimationUI(data.LVL_RES_WTP3, data.SELISIH_FLOW);
 
   // spark tiles
-  if (ts){
+  if (isNew){
     const bucket = Math.floor(ts / QTY_TILE_SHIFT_SEC) * QTY_TILE_SHIFT_SEC;
     const label = fmtTime(bucket, true);
 
@@ -589,17 +640,14 @@ function applyQtyFromMQTT(data){
       }
     }
 
-    // big chart current selected param
-    const selKey = document.getElementById("qtyParam")?.value || "TOTAL_FLOW_DST";
-    const selVal = Number(data[selKey]);
-    if (isFinite(selVal)) pushQtyBigPoint(ts, selKey, selVal);
+    // big chart param yang dipilih
+    pushQtyBigPoint(ts, data);
+    lastQtyTsApplied = ts;
   }
-
-  lastQtyTsApplied = ts;
 }
 
 // ==========================================================
-// QC: ambil dari CSV Google Sheets (tanpa backend)
+// QC: snapshot ringkas dari backend (/api/qc/snapshot)
 // ==========================================================
 const qcTileKeys = ["kekeruhan","warna","ph","sisa_chlor"];
 const qcTileCharts = {};
@@ -658,155 +706,97 @@ function qcLabel(k){
   return map[k] || k;
 }
 
-function parseCSV(text){
-  // parser CSV sederhana (cukup buat google publish csv)
-  const lines = text.split(/\r?\n/).filter(x => x.trim() !== "");
-  if (!lines.length) return { headers: [], rows: [] };
-
-  const splitLine = (line) => {
-    const out = [];
-    let cur = "";
-    let inQ = false;
-    for (let i=0;i<line.length;i++){
-      const ch = line[i];
-      if (ch === '"'){ inQ = !inQ; continue; }
-      if (ch === "," && !inQ){
-        out.push(cur);
-        cur = "";
-      } else cur += ch;
-    }
-    out.push(cur);
-    return out.map(s => s.trim());
-  };
-
-  const headers = splitLine(lines[0]);
-  const rows = [];
-  for (let i=1;i<lines.length;i++){
-    const cols = splitLine(lines[i]);
-    const obj = {};
-    headers.forEach((h, idx) => obj[h] = cols[idx] ?? "");
-    rows.push(obj);
-  }
-  return { headers, rows };
-}
-
-function toFloat(v){
-  if (v == null) return null;
-  const s = String(v).trim().replace(",", ".");
-  if (!s) return null;
-  const n = Number(s);
-  return isFinite(n) ? n : null;
-}
-
-function pickHeader(headers, candidates){
-  const norm = (s) => String(s||"").toLowerCase().replace(/\s+/g,"").replace("\ufeff","");
-  const hmap = {};
-  headers.forEach(h => hmap[norm(h)] = h);
-  for (const c of candidates){
-    const k = norm(c);
-    if (hmap[k]) return hmap[k];
-  }
-  // contains match
-  for (const c of candidates){
-    const k = norm(c);
-    for (const hk of Object.keys(hmap)){
-      if (hk.includes(k)) return hmap[hk];
-    }
-  }
-  return null;
-}
-
-function parseDT(s){
-  if (!s) return null;
-  const t = String(s).trim();
-  // coba Date.parse
-  const d = new Date(t);
-  if (!isNaN(d.getTime())) return d;
-  return null;
-}
-
 let qcRows = [];
+let qcVersion = "";
 let qcLastUpdate = "-";
 let qcLastChlorUpdate = "-";
-
-async function pullQCOnce(){
-  try{
-    const text = await fetchTextNoCache(QC_CSV_URL);
-    const { headers, rows } = parseCSV(text);
-    if (!rows.length) return;
-
-    const dtCol = pickHeader(headers, ["DateTime","Datetime","DATE TIME","Date Time","Tanggal","Waktu"]);
-    const kekCol = pickHeader(headers, ["Kekeruhan"]);
-    const warCol = pickHeader(headers, ["Warna"]);
-    const phCol  = pickHeader(headers, ["pH","PH"]);
-    const chlCol = pickHeader(headers, ["Sisa Chlor","SisaChlor","Chlor"]);
-
-    const parsed = [];
-    for (const r of rows){
-      const dtObj = parseDT(dtCol ? r[dtCol] : null);
-      if (!dtObj) continue;
-      const ts = Math.floor(dtObj.getTime()/1000);
-      parsed.push({
-        ts,
-        dt: dtObj.toLocaleString(),
-        kekeruhan: toFloat(kekCol ? r[kekCol] : null),
-        warna: toFloat(warCol ? r[warCol] : null),
-        ph: toFloat(phCol ? r[phCol] : null),
-        sisa_chlor: toFloat(chlCol ? r[chlCol] : null),
-      });
-    }
-    parsed.sort((a,b)=>a.ts-b.ts);
-    qcRows = parsed;
-
-    // update latest per param
-    const latest = {};
-    for (const k of qcTileKeys){
-      latest[k] = { ts: null, dt: "-", value: null };
-      for (let i=qcRows.length-1;i>=0;i--){
-        if (qcRows[i][k] != null){
-          latest[k] = { ts: qcRows[i].ts, dt: qcRows[i].dt, value: qcRows[i][k] };
-          break;
-        }
-      }
+let qcRowBase = 0; // posisi (di qc_rows server) baris pertama qcRows
+let qcPulling = false;
+let qcPullAgain = false;
+
+function applyQCSnapshot(snap){
+  // baris dikenali dari posisinya (from), bukan ts: DateTime boleh kembar.
+  // full: ganti semua baris; delta: potong di posisi from lalu sambung
+  if (!snap.full && snap.version === qcVersion) return;
+  const rows = (snap.rows || []).map(t => {
+    const r = {};
+    snap.cols.forEach((c, i) => r[c] = t[i]);
+    return r;
+  });
+  if (snap.full){
+    qcRows = rows;
+    qcRowBase = snap.from;
+  }else{
+    if (snap.from > qcRowBase + qcRows.length){
+      // ada baris yang tidak pernah diterima: ambil full
+      qcVersion = "";
+      qcPullAgain = true;
+      return;
     }
-
-    // last update label
-    qcLastUpdate = latest.kekeruhan.ts || latest.warna.ts || latest.ph.ts
-      ? new Date(Math.max(latest.kekeruhan.ts||0, latest.warna.ts||0, latest.ph.ts||0)*1000).toLocaleString()
-      : "-";
-    qcLastChlorUpdate = latest.sisa_chlor.ts ? new Date(latest.sisa_chlor.ts*1000).toLocaleString() : "-";
-
-    // apply to UI
-    const hint = document.getElementById("qcHint");
-    if (hint){
-      hint.textContent = `QC LAST UPDATE: ${qcLastUpdate} | CHL: ${qcLastChlorUpdate}`;
+    if (snap.from < qcRowBase){
+      qcRows = [];
+      qcRowBase = snap.from;
     }
+    qcRows.length = snap.from - qcRowBase;
+    qcRows.push(...rows);
+  }
+  const start = Math.floor(Date.now()/1000) - QC_WINDOW_HOURS*3600;
+  let old = 0;
+  while (old < qcRows.length && qcRows[old].ts < start) old++;
+  if (old){
+    qcRows = qcRows.slice(old);
+    qcRowBase += old;
+  }
+  qcVersion = snap.version;
+
+  // last update label (format tanggal dari server)
+  qcLastUpdate = snap.qc_last_update || "-";
+  qcLastChlorUpdate = snap.chlor_last_update || "-";
+  const hint = document.getElementById("qcHint");
+  if (hint){
+    hint.textContent = `QC LAST UPDATE: ${qcLastUpdate} | CHL: ${qcLastChlorUpdate}`;
+  }
 
-    for (const k of qcTileKeys){
-      const vEl = document.getElementById("qc_val_" + k);
-      const dEl = document.getElementById("qc_dt_" + k);
-      const obj = latest[k];
-      if (vEl) vEl.textContent = (obj.value == null) ? "-" : fmt(obj.value, 2);
-      if (dEl) dEl.textContent = obj.dt || "-";
-    }
+  for (const k of qcTileKeys){
+    const vEl = document.getElementById("qc_val_" + k);
+    const dEl = document.getElementById("qc_dt_" + k);
+    const obj = snap.latest?.[k] || {};
+    if (vEl) vEl.textContent = (obj.value == null) ? "-" : fmt(obj.value, 2);
+    if (dEl) dEl.textContent = obj.dt || "-";
+  }
 
-    // mini sparks (last 5 points)
-    for (const k of qcTileKeys){
-      const pts = qcRows.filter(r => r[k] != null).slice(-5);
-      const s = ensureQCTileSeries(k);
-      s.labels = pts.map(p => fmtTime(p.ts,false));
-      s.data = pts.map(p => p[k]);
-      renderQCTile(k);
-    }
+  // mini sparks (titik terakhir per param, sudah dipilih server)
+  for (const k of qcTileKeys){
+    const pts = snap.spark?.[k] || [];
+    const s = ensureQCTileSeries(k);
+    s.labels = pts.map(p => fmtTime(p[0],false));
+    s.data = pts.map(p => p[1]);
+    renderQCTile(k);
+  }
 
-    // big QC chart
-    loadQCBig(true);
+  // big QC chart
+  loadQCBig(true);
+}
 
+async function pullQCSnapshot(){
+  if (qcPulling){ qcPullAgain = true; return; }
+  qcPulling = true;
+  try{
+    const since = qcVersion ? `&since=${encodeURIComponent(qcVersion)}` : "";
+    applyQCSnapshot(await fetchJSON(
+      `${QC_SNAPSHOT_URL}?hours=${QC_WINDOW_HOURS}&spark=${QC_SPARK_POINTS}${since}`
+    ));
   }catch(e){
-    console.log("QC pull error", e);
+    console.log("QC snapshot error", e);
+  }finally{
+    qcPulling = false;
+  }
+  // versi baru datang saat fetch masih jalan
+  if (qcPullAgain){
+    qcPullAgain = false;
+    pullQCSnapshot();
   }
 }
-
 function ensureQCBigChart(){
   const canvas = document.getElementById("qcBig");
   if (!canvas || !window.Chart) return;
@@ -854,115 +844,39 @@ function loadQCBig(animate=true){
   qcBigChart.update();
 }
 
-// ===================== MQTT CONNECT =====================
-let mqttClient = null;
-let wsTryIndex = 0;
-
-function parsePayload(raw){
-  // normalisasi mirip python kamu
-  if (raw && typeof raw === "object"){
-    if (raw.data && typeof raw.data === "object") raw = raw.data;
-    else if (raw.payload && typeof raw.payload === "object") raw = raw.payload;
-    else if (raw.payload && typeof raw.payload === "string"){
-      try{
-        const j2 = JSON.parse(raw.payload);
-        if (j2 && typeof j2 === "object") raw = j2;
-      }catch{}
-    }
-  }
-  if (!raw || typeof raw !== "object") return null;
-
-  const up = {};
-  for (const [k,v] of Object.entries(raw)){
-    up[String(k).toUpperCase()] = v;
-  }
-  return up;
-}
-
-function connectMQTTNext(){
-  if (wsTryIndex >= WS_CANDIDATES.length){
-    console.log("MQTT WS: semua kandidat gagal. Cek port/path WS broker.");
-    const lastUpdate = document.getElementById("lastUpdate");
-    if (lastUpdate) lastUpdate.textContent = "LAST UPDATE: MQTT WS TIDAK CONNECT (cek port)";
-    return;
-  }
-
-  const url = WS_CANDIDATES[wsTryIndex++];
-  console.log("MQTT WS try:", url);
-
-  const lastUpdate = document.getElementById("lastUpdate");
-  if (lastUpdate) lastUpdate.textContent = "CONNECTING WS: " + url;
-
-  let connected = false;
-
-  try{
-    mqttClient = mqtt.connect(url, {
-      clientId: "dash_" + Math.random().toString(16).slice(2),
-      keepalive: 60,
-      reconnectPeriod: 0, // biar kita pindah kandidat
-      connectTimeout: 7000,
-      clean: true,
-    });
-  }catch(e){
-    console.log("mqtt.connect error", e);
-    connectMQTTNext();
-    return;
-  }
+// ===================== EVENTS (SSE) =====================
+let eventSource = null;
+let eventsLost = false;
 
-  mqttClient.on("connect", () => {
-    connected = true;
-    console.log("MQTT WS connected:", url);
-    if (lastUpdate) lastUpdate.textContent = "CONNECTED: " + url;
+function connectEvents(){
+  // EventSource reconnect sendiri; pesan pertama tiap koneksi = snapshot qty+qc
+  eventSource = new EventSource(EVENTS_URL);
 
-    mqttClient.subscribe(TOPIC, { qos: 0 }, (err) => {
-      if (err) console.log("subscribe err", err);
-      else console.log("subscribed", TOPIC);
-    });
-  });
+  eventSource.onopen = () => {
+    if (!eventsLost) return;
+    eventsLost = false;
+    // isi celah grafik selama putus
+    loadQtyTiles();
+    loadQtyBig(false);
+  };
 
-  mqttClient.on("message", (topic, payload) => {
+  eventSource.onmessage = (ev) => {
+    let msg;
     try{
-      const txt = payload.toString();
-      let raw = JSON.parse(txt);
-      const up = parsePayload(raw);
-      if (!up) return;
-
-      // ambil numeric keys
-      const data = {};
-      let matched = 0;
-      for (const k of NUMERIC_KEYS){
-        if (k in up){
-          let v = up[k];
-          if (typeof v === "string") v = v.trim().replace(",", ".");
-          const n = Number(v);
-          if (isFinite(n)){
-            data[k] = n;
-            matched++;
-          }
-        }
-      }
-      if (matched === 0) return;
-
-      // derived
-      data.SELISIH_FLOW = Number(data.TOTAL_FLOW_ITK||0) - Number(data.TOTAL_FLOW_DST||0);
-
-      applyQtyFromMQTT(data);
-
+      msg = JSON.parse(ev.data);
     }catch(e){
-      console.log("bad mqtt payload", e);
+      console.log("bad event", e);
+      return;
     }
-  });
-
-  mqttClient.on("error", (err) => {
-    console.log("MQTT error", url, err?.message || err);
-    try { mqttClient.end(true); } catch {}
-    if (!connected) connectMQTTNext();
-  });
+    if (msg.qty) applyQty(msg.qty);
+    if (msg.qc && msg.qc.version !== qcVersion) pullQCSnapshot();
+  };
 
-  mqttClient.on("close", () => {
-    console.log("MQTT close", url);
-    if (!connected) connectMQTTNext();
-  });
+  eventSource.onerror = () => {
+    eventsLost = true;
+    const lastUpdate = document.getElementById("lastUpdate");
+    if (lastUpdate) lastUpdate.textContent = "LAST UPDATE: SERVER TIDAK TERHUBUNG (reconnect...)";
+  };
 }
 
 // ===================== REDRAW =====================
@@ -1011,19 +925,16 @@ function redrawAllCharts(){
     ensureQCBigChart();
 
     // events dropdown update
-    document.getElementById("qtyParam")?.addEventListener("change", () => {
-      // reset big series biar label nyambung
-      qtyBigSeries = { labels: [], data: [], lastBucket: null };
-    });
+    document.getElementById("qtyParam")?.addEventListener("change", () => loadQtyBig(true));
+    document.getElementById("qtyRange")?.addEventListener("change", () => loadQtyBig(true));
     document.getElementById("qcParam")?.addEventListener("change", () => loadQCBig(true));
     document.getElementById("qcRange")?.addEventListener("change", () => loadQCBig(true));
 
-    // start QC polling
-    await pullQCOnce();
-    setInterval(pullQCOnce, QC_PULL_INTERVAL_MS);
+    // isi awal dari server (history + snapshot QC)
+    await Promise.all([loadQtyTiles(), loadQtyBig(true), pullQCSnapshot()]);
 
-    // start MQTT
-    connectMQTTNext();
+    // update live
+    connectEvents();
 
   }catch(e){
     console.log("INIT FATAL", e);